@@ -0,0 +1,107 @@
+"""Analityka floty: przebiegi, czasy, przystanki i wykorzystanie pojazdów w okresach.
+
+Historia tras jest agregowana przez bazę, a nie w Pythonie: wyzwalacze na
+tabeli trasy dopisują do podsumowanie_tras (dzień x pojazd) sumy z każdej
+instrukcji INSERT/DELETE, więc podsumowanie jest zawsze aktualne i ma tyle
+wierszy, ile dni pracy pojazdów, niezależnie od liczby tras. Zapytanie pulpitu
+grupuje te wiersze do tygodni/miesięcy w SQL, a wskaźniki pochodne liczy pandas
+na całych kolumnach.
+
+Istniejąca baza: migracje/023_podsumowanie_tras.sql (tabela, wyzwalacze, wypełnienie).
+Nowa baza: db.create_all() tworzy tabelę i wyzwalacze (models.WYZWALACZE_PODSUMOWANIA).
+"""
+from datetime import date, timedelta
+
+import pandas as pd
+from sqlalchemy import Date, func, select
+
+from models import db, Pojazd, PodsumowanieTras
+
+OKRESY = {'dzien': ('day', 'D'), 'tydzien': ('week', 'W'), 'miesiac': ('month', 'M')}  # date_trunc, pandas
+DOMYSLNY_ZAKRES_DNI = 12 * 7
+
+
+def zakres_dat(od, do):
+    """Parsuje daty YYYY-MM-DD z zapytania; domyślnie ostatnie 12 tygodni. Rzuca ValueError."""
+    do = date.fromisoformat(do) if do else date.today()
+    od = date.fromisoformat(od) if od else do - timedelta(days=DOMYSLNY_ZAKRES_DNI - 1)
+    if od > do:
+        raise ValueError('Data początkowa jest późniejsza niż końcowa.')
+    return od, do
+
+
+def _podziel(licznik, mianownik):
+    return (licznik / mianownik.where(mianownik > 0)).fillna(0.0)
+
+
+def statystyki_floty(id_uzytkownika, okres, od, do):
+    """Wskaźniki floty użytkownika per okres i per pojazd w zakresie dat [od, do].
+
+    Wykorzystanie to dni z co najmniej jedną trasą podzielone przez dni w okresie
+    (dla floty: razy liczbę pojazdów), współczynnik załadunku to ładunek tras
+    podzielony przez pojemność pojazdów zapisaną na tych trasach. Flota to obecne pojazdy
+    użytkownika.
+    """
+    trunc = OKRESY[okres][0]
+    # date_trunc na dacie daje timestamptz; z powrotem na date, żeby pandas dostał daty bez strefy
+    kolumna_okresu = func.date_trunc(trunc, PodsumowanieTras.dzien).cast(Date).label('okres')
+    wiersze = db.session.execute(
+        select(kolumna_okresu, PodsumowanieTras.id_pojazdu,
+               func.count().label('dni_aktywne'),
+               func.sum(PodsumowanieTras.liczba_tras).label('trasy'),
+               func.sum(PodsumowanieTras.liczba_przystankow).label('przystanki'),
+               func.sum(PodsumowanieTras.dystans_km).label('dystans_km'),
+               func.sum(PodsumowanieTras.czas_min).label('czas_min'),
+               func.sum(PodsumowanieTras.ladunek).label('ladunek'),
+               func.sum(PodsumowanieTras.pojemnosc).label('pojemnosc'))
+        .where(PodsumowanieTras.id_uzytkownika == id_uzytkownika,
+               PodsumowanieTras.dzien.between(od, do))
+        .group_by(kolumna_okresu, PodsumowanieTras.id_pojazdu)
+    ).all()
+    dane = pd.DataFrame(wiersze, columns=['okres', 'id_pojazdu', 'dni_aktywne', 'trasy', 'przystanki',
+                                          'dystans_km', 'czas_min', 'ladunek', 'pojemnosc'])
+    flota = pd.DataFrame(db.session.execute(
+        select(Pojazd.id_pojazdu, Pojazd.numer_rejestracyjny, Pojazd.pojemnosc.label('pojemnosc_pojazdu'))
+        .where(Pojazd.id_uzytkownika == id_uzytkownika)
+    ).all(), columns=['id_pojazdu', 'numer_rejestracyjny', 'pojemnosc_pojazdu'])
+    return wskazniki_floty(dane, flota, okres, od, do)
+
+
+def wskazniki_floty(dane, flota, okres, od, do):
+    """Część pandas statystyki_floty: dane to sumy per (okres, id_pojazdu), flota to pojazdy użytkownika."""
+    czestotliwosc = OKRESY[okres][1]
+    sumy = ['dni_aktywne', 'trasy', 'przystanki', 'dystans_km', 'czas_min', 'ladunek', 'pojemnosc']
+    dane = dane.astype({kolumna: float for kolumna in sumy})  # pusty wynik ma kolumny typu object
+
+    # okresy: dni w okresie przycięte do zakresu zapytania
+    okresy = dane.groupby('okres', sort=True)[sumy].sum()
+    okresy['pojazdy_aktywne'] = dane.groupby('okres')['id_pojazdu'].nunique()
+    poczatek = pd.Series(pd.to_datetime(okresy.index), index=okresy.index)
+    if poczatek.dt.tz is not None:
+        poczatek = poczatek.dt.tz_localize(None)
+    koniec = poczatek.dt.to_period(czestotliwosc).dt.end_time.dt.normalize()
+    dni = (koniec.clip(upper=pd.Timestamp(do)) - poczatek.clip(lower=pd.Timestamp(od))).dt.days + 1
+    okresy['wykorzystanie_floty'] = _podziel(okresy['dni_aktywne'], dni * len(flota))
+    okresy['wsp_zaladunku'] = _podziel(okresy['ladunek'], okresy['pojemnosc'])
+    okresy['przystanki_na_trase'] = _podziel(okresy['przystanki'], okresy['trasy'])
+    okresy['km_na_pojazd'] = _podziel(okresy['dystans_km'], okresy['pojazdy_aktywne'])
+    okresy = okresy.reset_index()
+    okresy['okres'] = poczatek.dt.strftime('%Y-%m-%d').to_numpy()
+
+    # pojazdy: cały zakres, także pojazdy bez tras
+    pojazdy = flota.merge(dane.groupby('id_pojazdu')[sumy].sum().reset_index(), on='id_pojazdu', how='left')
+    pojazdy[sumy] = pojazdy[sumy].fillna(0)
+    pojazdy['wykorzystanie'] = pojazdy['dni_aktywne'] / ((do - od).days + 1)
+    pojazdy['wsp_zaladunku'] = _podziel(pojazdy['ladunek'], pojazdy['pojemnosc'])
+    pojazdy['przystanki_na_trase'] = _podziel(pojazdy['przystanki'], pojazdy['trasy'])
+    pojazdy['km_na_trase'] = _podziel(pojazdy['dystans_km'], pojazdy['trasy'])
+    pojazdy = pojazdy.drop(columns='pojemnosc').sort_values('dystans_km', ascending=False)
+
+    return {
+        'od': od.isoformat(),
+        'do': do.isoformat(),
+        'okres': okres,
+        'liczba_pojazdow': len(flota),
+        'okresy': okresy.round(3).to_dict('records'),
+        'pojazdy': pojazdy.round(3).to_dict('records'),
+    }
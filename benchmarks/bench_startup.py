@@ -0,0 +1,67 @@
+"""Zimny start workera WWW: czas create_app() i RSS procesu.
+
+Każdy pomiar to nowy interpreter (jak świeży worker gunicorna), który importuje
+app, buduje aplikację i obsługuje jedno żądanie strony logowania (bez bazy).
+Wariant --solver dodatkowo importuje solver (OR-Tools), czyli koszt pierwszej
+optymalizacji w danym procesie. Wynik: jedna linia JSON na wariant.
+
+    python benchmarks/bench_startup.py --powtorzenia 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+KATALOG_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CIEZKIE_MODULY = ('ortools', 'pandas', 'shapely', 'requests', 'solver', 'importer')
+
+SKRYPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+aplikacja = app.create_app()
+czas_startu = time.perf_counter() - start
+odpowiedz = aplikacja.test_client().get('/')
+czas_zadania = time.perf_counter() - start - czas_startu
+if {solver}:
+    import solver
+print(json.dumps({{
+    'czas_startu_s': czas_startu,
+    'czas_pierwszego_zadania_s': czas_zadania,
+    'status': odpowiedz.status_code,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'moduly': [m for m in {moduly!r} if m in sys.modules],
+}}))
+"""
+
+
+def pomiar(solver):
+    wyjscie = subprocess.check_output([sys.executable, '-c', SKRYPT.format(solver=solver, moduly=CIEZKIE_MODULY)],
+                                      cwd=KATALOG_REPO, text=True)
+    return json.loads(wyjscie.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--powtorzenia', type=int, default=5)
+    parser.add_argument('--solver', action='store_true', help='mierzy też proces po imporcie solvera')
+    args = parser.parse_args()
+
+    for solver in ([False, True] if args.solver else [False]):
+        wyniki = [pomiar(solver) for _ in range(args.powtorzenia)]
+        print(json.dumps({
+            'wariant': 'po_imporcie_solvera' if solver else 'worker_www',
+            'powtorzenia': args.powtorzenia,
+            'czas_startu_s_mediana': round(statistics.median(w['czas_startu_s'] for w in wyniki), 3),
+            'czas_pierwszego_zadania_s_mediana': round(
+                statistics.median(w['czas_pierwszego_zadania_s'] for w in wyniki), 3),
+            'rss_mb_mediana': round(statistics.median(w['rss_mb'] for w in wyniki), 1),
+            'moduly': wyniki[-1]['moduly'],
+        }, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Porównanie callbacków Pythona z natywną rejestracją macierzy w OR-Tools.
+
+Obie wersje dostają tę samą instancję, profil (GLS) i limit czasu, bez
+zatrzymania na plateau; mierzona jest liczba rozwiązań i gałęzi na sekundę.
+
+    python benchmarks/bench_transit.py --punkty 100 200 --limit 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from ortools.constraint_solver import pywrapcp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from solver import CZAS_OBSLUGI_MIN, parametry_wyszukiwania  # noqa: E402
+
+
+def instancja(n, pojazdy, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.random((n, 2)) * 60_000  # metry
+    dystanse = np.hypot(*(xy[:, None, :] - xy[None, :, :]).transpose(2, 0, 1))
+    czasy_s = dystanse / (50 / 3.6)
+    demands = rng.integers(5, 30, n)
+    demands[0] = 0
+    okna = np.tile([0, 24 * 60], (n, 1))
+    pojemnosci = np.full(pojazdy, int(demands.sum() / pojazdy * 1.3))
+    return czasy_s, demands, okna, pojemnosci
+
+
+def model(czasy_s, demands, okna, pojemnosci, natywny):
+    manager = pywrapcp.RoutingIndexManager(len(czasy_s), len(pojemnosci), 0)
+    routing = pywrapcp.RoutingModel(manager)
+
+    if natywny:
+        time_matrix = (czasy_s // 60).astype(np.int64)
+        time_matrix[1:, :] += CZAS_OBSLUGI_MIN
+        transit = routing.RegisterTransitMatrix(time_matrix.tolist())
+        demand = routing.RegisterUnaryTransitVector(demands.tolist())
+    else:
+        # dotychczasowa wersja: listy list i domknięcia wywoływane przez OR-Tools
+        time_matrix = [[int(d / 60) for d in row] for row in czasy_s]
+        demands_lista = demands.tolist()
+
+        def time_callback(from_index, to_index):
+            from_node = manager.IndexToNode(from_index)
+            to_node = manager.IndexToNode(to_index)
+            service_time = CZAS_OBSLUGI_MIN if from_node != 0 else 0
+            return time_matrix[from_node][to_node] + service_time
+
+        def demand_callback(from_index):
+            return demands_lista[manager.IndexToNode(from_index)]
+
+        transit = routing.RegisterTransitCallback(time_callback)
+        demand = routing.RegisterUnaryTransitCallback(demand_callback)
+
+    routing.SetArcCostEvaluatorOfAllVehicles(transit)
+    routing.AddDimension(transit, 30, 24 * 60, False, 'Time')
+    time_dimension = routing.GetDimensionOrDie('Time')
+    for i, (start, end) in enumerate(okna.tolist()):
+        if i:
+            time_dimension.CumulVar(manager.NodeToIndex(i)).SetRange(start, end)
+    routing.AddDimensionWithVehicleCapacity(demand, 0, pojemnosci.tolist(), True, 'Capacity')
+    return routing
+
+
+def pomiar(n, pojazdy, limit_s, natywny):
+    routing = model(*instancja(n, pojazdy), natywny=natywny)
+    params, _ = parametry_wyszukiwania('balanced', n)
+    params.time_limit.FromMilliseconds(int(limit_s * 1000))
+
+    rozwiazania = [0]
+
+    def licz():
+        rozwiazania[0] += 1
+    routing.AddAtSolutionCallback(licz)
+
+    start = time.perf_counter()
+    solution = routing.SolveWithParameters(params)
+    czas = time.perf_counter() - start
+    return {
+        'punkty': n,
+        'wersja': 'natywna' if natywny else 'callback',
+        'czas_s': round(czas, 3),
+        'rozwiazania_na_s': round(rozwiazania[0] / czas, 1),
+        'galezie_na_s': round(routing.solver().Branches() / czas, 1),
+        'koszt': solution.ObjectiveValue() if solution else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--punkty', type=int, nargs='+', default=[50, 100, 200])
+    parser.add_argument('--pojazdy', type=int, default=8)
+    parser.add_argument('--limit', type=float, default=5.0)
+    args = parser.parse_args()
+
+    for n in args.punkty:
+        for natywny in (False, True):
+            print(json.dumps(pomiar(n, args.pojazdy, args.limit, natywny)))
+
+
+if __name__ == '__main__':
+    main()
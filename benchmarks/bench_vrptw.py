@@ -0,0 +1,182 @@
+"""Benchmark potoku optymalizacji na syntetycznych instancjach VRPTW w Polsce.
+
+Instancje są powtarzalne (seed), mieszczą się w granicach PL_MIN/MAX_LAT/LON
+i mają zróżnicowane okna czasowe, wagi i flotę. Macierz liczy estymator
+haversine, więc nie jest potrzebna sieć ani baza. Każdy rozmiar jest liczony
+w osobnym procesie, żeby szczyt pamięci nie mieszał się między pomiarami.
+Wynik: jedna linia JSON na rozmiar (stdout albo --wyjscie, dopisywane).
+
+    python benchmarks/bench_vrptw.py --rozmiary 10 100 500 2000 --profil fast
+    python benchmarks/bench_vrptw.py --rozmiary 2000 --klaster 150 --procesy 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+KATALOG_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, KATALOG_REPO)
+
+# granice jak w app.py (PL_MIN_LAT itd.)
+PL_MIN_LAT, PL_MAX_LAT = 49.00, 55.00
+PL_MIN_LON, PL_MAX_LON = 14.00, 24.20
+
+OKNA = [('08:00', '16:00'), ('08:00', '12:00'), ('12:00', '16:00'), ('07:00', '18:00')]
+POJEMNOSCI = [500, 1000, 1500]
+PUNKTY_NA_POJAZD = 8  # z zapasem: 15 min obsługi + dojazd w 8-godzinnym oknie
+
+
+def _godzina(minuty):
+    return f"{minuty // 60:02d}:{minuty % 60:02d}"
+
+
+def instancja(n, seed):
+    """Zwraca (punkty z HUBem na początku, pojazdy) w formie zgodnej z PunktDostawy/Pojazd."""
+    rng = np.random.default_rng(seed)
+
+    hub_lat = rng.uniform(PL_MIN_LAT + 1, PL_MAX_LAT - 1)
+    hub_lon = rng.uniform(PL_MIN_LON + 1, PL_MAX_LON - 1)
+    promien = 0.08 + 0.17 * min(n / 2000, 1)  # większe zlecenia obejmują większy region
+    lat = np.clip(hub_lat + rng.normal(0, promien, n), PL_MIN_LAT, PL_MAX_LAT)
+    lon = np.clip(hub_lon + rng.normal(0, promien * 1.5, n), PL_MIN_LON, PL_MAX_LON)
+    wagi = rng.integers(5, 50, n)
+
+    punkty = [SimpleNamespace(id=0, nazwa='HUB', typ='HUB', lat=hub_lat, lon=hub_lon, waga=0,
+                              okno_od='06:00', okno_do='22:00')]
+    for i in range(n):
+        if rng.random() < 0.2:
+            # wąskie, dwugodzinne okno
+            start = int(rng.integers(8 * 60, 14 * 60 + 1) // 15 * 15)
+            okno = (_godzina(start), _godzina(start + 120))
+        else:
+            okno = OKNA[rng.integers(len(OKNA))]
+        punkty.append(SimpleNamespace(id=i + 1, nazwa=f'P{i + 1}', typ='DELIVERY', lat=float(lat[i]),
+                                      lon=float(lon[i]), waga=int(wagi[i]), okno_od=okno[0], okno_do=okno[1]))
+
+    pojemnosci = rng.choice(POJEMNOSCI, size=max(n, 1))
+    liczba = max(int(np.searchsorted(np.cumsum(pojemnosci), wagi.sum() * 1.2)) + 1,
+                 -(-n // PUNKTY_NA_POJAZD), 1)
+    pojazdy = [SimpleNamespace(id_pojazdu=k + 1, pojemnosc=float(pojemnosci[k % len(pojemnosci)]))
+               for k in range(liczba)]
+    return punkty, pojazdy
+
+
+def pomiar_dekompozycji(n, seed, profil, plateau_s, klaster, procesy, poprawa):
+    from matrix_providers import HaversineProvider, matrix_providers
+    from solver import rozwiaz_dekompozycja
+
+    punkty, pojazdy = instancja(n, seed)
+    matrix_providers.dodaj(HaversineProvider())
+    statystyki = {}
+    ustawienia = {'prog': 0, 'rozmiar_klastra': klaster, 'procesy': procesy, 'poprawa': poprawa}
+    start = time.perf_counter()
+    wynik, _ = rozwiaz_dekompozycja(punkty, pojazdy, 'haversine', profil, plateau_s, None, ustawienia, statystyki)
+    trasy = wynik['trasy'] or []
+    return {
+        'punkty': n,
+        'seed': seed,
+        'profil': profil,
+        'klastry': statystyki.get('klastry'),
+        'procesy': procesy or os.cpu_count(),
+        'pojazdy': len(pojazdy),
+        'pojazdy_uzyte': sum(1 for t in trasy if len(t['wezly']) > 2),
+        'rozwiazano': wynik['trasy'] is not None,
+        'koszt': wynik['koszt'],
+        'rozwiazania': wynik['rozwiazania'],
+        'poprawione_pary': statystyki.get('poprawione_pary', 0),
+        'czas_macierzy_s': round(statystyki['czas_macierzy'], 4),
+        'czas_poprawy_s': round(statystyki.get('czas_poprawy', 0.0), 3),
+        'czas_solvera_s': round(wynik['czas_solvera'], 3),
+        'czas_calkowity_s': round(time.perf_counter() - start, 3),
+        'szczyt_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def pomiar(n, seed, profil, plateau_s):
+    from matrix_providers import HaversineProvider
+    from solver import dane_modelu, rozwiaz_model
+
+    punkty, pojazdy = instancja(n, seed)
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    durations, _ = HaversineProvider().macierz(punkty)
+    czas_macierzy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dane = dane_modelu(punkty, pojazdy, durations)
+    czas_modelu = time.perf_counter() - start
+    _, szczyt_python = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    wynik = rozwiaz_model(*dane, profil=profil, plateau_s=plateau_s)
+    trasy = wynik['trasy'] or []
+    return {
+        'punkty': n,
+        'seed': seed,
+        'profil': profil,
+        'pojazdy': len(pojazdy),
+        'pojazdy_uzyte': sum(1 for t in trasy if len(t['wezly']) > 2),
+        'rozwiazano': wynik['trasy'] is not None,
+        'koszt': wynik['koszt'],
+        'rozwiazania': wynik['rozwiazania'],
+        'czas_macierzy_s': round(czas_macierzy, 4),
+        'czas_modelu_s': round(czas_modelu, 4),
+        'czas_solvera_s': round(wynik['czas_solvera'], 3),
+        'szczyt_pamieci_python_mb': round(szczyt_python / 2 ** 20, 1),
+        'szczyt_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=KATALOG_REPO,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rozmiary', type=int, nargs='+', default=[10, 50, 100, 250, 500, 1000, 2000])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--profil', default='fast', choices=['fast', 'balanced', 'quality'])
+    parser.add_argument('--plateau', type=float, default=None, help='sekundy bez poprawy (domyślnie z profilu)')
+    parser.add_argument('--klaster', type=int, default=None,
+                        help='docelowy rozmiar klastra; włącza tryb dekompozycji (solver.rozwiaz_dekompozycja)')
+    parser.add_argument('--procesy', type=int, default=None, help='procesy dla klastrów (domyślnie liczba rdzeni)')
+    parser.add_argument('--bez-poprawy', action='store_true', help='pomija poprawę tras na styku klastrów')
+    parser.add_argument('--wyjscie', help='plik JSON Lines, do którego dopisywane są wyniki')
+    args = parser.parse_args()
+
+    wspolne = {'commit': _commit(), 'data': datetime.now().isoformat(timespec='seconds')}
+    kontekst = multiprocessing.get_context('spawn')
+    if args.klaster:
+        funkcja, parametry = pomiar_dekompozycji, (args.klaster, args.procesy, not args.bez_poprawy)
+    else:
+        funkcja, parametry = pomiar, ()
+    plik = open(args.wyjscie, 'a', encoding='utf-8') if args.wyjscie else sys.stdout
+    try:
+        for n in args.rozmiary:
+            # ProcessPoolExecutor, bo procesy multiprocessing.Pool nie mogą mieć własnych procesów potomnych
+            with ProcessPoolExecutor(max_workers=1, mp_context=kontekst) as pula:
+                wynik = pula.submit(funkcja, n, args.seed, args.profil, args.plateau, *parametry).result()
+            plik.write(json.dumps({**wspolne, **wynik}, ensure_ascii=False) + '\n')
+            plik.flush()
+    finally:
+        if plik is not sys.stdout:
+            plik.close()
+
+
+if __name__ == '__main__':
+    main()
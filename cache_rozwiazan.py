@@ -0,0 +1,160 @@
+"""Cache gotowych rozwiązań VRP według kanonicznego skrótu instancji.
+
+Skrót obejmuje HUB, współrzędne, wagi i okna czasowe punktów dostaw (po
+posortowaniu, więc kolejność id ani nazwy punktów nie mają znaczenia),
+pojemności pojazdów (posortowane, pojazdy o tej samej pojemności są wymienne)
+oraz ustawienia solvera. Rozwiązanie jest zapamiętywane w postaci kanonicznej:
+pozycje punktów i „sloty” pojazdów zamiast ich id, dzięki czemu można je
+przenieść na inne zlecenie o tej samej instancji bez ponownego liczenia macierzy,
+solvera i geometrii.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import metryki
+from matrix_cache import PRECYZJA
+
+
+def klucz_instancji(dane_punktow, pojazdy, ustawienia):
+    """Zwraca {'skrot', 'punkty', 'pojazdy'}: skrót instancji i id w kolejności kanonicznej.
+
+    dane_punktow to wynik models.wczytaj_dane_zlecenia (HUB na pozycji 0), pojazdy
+    to lista obiektów Pojazd, ustawienia to słownik parametrów solvera wpływających na wynik.
+    """
+    lon = np.round(dane_punktow['lon'] * PRECYZJA).astype(np.int64)
+    lat = np.round(dane_punktow['lat'] * PRECYZJA).astype(np.int64)
+    waga = dane_punktow['waga'].astype(np.int64)  # solver liczy popyt w liczbach całkowitych
+    waga[0] = 0
+    okna = dane_punktow['okna']
+
+    # HUB zostaje na pozycji 0, dostawy sortujemy po wszystkich cechach
+    dostawy = np.lexsort((okna[1:, 1], okna[1:, 0], waga[1:], lat[1:], lon[1:])) + 1
+    kolejnosc = np.concatenate(([0], dostawy))
+    tabela = np.column_stack((lon, lat, waga, okna[:, 0], okna[:, 1]))[kolejnosc]
+
+    pojazdy = sorted(pojazdy, key=lambda p: (int(p.pojemnosc), p.id_pojazdu))
+    pojemnosci = np.array([int(p.pojemnosc) for p in pojazdy], dtype=np.int64)
+
+    skrot = hashlib.sha256()
+    skrot.update(json.dumps(ustawienia, sort_keys=True, default=str).encode())
+    skrot.update(np.ascontiguousarray(tabela, dtype=np.int64).tobytes())
+    skrot.update(b'|')
+    skrot.update(pojemnosci.tobytes())
+    return {
+        'skrot': skrot.hexdigest(),
+        'punkty': dane_punktow['id'][kolejnosc].tolist(),
+        'pojazdy': [p.id_pojazdu for p in pojazdy],
+    }
+
+
+def kanoniczne_rozwiazanie(klucz, wyniki_tras):
+    """Zamienia wynik solver.solve_vrp_google na postać niezależną od id punktów i pojazdów."""
+    pozycje = {id_punktu: nr for nr, id_punktu in enumerate(klucz['punkty'])}
+    sloty = {id_pojazdu: nr for nr, id_pojazdu in enumerate(klucz['pojazdy'])}
+    return [{
+        'slot': sloty[wynik['pojazd_db'].id_pojazdu],
+        # ostatni wpis to zawsze powrót do HUBa, odtwarzany przy przenoszeniu
+        'przystanki': [(pozycje[p['id_punktu']], int(p['przyjazd_min']), int(p['ladunek']))
+                       for p in wynik['punkty_json'][:-1]],
+        'ladunek': int(wynik['punkty_json'][-1].get('ladunek', 0)),
+        'czas_calkowity': int(wynik['czas_calkowity']),
+        'dystans_km': wynik['dystans_km'],
+        'geometria': wynik['geometria'],
+    } for wynik in wyniki_tras]
+
+
+def odtworz_rozwiazanie(klucz, rozwiazanie, punkty, pojazdy):
+    """Przenosi kanoniczne rozwiązanie na punkty i pojazdy zlecenia (format solve_vrp_google)."""
+    punkty_wg_id = {p.id: p for p in punkty}
+    pojazdy_wg_id = {p.id_pojazdu: p for p in pojazdy}
+    hub = punkty_wg_id[klucz['punkty'][0]]
+
+    wyniki_tras = []
+    for trasa in rozwiazanie:
+        punkty_json = []
+        for pozycja, przyjazd, ladunek in trasa['przystanki']:
+            p_obj = punkty_wg_id[klucz['punkty'][pozycja]]
+            punkty_json.append({
+                "id_punktu": p_obj.id,
+                "nazwa": p_obj.nazwa,
+                "typ": p_obj.typ,
+                "przyjazd_min": przyjazd,
+                "ladunek": ladunek
+            })
+        punkty_json.append({"id_punktu": hub.id, "nazwa": "Powrót: " + hub.nazwa, "typ": "END",
+                            "ladunek": trasa['ladunek']})
+        wyniki_tras.append({
+            "pojazd_db": pojazdy_wg_id[klucz['pojazdy'][trasa['slot']]],
+            "punkty_json": punkty_json,
+            "czas_calkowity": trasa['czas_calkowity'],
+            "dystans_km": trasa['dystans_km'],
+            "geometria": trasa['geometria'],
+        })
+    return wyniki_tras
+
+
+class CacheRozwiazan:
+    """LRU z TTL gotowych rozwiązań w pamięci procesu WWW."""
+
+    def __init__(self, app=None):
+        self.max_rozmiar = 128
+        self.ttl = 3600
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.trafienia = 0
+        self.chybienia = 0
+        self.polaczone = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_rozmiar = app.config.get('SOLVE_CACHE_SIZE', self.max_rozmiar)
+        self.ttl = app.config.get('SOLVE_CACHE_TTL', self.ttl)
+        app.extensions['cache_rozwiazan'] = self
+
+    def pobierz(self, skrot):
+        with self._lock:
+            wpis = self._lru.get(skrot)
+            if wpis is not None and time.time() - wpis[1] > self.ttl:
+                del self._lru[skrot]
+                wpis = None
+            if wpis is None:
+                self.chybienia += 1
+                metryki.cache_rozwiazan.inc('chybienie')
+                return None
+            self._lru.move_to_end(skrot)
+            self.trafienia += 1
+        metryki.cache_rozwiazan.inc('trafienie')
+        return wpis[0]
+
+    def zapisz(self, skrot, rozwiazanie):
+        if self.max_rozmiar <= 0:
+            return
+        with self._lock:
+            self._lru[skrot] = (rozwiazanie, time.time())
+            self._lru.move_to_end(skrot)
+            while len(self._lru) > self.max_rozmiar:
+                self._lru.popitem(last=False)
+
+    def polaczono(self):
+        """Zlicza zgłoszenie dołączone do trwającej optymalizacji tej samej instancji."""
+        with self._lock:
+            self.polaczone += 1
+        metryki.cache_rozwiazan.inc('polaczone')
+
+    def wyczysc(self):
+        with self._lock:
+            self._lru.clear()
+
+    def statystyki(self):
+        with self._lock:
+            return {'wpisy': len(self._lru), 'max_rozmiar': self.max_rozmiar, 'trafienia': self.trafienia,
+                    'chybienia': self.chybienia, 'polaczone': self.polaczone}
+
+
+cache_rozwiazan = CacheRozwiazan()
@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from flask import request, Response
+from sqlalchemy import func, select, cast, String
+
+from models import db, PunktDostawy, Trasa
+
+GZIP_MIN_BAJTOW = 1024  # mniejszych odpowiedzi nie opłaca się kompresować
+
+
+def koduj_polyline(wspolrzedne, precyzja=5):
+    """Koduje listę [lon, lat] algorytmem Google Encoded Polyline (kolejność lat, lon)."""
+    if not wspolrzedne:
+        return ''
+    punkty = np.round(np.asarray(wspolrzedne, dtype=float)[:, ::-1] * 10 ** precyzja).astype(np.int64)
+    delty = np.diff(punkty, axis=0, prepend=[[0, 0]]).ravel()
+    # przesunięcie znaku: ujemne liczby na nieparzyste
+    wartosci = np.where(delty < 0, ~(delty << 1), delty << 1)
+
+    znaki = []
+    for v in wartosci.tolist():
+        while v >= 0x20:
+            znaki.append(chr((0x20 | (v & 0x1f)) + 63))
+            v >>= 5
+        znaki.append(chr(v + 63))
+    return ''.join(znaki)
+
+
+def etag_punktow(id_zlecenia):
+    """Skrót zawartości punktów zlecenia liczony w bazie jednym agregatem."""
+    wiersz = func.concat_ws('|', PunktDostawy.id, PunktDostawy.nazwa, PunktDostawy.typ, PunktDostawy.waga,
+                            PunktDostawy.okno_od, PunktDostawy.okno_do,
+                            func.ST_AsText(PunktDostawy.lokalizacja))
+    skrot = db.session.execute(
+        select(func.md5(func.coalesce(func.string_agg(wiersz, ';').within_group(PunktDostawy.id), '')))
+        .where(PunktDostawy.id_zlecenia == id_zlecenia)
+    ).scalar()
+    return f'p-{id_zlecenia}-{skrot}'
+
+
+def etag_tras(id_zlecenia, status):
+    liczba, ostatnia, identyfikatory = db.session.execute(
+        select(func.count(Trasa.id), func.max(Trasa.data_generacji),
+               func.string_agg(cast(Trasa.id, String), ',').within_group(Trasa.id))
+        .where(Trasa.id_zlecenia == id_zlecenia)
+    ).one()
+    skrot = hashlib.md5(f'{status}|{liczba}|{ostatnia}|{identyfikatory}'.encode()).hexdigest()
+    return f't-{id_zlecenia}-{skrot}'
+
+
+def dane_punktow(zlecenie):
+    return [p.to_dict() for p in zlecenie.punkty]
+
+
+def dane_tras(zlecenie, poziom='pelna'):
+    if zlecenie.status != 'zakonczone':
+        return []
+    trasy = Trasa.query.options(db.joinedload(Trasa.pojazd))\
+        .filter_by(id_zlecenia=zlecenie.id).order_by(Trasa.id).all()
+    wynik = []
+    for t in trasy:
+        geometria = t.geojson(poziom)
+        wynik.append({
+            'pojazd_id': t.id_pojazdu,
+            'numer': t.pojazd.numer_rejestracyjny,
+            'dystans': t.dlugosc,
+            'czas': t.czas_przejazdu,
+            'polyline': koduj_polyline(geometria['coordinates']) if geometria else None,
+            'points_order': t.szczegoly_punktow
+        })
+    return wynik
+
+
+class CacheOdpowiedzi:
+    """LRU gotowych (już zserializowanych i skompresowanych) odpowiedzi dla zakończonych zleceń."""
+
+    def __init__(self, app=None):
+        self.max_rozmiar = 256
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.trafienia = 0
+        self.chybienia = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_rozmiar = app.config.get('MAP_RESPONSE_CACHE_SIZE', self.max_rozmiar)
+        app.extensions['cache_odpowiedzi'] = self
+
+    def pobierz(self, klucz):
+        with self._lock:
+            wpis = self._lru.get(klucz)
+            if wpis is None:
+                self.chybienia += 1
+                return None
+            self._lru.move_to_end(klucz)
+            self.trafienia += 1
+            return wpis
+
+    def zapisz(self, klucz, wpis):
+        with self._lock:
+            self._lru[klucz] = wpis
+            self._lru.move_to_end(klucz)
+            while len(self._lru) > self.max_rozmiar:
+                self._lru.popitem(last=False)
+
+    def statystyki(self):
+        with self._lock:
+            return {'wpisy': len(self._lru), 'max_rozmiar': self.max_rozmiar,
+                    'trafienia': self.trafienia, 'chybienia': self.chybienia}
+
+
+cache_odpowiedzi = CacheOdpowiedzi()
+
+
+def _zserializuj(dane):
+    surowe = json.dumps(dane, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    skompresowane = gzip.compress(surowe, compresslevel=6) if len(surowe) >= GZIP_MIN_BAJTOW else None
+    return surowe, skompresowane
+
+
+def odpowiedz_mapy(etag, budowniczy, niezmienne=False):
+    """Odpowiedź JSON z silnym ETagiem, 304 dla niezmienionych danych i gzipem.
+
+    budowniczy() jest wołany tylko wtedy, gdy treść trzeba naprawdę wygenerować.
+    Dla niezmiennych danych (zlecenie zakończone) gotowe bajty trafiają do cache.
+    """
+    response = Response(mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'private, no-cache'
+
+    # silny ETag musi odpowiadać dokładnym bajtom, więc wariant gzip ma własny sufiks
+    for wariant in (etag, f'{etag}-gz'):
+        if request.if_none_match.contains(wariant):
+            response.set_etag(wariant)
+            response.status_code = 304
+            return response
+
+    wpis = cache_odpowiedzi.pobierz(etag) if niezmienne else None
+    if wpis is None:
+        wpis = _zserializuj(budowniczy())
+        if niezmienne:
+            cache_odpowiedzi.zapisz(etag, wpis)
+
+    surowe, skompresowane = wpis
+    if skompresowane is not None and 'gzip' in request.accept_encodings:
+        response.set_etag(f'{etag}-gz')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_data(skompresowane)
+    else:
+        response.set_etag(etag)
+        response.set_data(surowe)
+    return response
@@ -0,0 +1,80 @@
+"""Podział dużych zleceń na klastry (cluster-first, route-second).
+
+Punkty dostaw są dzielone metodą zamiatania (sweep) wokół HUBa na spójne
+geograficznie sektory o zbliżonej liczbie punktów i wadze, a pojazdy są
+przydzielane do sektorów proporcjonalnie do ich potrzeb. Każdy sektor jest
+potem osobnym, małym problemem VRPTW (solver.rozwiaz_dekompozycja).
+"""
+import numpy as np
+
+
+def podziel_sweep(lat, lon, demands, liczba_klastrow):
+    """Dzieli punkty 1..n-1 (0 to HUB) na sektory kątowe wokół HUBa.
+
+    Cięcia wypadają tak, żeby każdy sektor miał podobny udział liczby punktów
+    i wagi. Zwraca listę tablic z indeksami węzłów, w kolejności zamiatania.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    demands = np.asarray(demands, dtype=float)
+    n = len(lat) - 1
+    liczba_klastrow = max(1, min(liczba_klastrow, n))
+
+    # kąt we współrzędnych lokalnych (długość skalowana cosinusem szerokości)
+    dy = lat[1:] - lat[0]
+    dx = (lon[1:] - lon[0]) * np.cos(np.radians(lat[0]))
+    katy = np.arctan2(dy, dx)
+    kolejnosc = np.argsort(katy, kind='stable')
+
+    # zamiatanie zaczynamy w największej luce kątowej, żeby nie przeciąć skupiska punktów
+    posortowane = katy[kolejnosc]
+    luki = np.diff(np.append(posortowane, posortowane[0] + 2 * np.pi))
+    kolejnosc = np.roll(kolejnosc, -(int(np.argmax(luki)) + 1))
+
+    suma_wag = demands[1:].sum()
+    waga = 0.5 / n + (0.5 * demands[1:][kolejnosc] / suma_wag if suma_wag > 0 else 0.5 / n)
+    narastajaco = np.cumsum(waga)
+    granice = np.searchsorted(narastajaco, np.arange(1, liczba_klastrow) / liczba_klastrow * narastajaco[-1])
+    return [czesc + 1 for czesc in np.split(kolejnosc, granice) if len(czesc)]
+
+
+def przydziel_pojazdy(klastry, demands, vehicle_capacities):
+    """Przydziela pojazdy (indeksy) do klastrów proporcjonalnie do wagi i liczby punktów.
+
+    Każdy klaster dostaje co najmniej jeden pojazd; największe pojazdy są
+    rozdzielane jako pierwsze. Zwraca listę list indeksów pojazdów.
+    """
+    demands = np.asarray(demands, dtype=float)
+    pojemnosci = np.asarray(vehicle_capacities, dtype=float)
+    n = sum(len(k) for k in klastry)
+    suma_wag = demands.sum()
+
+    udzial = np.array([
+        max(demands[k].sum() / suma_wag if suma_wag > 0 else 0.0, len(k) / n) for k in klastry
+    ])
+    cel = udzial / udzial.sum() * pojemnosci.sum()
+
+    przydzial = [[] for _ in klastry]
+    przydzielona = np.zeros(len(klastry))
+    for v in np.argsort(-pojemnosci, kind='stable'):
+        puste = [c for c in range(len(klastry)) if not przydzial[c]]
+        c = max(puste, key=lambda c: cel[c]) if puste else int(np.argmax(cel - przydzielona))
+        przydzial[c].append(int(v))
+        przydzielona[c] += pojemnosci[v]
+    return przydzial
+
+
+def liczba_klastrow(liczba_punktow, liczba_pojazdow, rozmiar_klastra):
+    return max(1, min(-(-liczba_punktow // rozmiar_klastra), liczba_pojazdow))
+
+
+def mapuj_wynik(wynik, wezly_klastra, pojazdy_klastra, trasy_globalne, dystanse):
+    """Przenosi trasy rozwiązania klastra na globalne indeksy węzłów i pojazdów."""
+    for lokalny, trasa in enumerate(wynik['trasy']):
+        wezly = trasa['wezly']
+        trasy_globalne[pojazdy_klastra[lokalny]] = {
+            'wezly': [int(wezly_klastra[w]) for w in wezly],
+            'przyjazdy': trasa['przyjazdy'],
+            'ladunki': trasa['ladunki'],
+            'dystans_m': float(dystanse[wezly[:-1], wezly[1:]].sum()),
+        }
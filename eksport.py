@@ -0,0 +1,174 @@
+"""Strumieniowy eksport zleceń, punktów i tras (JSON, NDJSON, GeoJSON).
+
+Dane są czytane z bazy kursorem po stronie serwera (yield_per) i od razu
+zamieniane na kolejne fragmenty odpowiedzi, więc zużycie pamięci nie zależy
+od wielkości eksportu. Geometrie tras przychodzą z PostGIS jako gotowy tekst
+GeoJSON (ST_AsGeoJSON) i są wklejane do wyniku bez parsowania.
+"""
+import json
+import zlib
+
+from sqlalchemy import func, select
+
+from models import db, PunktDostawy, Trasa, Pojazd
+
+FORMATY = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'geojson': ('application/geo+json', 'geojson'),
+}
+PACZKA = 500            # wierszy pobieranych z kursora naraz
+BUFOR_BAJTOW = 64 * 1024  # fragmenty mniejsze od tego są sklejane przed wysłaniem
+
+
+def _json(obiekt):
+    return json.dumps(obiekt, ensure_ascii=False, separators=(',', ':'))
+
+
+def _z_geometria(slownik, geometria, klucz):
+    """Dokleja gotowy tekst GeoJSON jako ostatni klucz obiektu, bez json.loads."""
+    tekst = _json(slownik)
+    return tekst[:-1] + (',' if slownik else '') + f'"{klucz}":{geometria or "null"}}}'
+
+
+def _dane_zlecenia(zlecenie):
+    return {
+        "id": zlecenie.id,
+        "nazwa": zlecenie.nazwa,
+        "status": zlecenie.status,
+        "data_utworzenia": zlecenie.data_utworzenia.isoformat()
+    }
+
+
+def _punkty(id_zlecenia):
+    zapytanie = select(
+        PunktDostawy.id, PunktDostawy.nazwa, PunktDostawy.typ,
+        func.ST_Y(PunktDostawy.lokalizacja), func.ST_X(PunktDostawy.lokalizacja),
+        PunktDostawy.waga, PunktDostawy.okno_od, PunktDostawy.okno_do
+    ).where(PunktDostawy.id_zlecenia == id_zlecenia).order_by(PunktDostawy.id)
+
+    for id_punktu, nazwa, typ, lat, lon, waga, okno_od, okno_do in \
+            db.session.execute(zapytanie.execution_options(yield_per=PACZKA)):
+        yield {
+            "id": id_punktu,
+            "nazwa": nazwa,
+            "typ": typ,
+            "lat": lat,
+            "lon": lon,
+            "waga": waga,
+            "okno_od": okno_od,
+            "okno_do": okno_do
+        }
+
+
+def _trasy(id_zlecenia):
+    """Zwraca pary (dane trasy, tekst GeoJSON geometrii)."""
+    zapytanie = select(
+        Trasa.id, Pojazd.id_pojazdu, Pojazd.numer_rejestracyjny, Pojazd.pojemnosc,
+        Trasa.dlugosc, Trasa.czas_przejazdu, Trasa.data_generacji, Trasa.szczegoly_punktow,
+        func.ST_AsGeoJSON(Trasa.geometria_trasy)
+    ).join(Pojazd, Pojazd.id_pojazdu == Trasa.id_pojazdu)\
+        .where(Trasa.id_zlecenia == id_zlecenia).order_by(Trasa.id)
+
+    for (id_trasy, id_pojazdu, numer, pojemnosc, dlugosc, czas, data_generacji, szczegoly, geometria) in \
+            db.session.execute(zapytanie.execution_options(yield_per=PACZKA)):
+        yield {
+            "id_trasy": id_trasy,
+            "pojazd": {
+                "id": id_pojazdu,
+                "numer_rejestracyjny": numer,
+                "pojemnosc": pojemnosc
+            },
+            "dystans_km": dlugosc,
+            "czas_przejazdu_min": czas,
+            "data_generacji": data_generacji.isoformat() if data_generacji else None,
+            "kolejnosc_punktow": szczegoly
+        }, geometria
+
+
+def _json_zlecenia(zlecenie):
+    yield '{"zlecenie":' + _json(_dane_zlecenia(zlecenie)) + ',"punkty":['
+    for nr, punkt in enumerate(_punkty(zlecenie.id)):
+        yield (',' if nr else '') + _json(punkt)
+    yield '],"trasy":['
+    for nr, (trasa, geometria) in enumerate(_trasy(zlecenie.id)):
+        yield (',' if nr else '') + _z_geometria(trasa, geometria, 'geometria_trasy')
+    yield ']}'
+
+
+def eksport_json(zlecenia, pojedyncze=False):
+    if pojedyncze:
+        yield from _json_zlecenia(zlecenia[0])
+        return
+    yield '{"zlecenia":['
+    for nr, zlecenie in enumerate(zlecenia):
+        if nr:
+            yield ','
+        yield from _json_zlecenia(zlecenie)
+    yield ']}'
+
+
+def eksport_ndjson(zlecenia, pojedyncze=False):
+    for zlecenie in zlecenia:
+        yield _json({"rodzaj": "zlecenie", **_dane_zlecenia(zlecenie)}) + '\n'
+        for punkt in _punkty(zlecenie.id):
+            yield _json({"rodzaj": "punkt", "id_zlecenia": zlecenie.id, **punkt}) + '\n'
+        for trasa, geometria in _trasy(zlecenie.id):
+            yield _z_geometria({"rodzaj": "trasa", "id_zlecenia": zlecenie.id, **trasa}, geometria,
+                               'geometria_trasy') + '\n'
+
+
+def eksport_geojson(zlecenia, pojedyncze=False):
+    yield '{"type":"FeatureCollection","features":['
+    pierwszy = True
+    for zlecenie in zlecenia:
+        for punkt in _punkty(zlecenie.id):
+            wlasciwosci = {"rodzaj": "punkt", "id_zlecenia": zlecenie.id, "zlecenie": zlecenie.nazwa, **punkt}
+            geometria = _json({"type": "Point", "coordinates": [wlasciwosci.pop('lon'), wlasciwosci.pop('lat')]})
+            yield ('' if pierwszy else ',') + _z_geometria({"type": "Feature", "properties": wlasciwosci},
+                                                           geometria, 'geometry')
+            pierwszy = False
+        for trasa, geometria in _trasy(zlecenie.id):
+            wlasciwosci = {"rodzaj": "trasa", "id_zlecenia": zlecenie.id, "zlecenie": zlecenie.nazwa, **trasa}
+            yield ('' if pierwszy else ',') + _z_geometria({"type": "Feature", "properties": wlasciwosci},
+                                                           geometria, 'geometry')
+            pierwszy = False
+    yield ']}'
+
+
+GENERATORY = {
+    'json': eksport_json,
+    'ndjson': eksport_ndjson,
+    'geojson': eksport_geojson,
+}
+
+
+def _bajty(fragmenty):
+    """Skleja drobne fragmenty tekstu w większe porcje bajtów."""
+    bufor = []
+    rozmiar = 0
+    for fragment in fragmenty:
+        dane = fragment.encode('utf-8')
+        bufor.append(dane)
+        rozmiar += len(dane)
+        if rozmiar >= BUFOR_BAJTOW:
+            yield b''.join(bufor)
+            bufor = []
+            rozmiar = 0
+    if bufor:
+        yield b''.join(bufor)
+
+
+def _gzip(porcje):
+    kompresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: nagłówek i stopka gzip
+    for porcja in porcje:
+        skompresowane = kompresor.compress(porcja)
+        if skompresowane:
+            yield skompresowane
+    yield kompresor.flush()
+
+
+def strumien_eksportu(zlecenia, format, gzip=False, pojedyncze=False):
+    """Generator bajtów eksportu w wybranym formacie, opcjonalnie skompresowanych gzipem."""
+    porcje = _bajty(GENERATORY[format](zlecenia, pojedyncze))
+    return _gzip(porcje) if gzip else porcje
@@ -0,0 +1,551 @@
+"""Lokalny silnik tras na grafie drogowym z OpenStreetMap (zamiennik OSRM).
+
+Budowa grafu (jednorazowo, poza aplikacją):
+
+    python graf_drogowy.py malopolskie-latest.osm.bz2 dane/graf
+
+Wyciąg OSM XML jest czytany strumieniowo (iterparse). Zostają drogi przejezdne
+dla samochodu i największa silnie spójna składowa, a na grafie liczona jest
+hierarchia skrótów (contraction hierarchies, CH). Wynikiem są tablice CSR
+zapisane jako osobne pliki .npy, które aplikacja mapuje do pamięci (mmap), więc
+procesy robocze współdzielą je przez cache stron systemu.
+
+Zapytania nie wymagają HTTP:
+ - macierz czasów (s) i dystansów (m) algorytmem kubełkowym CH (many-to-many):
+   jedno przeszukiwanie w górę hierarchii na punkt zamiast n zapytań Dijkstry,
+ - geometria trasy: dwukierunkowe przeszukiwanie CH i rozwinięcie skrótów
+   do ciągu węzłów drogi.
+"""
+import argparse
+import bz2
+import gzip
+import heapq
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from math import inf
+
+import numpy as np
+
+PROMIEN_ZIEMI_M = 6_371_000
+
+# km/h dla dróg bez (czytelnego) tagu maxspeed
+PREDKOSCI = {
+    'motorway': 120, 'motorway_link': 60,
+    'trunk': 90, 'trunk_link': 50,
+    'primary': 70, 'primary_link': 40,
+    'secondary': 60, 'secondary_link': 40,
+    'tertiary': 50, 'tertiary_link': 30,
+    'unclassified': 40, 'residential': 30, 'road': 30,
+    'living_street': 10, 'service': 15,
+}
+PREDKOSCI_PL = {'PL:urban': 50, 'PL:rural': 90, 'PL:expressway': 120, 'PL:motorway': 140, 'PL:living_street': 20}
+ZAKAZ_WJAZDU = ('no', 'private', 'agricultural', 'forestry', 'delivery')
+
+ROZMIAR_OCZKA = 0.01       # stopnie; siatka do przyciągania punktów do węzłów
+LIMIT_SWIADKA = 500        # węzłów w wyszukiwaniu świadka przy kontrakcji
+PLIKI = ('lat', 'lon', 'gora_indptr', 'gora_cel', 'gora_czas', 'gora_dystans', 'gora_srodek',
+         'dol_indptr', 'dol_zrodlo', 'dol_czas', 'dol_dystans', 'dol_srodek', 'siatka_klucze', 'siatka_wezly')
+
+_LICZBA = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(mph)?\s*$')
+
+
+def _predkosc(typ, maxspeed):
+    if maxspeed:
+        if maxspeed in PREDKOSCI_PL:
+            return PREDKOSCI_PL[maxspeed]
+        dopasowanie = _LICZBA.match(maxspeed)
+        if dopasowanie:
+            wartosc = float(dopasowanie.group(1)) * (1.609 if dopasowanie.group(2) else 1)
+            if wartosc > 0:
+                return wartosc
+    return PREDKOSCI[typ]
+
+
+def _kierunek(tagi):
+    """1: w obie strony, 2: tylko zgodnie z kolejnością węzłów, 3: tylko przeciwnie."""
+    oneway = tagi.get('oneway')
+    if oneway in ('yes', 'true', '1'):
+        return 2
+    if oneway in ('-1', 'reverse'):
+        return 3
+    if oneway == 'no':
+        return 1
+    if tagi.get('junction') in ('roundabout', 'circular') or tagi.get('highway') == 'motorway':
+        return 2
+    return 1
+
+
+def _otworz(sciezka):
+    if sciezka.endswith('.bz2'):
+        return bz2.open(sciezka, 'rb')
+    if sciezka.endswith('.gz'):
+        return gzip.open(sciezka, 'rb')
+    return open(sciezka, 'rb')
+
+
+def wczytaj_osm(sciezka):
+    """Czyta OSM XML i zwraca krawędzie skierowane (id_osm_z, id_osm_do, czas_s, dystans_m) oraz współrzędne."""
+    id_wezlow, lat_wezlow, lon_wezlow = [], [], []
+    zrodla, cele, predkosci, kierunki = [], [], [], []
+
+    with _otworz(sciezka) as plik:
+        korzen = None
+        for zdarzenie, el in ET.iterparse(plik, events=('start', 'end')):
+            if korzen is None:
+                korzen = el
+            if zdarzenie != 'end':
+                continue
+            if el.tag == 'node':
+                id_wezlow.append(int(el.get('id')))
+                lat_wezlow.append(float(el.get('lat')))
+                lon_wezlow.append(float(el.get('lon')))
+            elif el.tag == 'way':
+                tagi = {t.get('k'): t.get('v') for t in el.iter('tag')}
+                typ = tagi.get('highway')
+                if (typ in PREDKOSCI and tagi.get('area') != 'yes'
+                        and tagi.get('access') not in ZAKAZ_WJAZDU
+                        and tagi.get('motor_vehicle') not in ZAKAZ_WJAZDU
+                        and tagi.get('motorcar') not in ZAKAZ_WJAZDU):
+                    wezly = [int(nd.get('ref')) for nd in el.iter('nd')]
+                    if len(wezly) >= 2:
+                        zrodla.extend(wezly[:-1])
+                        cele.extend(wezly[1:])
+                        predkosci.extend([_predkosc(typ, tagi.get('maxspeed'))] * (len(wezly) - 1))
+                        kierunki.extend([_kierunek(tagi)] * (len(wezly) - 1))
+            else:
+                continue
+            # przetworzony element najwyższego poziomu nie jest już potrzebny
+            korzen.clear()
+
+    id_wezlow = np.asarray(id_wezlow, dtype=np.int64)
+    kolejnosc = np.argsort(id_wezlow)
+    id_wezlow = id_wezlow[kolejnosc]
+    lat_wezlow = np.asarray(lat_wezlow)[kolejnosc]
+    lon_wezlow = np.asarray(lon_wezlow)[kolejnosc]
+
+    zrodla = np.asarray(zrodla, dtype=np.int64)
+    cele = np.asarray(cele, dtype=np.int64)
+    predkosci = np.asarray(predkosci, dtype=float)
+    kierunki = np.asarray(kierunki, dtype=np.int8)
+
+    # odcinki, których węzłów nie ma w wyciągu (droga ucięta na granicy), są pomijane
+    pozycja_z = np.clip(np.searchsorted(id_wezlow, zrodla), 0, len(id_wezlow) - 1)
+    pozycja_do = np.clip(np.searchsorted(id_wezlow, cele), 0, len(id_wezlow) - 1)
+    znane = (id_wezlow[pozycja_z] == zrodla) & (id_wezlow[pozycja_do] == cele) & (zrodla != cele)
+    pozycja_z, pozycja_do = pozycja_z[znane], pozycja_do[znane]
+    predkosci, kierunki = predkosci[znane], kierunki[znane]
+
+    dystanse = haversine(lat_wezlow[pozycja_z], lon_wezlow[pozycja_z], lat_wezlow[pozycja_do], lon_wezlow[pozycja_do])
+    czasy = dystanse / (predkosci / 3.6)
+
+    wprzod = kierunki != 3
+    wstecz = kierunki != 2
+    z = np.concatenate((pozycja_z[wprzod], pozycja_do[wstecz]))
+    do = np.concatenate((pozycja_do[wprzod], pozycja_z[wstecz]))
+    return (z, do, np.concatenate((czasy[wprzod], czasy[wstecz])),
+            np.concatenate((dystanse[wprzod], dystanse[wstecz])), lat_wezlow, lon_wezlow)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * PROMIEN_ZIEMI_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _csr(z, do, n):
+    kolejnosc = np.argsort(z, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(z, minlength=n), out=indptr[1:])
+    return indptr, kolejnosc, do[kolejnosc]
+
+
+def najwieksza_silnie_spojna(z, do, n):
+    """Maska węzłów największej silnie spójnej składowej (Kosaraju, iteracyjnie)."""
+    indptr, _, sasiedzi = _csr(z, do, n)
+    indptr_r, _, sasiedzi_r = _csr(do, z, n)
+    indptr, sasiedzi = indptr.tolist(), sasiedzi.tolist()
+    indptr_r, sasiedzi_r = indptr_r.tolist(), sasiedzi_r.tolist()
+
+    odwiedzone = bytearray(n)
+    porzadek = []
+    for start in range(n):
+        if odwiedzone[start]:
+            continue
+        odwiedzone[start] = 1
+        stos = [(start, indptr[start])]
+        while stos:
+            v, i = stos[-1]
+            if i < indptr[v + 1]:
+                stos[-1] = (v, i + 1)
+                w = sasiedzi[i]
+                if not odwiedzone[w]:
+                    odwiedzone[w] = 1
+                    stos.append((w, indptr[w]))
+            else:
+                stos.pop()
+                porzadek.append(v)
+
+    skladowa = [-1] * n
+    rozmiary = []
+    for start in reversed(porzadek):
+        if skladowa[start] >= 0:
+            continue
+        nr = len(rozmiary)
+        skladowa[start] = nr
+        stos = [start]
+        rozmiar = 0
+        while stos:
+            v = stos.pop()
+            rozmiar += 1
+            for w in sasiedzi_r[indptr_r[v]:indptr_r[v + 1]]:
+                if skladowa[w] < 0:
+                    skladowa[w] = nr
+                    stos.append(w)
+        rozmiary.append(rozmiar)
+
+    return np.asarray(skladowa) == int(np.argmax(rozmiary))
+
+
+class _Kontrakcja:
+    """Budowa hierarchii skrótów: węzły usuwane w kolejności priorytetu (różnica krawędzi)."""
+
+    def __init__(self, n, z, do, czasy, dystanse):
+        self.wyjscia = [dict() for _ in range(n)]
+        self.wejscia = [dict() for _ in range(n)]
+        for u, v, c, d in zip(z.tolist(), do.tolist(), czasy.tolist(), dystanse.tolist()):
+            if c < self.wyjscia[u].get(v, (inf,))[0]:
+                self.wyjscia[u][v] = (c, d, -1)
+                self.wejscia[v][u] = (c, d, -1)
+        self.usuniete_sasiedzi = [0] * n
+        self.gora = []  # (v, w, czas, dystans, środek): krawędzie v -> w do węzła wyżej w hierarchii
+        self.dol = []   # (v, u, czas, dystans, środek): krawędzie u -> v z węzła wyżej w hierarchii
+
+    def _swiadek(self, zrodlo, pomijany, cele, limit):
+        odleglosci = {zrodlo: 0.0}
+        kolejka = [(0.0, zrodlo)]
+        pozostale = set(cele)
+        osiadle = 0
+        while kolejka and pozostale and osiadle < LIMIT_SWIADKA:
+            d, u = heapq.heappop(kolejka)
+            if d > odleglosci[u]:
+                continue
+            if d > limit:
+                break
+            pozostale.discard(u)
+            osiadle += 1
+            for v, (c, _, _) in self.wyjscia[u].items():
+                if v == pomijany:
+                    continue
+                nd = d + c
+                if nd < odleglosci.get(v, inf):
+                    odleglosci[v] = nd
+                    heapq.heappush(kolejka, (nd, v))
+        return odleglosci
+
+    def skroty(self, v):
+        wyjscia = self.wyjscia[v]
+        wynik = []
+        for u, (cu, du, _) in self.wejscia[v].items():
+            cele = {w: cu + cw for w, (cw, _, _) in wyjscia.items() if w != u}
+            if not cele:
+                continue
+            odleglosci = self._swiadek(u, v, cele, max(cele.values()))
+            for w, c in cele.items():
+                if odleglosci.get(w, inf) > c:
+                    wynik.append((u, w, c, du + wyjscia[w][1]))
+        return wynik
+
+    def priorytet(self, v, skroty):
+        return len(skroty) - len(self.wejscia[v]) - len(self.wyjscia[v]) + self.usuniete_sasiedzi[v]
+
+    def kontrakcja(self, v, skroty):
+        for w, (c, d, s) in self.wyjscia[v].items():
+            self.gora.append((v, w, c, d, s))
+            del self.wejscia[w][v]
+            self.usuniete_sasiedzi[w] += 1
+        for u, (c, d, s) in self.wejscia[v].items():
+            self.dol.append((v, u, c, d, s))
+            del self.wyjscia[u][v]
+            self.usuniete_sasiedzi[u] += 1
+        self.wyjscia[v] = {}
+        self.wejscia[v] = {}
+        for u, w, c, d in skroty:
+            if c < self.wyjscia[u].get(w, (inf,))[0]:
+                self.wyjscia[u][w] = (c, d, v)
+                self.wejscia[w][u] = (c, d, v)
+
+    def uruchom(self, n):
+        kolejka = [(self.priorytet(v, self.skroty(v)), v) for v in range(n)]
+        heapq.heapify(kolejka)
+        while kolejka:
+            _, v = heapq.heappop(kolejka)
+            skroty = self.skroty(v)
+            priorytet = self.priorytet(v, skroty)
+            # leniwa aktualizacja: priorytet mógł wzrosnąć po kontrakcji sąsiadów
+            if kolejka and priorytet > kolejka[0][0]:
+                heapq.heappush(kolejka, (priorytet, v))
+                continue
+            self.kontrakcja(v, skroty)
+
+
+def _zapisz_csr(krawedzie, n, prefiks, nazwa_drugiego, katalog):
+    tablica = np.array(krawedzie, dtype=float).reshape(-1, 5)
+    wezly = tablica[:, 0].astype(np.int64)
+    kolejnosc = np.argsort(wezly, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(wezly, minlength=n), out=indptr[1:])
+    tablica = tablica[kolejnosc]
+    np.save(os.path.join(katalog, f'{prefiks}_indptr.npy'), indptr)
+    np.save(os.path.join(katalog, f'{prefiks}_{nazwa_drugiego}.npy'), tablica[:, 1].astype(np.int32))
+    np.save(os.path.join(katalog, f'{prefiks}_czas.npy'), tablica[:, 2].astype(np.float32))
+    np.save(os.path.join(katalog, f'{prefiks}_dystans.npy'), tablica[:, 3].astype(np.float32))
+    np.save(os.path.join(katalog, f'{prefiks}_srodek.npy'), tablica[:, 4].astype(np.int32))
+
+
+def _klucze_siatki(lat, lon):
+    return (np.floor(np.asarray(lat) / ROZMIAR_OCZKA).astype(np.int64) + 20_000) * 100_000 + \
+        (np.floor(np.asarray(lon) / ROZMIAR_OCZKA).astype(np.int64) + 20_000)
+
+
+def zbuduj_graf(z, do, czasy, dystanse, lat, lon, katalog):
+    """Kontrakcja i zapis grafu; węzły muszą być numerowane 0..n-1 zgodnie z lat/lon."""
+    n = len(lat)
+    os.makedirs(katalog, exist_ok=True)
+    start = time.perf_counter()
+    kontrakcja = _Kontrakcja(n, z, do, czasy, dystanse)
+    kontrakcja.uruchom(n)
+    print(f"Kontrakcja {n} węzłów: {time.perf_counter() - start:.1f}s, "
+          f"{len(kontrakcja.gora) + len(kontrakcja.dol)} krawędzi w hierarchii (było {len(z)})")
+
+    _zapisz_csr(kontrakcja.gora, n, 'gora', 'cel', katalog)
+    _zapisz_csr(kontrakcja.dol, n, 'dol', 'zrodlo', katalog)
+    np.save(os.path.join(katalog, 'lat.npy'), np.asarray(lat, dtype=np.float32))
+    np.save(os.path.join(katalog, 'lon.npy'), np.asarray(lon, dtype=np.float32))
+    klucze = _klucze_siatki(lat, lon)
+    kolejnosc = np.argsort(klucze, kind='stable')
+    np.save(os.path.join(katalog, 'siatka_klucze.npy'), klucze[kolejnosc])
+    np.save(os.path.join(katalog, 'siatka_wezly.npy'), kolejnosc.astype(np.int32))
+
+
+def zbuduj_z_osm(sciezka_osm, katalog):
+    start = time.perf_counter()
+    z, do, czasy, dystanse, lat, lon = wczytaj_osm(sciezka_osm)
+    print(f"OSM: {len(z)} krawędzi skierowanych w {time.perf_counter() - start:.1f}s")
+
+    # numeracja tylko węzłów leżących na drogach, potem największa silnie spójna składowa
+    uzyte, nowe = np.unique(np.concatenate((z, do)), return_inverse=True)
+    z, do = nowe[:len(z)], nowe[len(z):]
+    maska = najwieksza_silnie_spojna(z, do, len(uzyte))
+    nowy_numer = np.cumsum(maska) - 1
+    krawedzie = maska[z] & maska[do]
+    print(f"Składowa silnie spójna: {int(maska.sum())} z {len(uzyte)} węzłów")
+    zbuduj_graf(nowy_numer[z[krawedzie]], nowy_numer[do[krawedzie]], czasy[krawedzie], dystanse[krawedzie],
+                lat[uzyte][maska], lon[uzyte][maska], katalog)
+
+
+class GrafDrogowy:
+    """Zapytania na zbudowanym grafie; tablice są mapowane z plików .npy (mmap_mode='r')."""
+
+    def __init__(self, katalog, predkosc_dojazdu_kmh=20, max_odleglosc_m=1000):
+        for nazwa in PLIKI:
+            # widok ndarray na mapowanym pliku: te same strony pamięci, ale szybsze wycinki niż np.memmap
+            setattr(self, nazwa, np.load(os.path.join(katalog, f'{nazwa}.npy'), mmap_mode='r').view(np.ndarray))
+        self.predkosc_dojazdu_ms = predkosc_dojazdu_kmh / 3.6
+        self.max_odleglosc_m = max_odleglosc_m
+
+    @property
+    def liczba_wezlow(self):
+        return len(self.lat)
+
+    def przyciagnij(self, lat, lon):
+        """Najbliższe węzły grafu i odległości do nich w metrach (None, gdy punkt jest za daleko)."""
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        zasieg = int(np.ceil(self.max_odleglosc_m / 111_000 / ROZMIAR_OCZKA / np.cos(np.radians(55))))
+        wezly = np.empty(len(lat), dtype=np.int64)
+        odleglosci = np.empty(len(lat))
+        for i, (la, lo) in enumerate(zip(lat.tolist(), lon.tolist())):
+            i_lat, i_lon = int(np.floor(la / ROZMIAR_OCZKA)), int(np.floor(lo / ROZMIAR_OCZKA))
+            kandydaci = []
+            for d_lat in range(-zasieg, zasieg + 1):
+                pierwszy = (i_lat + d_lat + 20_000) * 100_000 + i_lon + 20_000
+                od, do = np.searchsorted(self.siatka_klucze, [pierwszy - zasieg, pierwszy + zasieg + 1])
+                if do > od:
+                    kandydaci.append(self.siatka_wezly[od:do])
+            if not kandydaci:
+                return None, None
+            kandydaci = np.concatenate(kandydaci)
+            dystanse = haversine(la, lo, self.lat[kandydaci], self.lon[kandydaci])
+            najblizszy = int(np.argmin(dystanse))
+            if dystanse[najblizszy] > self.max_odleglosc_m:
+                return None, None
+            wezly[i] = kandydaci[najblizszy]
+            odleglosci[i] = dystanse[najblizszy]
+        return wezly, odleglosci
+
+    def _w_gore(self, start, wstecz=False, rodzice=None):
+        """Dijkstra po krawędziach do węzłów wyżej w hierarchii; zwraca {węzeł: (czas, dystans)}."""
+        if wstecz:
+            indptr, sasiedzi, czasy, dystanse, srodki = \
+                self.dol_indptr, self.dol_zrodlo, self.dol_czas, self.dol_dystans, self.dol_srodek
+        else:
+            indptr, sasiedzi, czasy, dystanse, srodki = \
+                self.gora_indptr, self.gora_cel, self.gora_czas, self.gora_dystans, self.gora_srodek
+        osiadle = {}
+        najlepsze = {start: 0.0}
+        kolejka = [(0.0, 0.0, start)]
+        while kolejka:
+            c, d, u = heapq.heappop(kolejka)
+            if u in osiadle:
+                continue
+            osiadle[u] = (c, d)
+            od, do = int(indptr[u]), int(indptr[u + 1])
+            for v, cv, dv, s in zip(sasiedzi[od:do].tolist(), czasy[od:do].tolist(),
+                                    dystanse[od:do].tolist(), srodki[od:do].tolist()):
+                nc = c + cv
+                if v not in osiadle and nc < najlepsze.get(v, inf):
+                    najlepsze[v] = nc
+                    heapq.heappush(kolejka, (nc, d + dv, v))
+                    if rodzice is not None:
+                        rodzice[v] = (u, s)
+        return osiadle
+
+    def macierz(self, lat, lon):
+        """Macierze czasów (s) i dystansów (m) dla punktów; (None, None) gdy któregoś nie da się obsłużyć."""
+        wezly, dojazdy = self.przyciagnij(lat, lon)
+        if wezly is None:
+            return None, None
+        n = len(wezly)
+
+        # kubełki: dla każdego celu j węzły jego wstecznej przestrzeni przeszukiwania, posortowane po j
+        kubelki = [[], [], [], []]  # węzeł, j, czas, dystans
+        for j, t in enumerate(wezly.tolist()):
+            przestrzen = self._w_gore(t, wstecz=True)
+            kubelki[0].extend(przestrzen)
+            kubelki[1].extend([j] * len(przestrzen))
+            for c, d in przestrzen.values():
+                kubelki[2].append(c)
+                kubelki[3].append(d)
+        kub_wezel, kub_j = np.asarray(kubelki[0]), np.asarray(kubelki[1])
+        kub_czas, kub_dystans = np.asarray(kubelki[2]), np.asarray(kubelki[3])
+        poczatki = np.searchsorted(kub_j, np.arange(n))
+        liczebnosci = np.diff(np.append(poczatki, len(kub_j)))
+
+        czasy = np.empty((n, n))
+        dystanse = np.empty((n, n))
+        koszt = np.full(self.liczba_wezlow, inf)
+        droga = np.zeros(self.liczba_wezlow)
+        for i, s in enumerate(wezly.tolist()):
+            przestrzen = self._w_gore(s)
+            osiadle = np.fromiter(przestrzen, dtype=np.int64, count=len(przestrzen))
+            wartosci = np.array(list(przestrzen.values()))
+            koszt[osiadle] = wartosci[:, 0]
+            droga[osiadle] = wartosci[:, 1]
+
+            # spotkania w przestrzeniach obu przeszukiwań; minimum po kubełkach każdego celu
+            przez = koszt[kub_wezel] + kub_czas
+            najlepsze = np.minimum.reduceat(przez, poczatki)
+            pozycje = np.flatnonzero(przez == np.repeat(najlepsze, liczebnosci))
+            pozycje = pozycje[np.searchsorted(pozycje, poczatki)]
+            czasy[i] = najlepsze
+            dystanse[i] = droga[kub_wezel[pozycje]] + kub_dystans[pozycje]
+            koszt[osiadle] = inf
+
+        if np.isinf(czasy).any():
+            return None, None
+        # dojazd od punktu do najbliższego węzła drogi i z węzła do punktu
+        dojazd = dojazdy[:, None] + dojazdy[None, :]
+        dystanse += dojazd
+        czasy += dojazd / self.predkosc_dojazdu_ms
+        np.fill_diagonal(czasy, 0.0)
+        np.fill_diagonal(dystanse, 0.0)
+        return czasy, dystanse
+
+    def _srodek(self, indptr, sasiedzi, srodki, wezel, sasiad):
+        od, do = int(indptr[wezel]), int(indptr[wezel + 1])
+        pozycja = sasiedzi[od:do].tolist().index(sasiad)
+        return int(srodki[od + pozycja])
+
+    def _rozwin(self, u, w, srodek, wynik):
+        """Dopisuje do wyniku węzły krawędzi u -> w (bez u), rozwijając skróty."""
+        stos = [(u, w, srodek)]
+        while stos:
+            a, b, m = stos.pop()
+            if m < 0:
+                wynik.append(b)
+                continue
+            # a -> m jest zapisane przy m jako krawędź z góry (dol), m -> b jako krawędź w górę (gora)
+            stos.append((m, b, self._srodek(self.gora_indptr, self.gora_cel, self.gora_srodek, m, b)))
+            stos.append((a, m, self._srodek(self.dol_indptr, self.dol_zrodlo, self.dol_srodek, m, a)))
+
+    def sciezka(self, s, t):
+        """Węzły najszybszej drogi s -> t (dwukierunkowe przeszukiwanie CH) albo None."""
+        if s == t:
+            return [s]
+        rodzice_wprzod, rodzice_wstecz = {}, {}
+        wprzod = self._w_gore(s, rodzice=rodzice_wprzod)
+        wstecz = self._w_gore(t, wstecz=True, rodzice=rodzice_wstecz)
+        spotkanie = min((v for v in wprzod if v in wstecz), key=lambda v: wprzod[v][0] + wstecz[v][0], default=None)
+        if spotkanie is None:
+            return None
+
+        krawedzie = []
+        v = spotkanie
+        while v != s:
+            u, srodek = rodzice_wprzod[v]
+            krawedzie.append((u, v, srodek))
+            v = u
+        krawedzie.reverse()
+        v = spotkanie
+        while v != t:
+            w, srodek = rodzice_wstecz[v]
+            krawedzie.append((v, w, srodek))
+            v = w
+
+        wynik = [s]
+        for u, w, srodek in krawedzie:
+            self._rozwin(u, w, srodek, wynik)
+        return wynik
+
+    def geometria(self, punkty):
+        """GeoJSON LineString przez kolejne punkty {'lat', 'lon'} albo None."""
+        wezly, _ = self.przyciagnij([p['lat'] for p in punkty], [p['lon'] for p in punkty])
+        if wezly is None:
+            return None
+        przebieg = [int(wezly[0])]
+        for s, t in zip(wezly[:-1].tolist(), wezly[1:].tolist()):
+            odcinek = self.sciezka(s, t)
+            if odcinek is None:
+                return None
+            przebieg.extend(odcinek[1:])
+        lon = np.round(self.lon[przebieg].astype(float), 6)
+        lat = np.round(self.lat[przebieg].astype(float), 6)
+        return {"type": "LineString", "coordinates": np.column_stack((lon, lat)).tolist()}
+
+
+_grafy = {}
+_lock = threading.Lock()
+
+
+def wczytaj_graf(katalog, **ustawienia):
+    """Graf z katalogu, otwierany raz na proces."""
+    with _lock:
+        klucz = (os.getpid(), katalog)
+        if klucz not in _grafy:
+            _grafy[klucz] = GrafDrogowy(katalog, **ustawienia)
+        return _grafy[klucz]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('osm', help='wyciąg OSM XML (.osm, .osm.bz2, .osm.gz)')
+    parser.add_argument('katalog', help='katalog wynikowy (ROUTING_GRAPH_DIR)')
+    args = parser.parse_args()
+    zbuduj_z_osm(args.osm, args.katalog)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""Masowy import punktów dostaw i pojazdów z plików CSV lub GeoJSON.
+
+CSV jest czytany kawałkami (pandas, chunksize), walidacja działa na całych
+kolumnach naraz, a poprawne wiersze trafiają do bazy wsadowym INSERT w jednej
+transakcji. Wynikiem jest raport z błędami dla każdego odrzuconego wiersza.
+"""
+import csv
+import io
+import json
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, select
+
+from models import db, PunktDostawy, Pojazd, WZOR_TABLICY
+
+WZOR_GODZINY = r"^(?:[01][0-9]|2[0-3]):[0-5][0-9]$"
+TYPY_PUNKTOW = ('HUB', 'DELIVERY')
+
+KOLUMNY_PUNKTOW = ['nazwa', 'typ', 'waga', 'lat', 'lon', 'okno_od', 'okno_do']
+KOLUMNY_POJAZDOW = ['numer_rejestracyjny', 'pojemnosc', 'lat', 'lon', 'dostepnosc']
+
+ROZMIAR_KAWALKA = 5000
+
+
+class BladImportu(Exception):
+    pass
+
+
+def _kawalki(plik, nazwa_pliku, kolumny):
+    """Zwraca kolejne DataFrame'y z pliku; numer wiersza w pliku jest w indeksie."""
+    if nazwa_pliku.lower().endswith(('.geojson', '.json')):
+        try:
+            dane = json.load(io.TextIOWrapper(plik, encoding='utf-8-sig'))
+        except ValueError:
+            raise BladImportu('Nieprawidłowy plik GeoJSON.')
+        if not isinstance(dane, dict) or dane.get('type') != 'FeatureCollection':
+            raise BladImportu('Plik GeoJSON musi zawierać FeatureCollection.')
+
+        # GeoJSON to jeden dokument, więc czytamy go w całości, a dzielimy dopiero cechy
+        cechy = dane.get('features') or []
+        if not isinstance(cechy, list):
+            raise BladImportu('Pole features w GeoJSON musi być listą.')
+        for start in range(0, len(cechy), ROZMIAR_KAWALKA):
+            wiersze = []
+            for nr, cecha in enumerate(cechy[start:start + ROZMIAR_KAWALKA], start + 1):
+                if not isinstance(cecha, dict):
+                    raise BladImportu(f'Cecha {nr} w GeoJSON nie jest obiektem.')
+                wlasciwosci = cecha.get('properties')
+                wiersz = dict(wlasciwosci) if isinstance(wlasciwosci, dict) else {}
+                geometria = cecha.get('geometry')
+                if not isinstance(geometria, dict) or geometria.get('type') != 'Point':
+                    geometria = {}
+                wspolrzedne = geometria.get('coordinates')
+                if isinstance(wspolrzedne, list) and len(wspolrzedne) >= 2:
+                    wiersz['lon'], wiersz['lat'] = wspolrzedne[:2]
+                wiersze.append(wiersz)
+            kawalek = pd.DataFrame(wiersze, columns=kolumny, dtype=object)
+            kawalek.index = np.arange(start + 1, start + 1 + len(kawalek))  # numer cechy od 1
+            yield kawalek
+        return
+
+    try:
+        czytnik = pd.read_csv(io.TextIOWrapper(plik, encoding='utf-8-sig'), dtype=str, sep=None,
+                              engine='python', chunksize=ROZMIAR_KAWALKA, skipinitialspace=True)
+        for kawalek in czytnik:
+            kawalek.columns = [k.strip().lower() for k in kawalek.columns]
+            kawalek = kawalek.reindex(columns=kolumny)
+            kawalek.index = kawalek.index + 2  # nagłówek to wiersz 1
+            yield kawalek
+    except pd.errors.EmptyDataError:
+        raise BladImportu('Plik CSV jest pusty.')
+    except (pd.errors.ParserError, csv.Error, UnicodeDecodeError) as e:
+        raise BladImportu(f'Nie udało się odczytać pliku CSV: {e}')
+
+
+def _tekst(seria):
+    return seria.astype(object).where(seria.notna(), '').astype(str).str.strip()
+
+
+class _Bledy:
+    """Zbiera komunikaty dla wierszy wskazanych maską."""
+
+    def __init__(self, kawalek):
+        self.kawalek = kawalek
+        self.komunikaty = {}
+
+    def dodaj(self, maska, komunikat):
+        for nr in self.kawalek.index[np.asarray(maska, dtype=bool)]:
+            self.komunikaty.setdefault(int(nr), []).append(komunikat)
+
+    def maska_poprawnych(self):
+        return ~self.kawalek.index.isin(list(self.komunikaty))
+
+
+def _waliduj_wspolrzedne(kawalek, bledy, granice):
+    min_lat, max_lat, min_lon, max_lon = granice
+    lat = pd.to_numeric(kawalek['lat'], errors='coerce')
+    lon = pd.to_numeric(kawalek['lon'], errors='coerce')
+    bledy.dodaj(lat.isna() | lon.isna(), 'Współrzędne muszą być liczbami.')
+    bledy.dodaj(lat.notna() & ~lat.between(min_lat, max_lat),
+                f'Szerokość (Lat) poza Polską! Wymagane: {min_lat} - {max_lat}')
+    bledy.dodaj(lon.notna() & ~lon.between(min_lon, max_lon),
+                f'Długość (Lon) poza Polską! Wymagane: {min_lon} - {max_lon}')
+    return lat, lon
+
+
+def _wkt(lat, lon):
+    return 'POINT(' + lon.astype(str) + ' ' + lat.astype(str) + ')'
+
+
+def _raport(dodane, bledy, limit):
+    odrzucone = [{'wiersz': nr, 'bledy': komunikaty} for nr, komunikaty in sorted(bledy.items())]
+    return {
+        'success': True,
+        'dodane': dodane,
+        'odrzucone': len(odrzucone),
+        'bledy': odrzucone[:limit],
+        'bledy_obciete': len(odrzucone) > limit
+    }
+
+
+def importuj_punkty(plik, nazwa_pliku, id_zlecenia, granice, max_wierszy, limit_bledow=1000):
+    """Importuje punkty dostaw do zlecenia. Kolumny: nazwa, typ, waga, lat, lon, okno_od, okno_do."""
+    wszystkie_bledy = {}
+    dodane = 0
+    wierszy = 0
+
+    for kawalek in _kawalki(plik, nazwa_pliku, KOLUMNY_PUNKTOW):
+        wierszy += len(kawalek)
+        if wierszy > max_wierszy:
+            db.session.rollback()
+            raise BladImportu(f'Plik ma więcej niż {max_wierszy} wierszy.')
+
+        bledy = _Bledy(kawalek)
+        lat, lon = _waliduj_wspolrzedne(kawalek, bledy, granice)
+
+        nazwa = _tekst(kawalek['nazwa'])
+        bledy.dodaj(nazwa == '', 'Brak nazwy punktu.')
+        bledy.dodaj(nazwa.str.len() > 100, 'Nazwa dłuższa niż 100 znaków.')
+
+        typ = _tekst(kawalek['typ']).str.upper().replace('', 'DELIVERY')
+        bledy.dodaj(~typ.isin(TYPY_PUNKTOW), 'Typ musi być HUB albo DELIVERY.')
+
+        waga_tekst = _tekst(kawalek['waga'])
+        waga = pd.to_numeric(waga_tekst.replace('', '0'), errors='coerce')
+        bledy.dodaj(waga.isna(), 'Waga musi być liczbą.')
+        bledy.dodaj(waga < 0, 'Waga nie może być ujemna.')
+
+        okno_od = _tekst(kawalek['okno_od']).replace('', '08:00')
+        okno_do = _tekst(kawalek['okno_do']).replace('', '16:00')
+        poprawne_od = okno_od.str.match(WZOR_GODZINY)
+        poprawne_do = okno_do.str.match(WZOR_GODZINY)
+        bledy.dodaj(~poprawne_od | ~poprawne_do, 'Okno czasowe musi mieć format GG:MM.')
+        # przy formacie GG:MM porównanie tekstowe jest porównaniem godzin
+        bledy.dodaj(poprawne_od & poprawne_do & (okno_od >= okno_do), 'Okno czasowe: "od" musi być przed "do".')
+
+        maska = bledy.maska_poprawnych()
+        wszystkie_bledy.update(bledy.komunikaty)
+        if not maska.any():
+            continue
+
+        wiersze = pd.DataFrame({
+            'id_zlecenia': id_zlecenia,
+            'nazwa': nazwa[maska],
+            'typ': typ[maska],
+            'waga': waga[maska].astype(float),
+            'okno_od': okno_od[maska],
+            'okno_do': okno_do[maska],
+            'lokalizacja': _wkt(lat[maska], lon[maska])
+        }).to_dict('records')
+        db.session.execute(insert(PunktDostawy.__table__), wiersze)
+        dodane += len(wiersze)
+
+    db.session.commit()
+    return _raport(dodane, wszystkie_bledy, limit_bledow)
+
+
+def importuj_pojazdy(plik, nazwa_pliku, id_uzytkownika, granice, max_wierszy, limit_bledow=1000):
+    """Importuje pojazdy użytkownika. Kolumny: numer_rejestracyjny, pojemnosc, lat, lon, dostepnosc."""
+    wszystkie_bledy = {}
+    dodane = 0
+    wierszy = 0
+    widziane_numery = set()
+
+    for kawalek in _kawalki(plik, nazwa_pliku, KOLUMNY_POJAZDOW):
+        wierszy += len(kawalek)
+        if wierszy > max_wierszy:
+            db.session.rollback()
+            raise BladImportu(f'Plik ma więcej niż {max_wierszy} wierszy.')
+
+        bledy = _Bledy(kawalek)
+        lat, lon = _waliduj_wspolrzedne(kawalek, bledy, granice)
+
+        numer = _tekst(kawalek['numer_rejestracyjny']).str.upper()
+        poprawny_numer = numer.str.match(WZOR_TABLICY)
+        bledy.dodaj(~poprawny_numer, 'Nieprawidłowy format tablicy (używaj tylko liter i cyfr).')
+
+        pojemnosc = pd.to_numeric(kawalek['pojemnosc'], errors='coerce')
+        bledy.dodaj(pojemnosc.isna(), 'Pojemność musi być liczbą.')
+        bledy.dodaj(pojemnosc <= 0, 'Pojemność musi być większa od 0.')
+
+        dostepnosc = ~_tekst(kawalek['dostepnosc']).str.lower().isin(['0', 'false', 'nie', 'n', 'no'])
+
+        # duplikaty w pliku (także z wcześniejszych kawałków) i w bazie, jednym zapytaniem
+        bledy.dodaj(poprawny_numer & (numer.duplicated() | numer.isin(widziane_numery)),
+                    'Numer rejestracyjny powtarza się w pliku.')
+        istniejace = set(db.session.execute(
+            select(Pojazd.numer_rejestracyjny)
+            .where(Pojazd.numer_rejestracyjny.in_(numer[poprawny_numer].unique().tolist()))
+        ).scalars())
+        bledy.dodaj(numer.isin(istniejace), 'Pojazd o takiej rejestracji już istnieje!')
+        widziane_numery.update(numer[poprawny_numer])
+
+        maska = bledy.maska_poprawnych()
+        wszystkie_bledy.update(bledy.komunikaty)
+        if not maska.any():
+            continue
+
+        wiersze = pd.DataFrame({
+            'numer_rejestracyjny': numer[maska],
+            'pojemnosc': pojemnosc[maska].astype(float),
+            'dostepnosc': dostepnosc[maska].astype(bool),
+            'id_uzytkownika': id_uzytkownika,
+            'lokalizacja': _wkt(lat[maska], lon[maska])
+        }).to_dict('records')
+        db.session.execute(insert(Pojazd.__table__), wiersze)
+        dodane += len(wiersze)
+
+    db.session.commit()
+    return _raport(dodane, wszystkie_bledy, limit_bledow)
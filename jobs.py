@@ -0,0 +1,411 @@
+import multiprocessing
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import Flask, current_app
+from sqlalchemy import update
+
+import metryki
+from cache_rozwiazan import cache_rozwiazan, klucz_instancji, kanoniczne_rozwiazanie, odtworz_rozwiazanie
+from models import db, Zlecenie, ZadanieOptymalizacji, wczytaj_dane_zlecenia, zapisz_trasy
+
+STATUSY_AKTYWNE = ('oczekuje', 'trwa')
+
+
+class KolejkaPelna(Exception):
+    pass
+
+
+class KolejkaOptymalizacji:
+    """Uruchamia optymalizacje zleceń w osobnych procesach, poza workerem WWW."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_procesow = 2
+        self.max_kolejka = 20
+        self.limit_zadania_s = 3600
+        self._executor = None
+        self._pid = None
+        self._futures = {}
+        self._w_toku = {}      # skrót instancji -> id liczącego ją zadania
+        self._skroty = {}      # id zadania -> skrót instancji
+        self._dolaczone = {}   # id zadania -> id zadań czekających na jego wynik
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_procesow = app.config.get('OPT_MAX_WORKERS', self.max_procesow)
+        self.max_kolejka = app.config.get('OPT_MAX_QUEUE', self.max_kolejka)
+        self.limit_zadania_s = app.config.get('OPT_JOB_TIMEOUT', self.limit_zadania_s)
+        app.extensions['kolejka_optymalizacji'] = self
+
+        # zadania osierocone przez restart serwera: ich futures istniały tylko w pamięci procesu
+        with app.app_context():
+            try:
+                liczba = self.odzyskaj_porzucone()
+                db.session.commit()
+                if liczba:
+                    print(f"Oznaczono {liczba} porzuconych zadań optymalizacji jako błąd")
+            except Exception as e:
+                db.session.rollback()
+                print(f"Nie udało się sprawdzić porzuconych zadań optymalizacji: {e}")
+
+    def _pula(self):
+        # pula jest tworzona leniwie i osobno w każdym procesie (np. po fork serwera WSGI)
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_procesow,
+                mp_context=multiprocessing.get_context('spawn'))
+            self._pid = os.getpid()
+            self._futures = {}
+            self._w_toku, self._skroty, self._dolaczone = {}, {}, {}
+        return self._executor
+
+    def _konfiguracja(self):
+        return {k: v for k, v in self.app.config.items()
+                if k.isupper() and isinstance(v, (str, int, float, bool, type(None), dict))}
+
+    def aktywne_zadanie(self, id_zlecenia):
+        return ZadanieOptymalizacji.query.filter(
+            ZadanieOptymalizacji.id_zlecenia == id_zlecenia,
+            ZadanieOptymalizacji.status.in_(STATUSY_AKTYWNE)
+        ).order_by(ZadanieOptymalizacji.data_utworzenia.desc()).first()
+
+    def odzyskaj_porzucone(self, id_zlecenia=None):
+        """Oznacza jako 'blad' aktywne zadania, których proces już nie żyje albo starsze niż
+        OPT_JOB_TIMEOUT; zwraca ich liczbę. Bez commita.
+        """
+        zapytanie = ZadanieOptymalizacji.query.filter(ZadanieOptymalizacji.status.in_(STATUSY_AKTYWNE))
+        if id_zlecenia is not None:
+            zapytanie = zapytanie.filter(ZadanieOptymalizacji.id_zlecenia == id_zlecenia)
+        granica = datetime.utcnow() - timedelta(seconds=self.limit_zadania_s)
+
+        liczba = 0
+        for zadanie in zapytanie.all():
+            if zadanie.data_utworzenia is not None and zadanie.data_utworzenia < granica:
+                komunikat = 'Przekroczono limit czasu zadania.'
+            elif not _wlasciciel_zyje(zadanie.wlasciciel):
+                komunikat = 'Proces obsługujący zadanie zakończył się (restart serwera albo awaria).'
+            else:
+                continue
+            # warunkowo, jak w anuluj: zadanie mogło się właśnie zakończyć
+            liczba += db.session.execute(
+                update(ZadanieOptymalizacji)
+                .where(ZadanieOptymalizacji.id == zadanie.id, ZadanieOptymalizacji.status.in_(STATUSY_AKTYWNE))
+                .values(status='blad', komunikat=komunikat, data_zakonczenia=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        return liczba
+
+    def zglos(self, zlecenie, id_uzytkownika, parametry):
+        """Tworzy zadanie optymalizacji i zwraca je od razu, bez czekania na wynik.
+
+        Instancja znana z cache rozwiązań jest zapisywana od razu (zadanie wraca jako
+        'zakonczone'), a identyczna instancja liczona właśnie w tym procesie nie jest
+        liczona drugi raz: zadanie czeka na wynik tamtej optymalizacji.
+        """
+        # blokada wiersza zlecenia do commitu nowego zadania: dwa równoczesne zgłoszenia
+        # tego samego zlecenia widzą się nawzajem w aktywne_zadanie
+        db.session.get(Zlecenie, zlecenie.id, with_for_update=True, populate_existing=True)
+        self.odzyskaj_porzucone(zlecenie.id)
+        istniejace = self.aktywne_zadanie(zlecenie.id)
+        if istniejace:
+            db.session.commit()
+            return istniejace
+
+        klucz = klucz_zlecenia(zlecenie, parametry, self.app.config)
+        if klucz is not None:
+            parametry = {**parametry, 'hash_instancji': klucz['skrot']}
+            rozwiazanie = cache_rozwiazan.pobierz(klucz['skrot'])
+            if rozwiazanie is not None:
+                zadanie = self._nowe_zadanie(zlecenie, id_uzytkownika, parametry)
+                _zastosuj_rozwiazanie(zadanie, zlecenie, klucz, rozwiazanie)
+                return zadanie
+
+        with self._lock:
+            wiodace = self._w_toku.get(klucz['skrot']) if klucz else None
+            if wiodace is None:
+                oczekujace = sum(1 for f in self._futures.values() if not f.done())
+                if oczekujace >= self.max_procesow + self.max_kolejka:
+                    db.session.rollback()
+                    raise KolejkaPelna('Kolejka optymalizacji jest pełna, spróbuj za chwilę.')
+
+            zadanie = self._nowe_zadanie(zlecenie, id_uzytkownika, parametry)
+            if wiodace is not None:
+                self._dolaczone.setdefault(wiodace, []).append(zadanie.id)
+                cache_rozwiazan.polaczono()
+            else:
+                self._uruchom(zadanie.id, klucz['skrot'] if klucz else None)
+        return zadanie
+
+    def _nowe_zadanie(self, zlecenie, id_uzytkownika, parametry):
+        zadanie = ZadanieOptymalizacji(
+            id=str(uuid.uuid4()),
+            id_zlecenia=zlecenie.id,
+            id_uzytkownika=id_uzytkownika,
+            status='oczekuje',
+            parametry=parametry,
+            wlasciciel=_wlasciciel()
+        )
+        db.session.add(zadanie)
+        db.session.commit()
+        return zadanie
+
+    def _uruchom(self, id_zadania, skrot):
+        """Wysyła zadanie do puli; wywoływane pod self._lock."""
+        future = self._pula().submit(wykonaj_zadanie, self._konfiguracja(), id_zadania)
+        self._futures[id_zadania] = future
+        if skrot:
+            self._w_toku[skrot] = id_zadania
+            self._skroty[id_zadania] = skrot
+        future.add_done_callback(lambda f, id_zadania=id_zadania: self._po_zakonczeniu(id_zadania, f))
+
+    def _po_zakonczeniu(self, id_zadania, future):
+        with self._lock:
+            self._futures.pop(id_zadania, None)
+            skrot = self._skroty.pop(id_zadania, None)
+            if skrot and self._w_toku.get(skrot) == id_zadania:
+                del self._w_toku[skrot]
+            dolaczone = self._dolaczone.pop(id_zadania, [])
+
+        if not future.cancelled():
+            if future.exception() is None:
+                wynik = future.result()
+                metryki.rejestr.scal(wynik['metryki'])
+                if wynik['rozwiazanie'] is not None:
+                    cache_rozwiazan.zapisz(wynik['skrot'], wynik['rozwiazanie'])
+            else:
+                # proces roboczy padł, zanim sam zapisał status
+                with self.app.app_context():
+                    zadanie = db.session.get(ZadanieOptymalizacji, id_zadania)
+                    if zadanie and zadanie.status in STATUSY_AKTYWNE:
+                        zadanie.status = 'blad'
+                        zadanie.komunikat = str(future.exception())
+                        zadanie.data_zakonczenia = datetime.utcnow()
+                        db.session.commit()
+
+        if dolaczone:
+            with self.app.app_context():
+                for id_dolaczonego in dolaczone:
+                    self._obsluz_dolaczone(id_dolaczonego)
+
+    def _obsluz_dolaczone(self, id_zadania):
+        """Zadanie czekające na identyczną instancję: wynik z cache albo własne obliczenia."""
+        try:
+            zadanie = db.session.get(ZadanieOptymalizacji, id_zadania)
+            if zadanie is None or zadanie.status != 'oczekuje':
+                return
+            zlecenie = db.session.get(Zlecenie, zadanie.id_zlecenia)
+            if zlecenie is None:
+                _zakoncz(zadanie, 'blad', 'Zlecenie zostało usunięte.')
+                return
+
+            # punkty mogły się zmienić w czasie oczekiwania, więc skrót liczymy od nowa
+            klucz = klucz_zlecenia(zlecenie, zadanie.parametry or {}, self.app.config)
+            rozwiazanie = cache_rozwiazan.pobierz(klucz['skrot']) if klucz else None
+            if rozwiazanie is not None:
+                _zastosuj_rozwiazanie(zadanie, zlecenie, klucz, rozwiazanie)
+                return
+
+            with self._lock:
+                wiodace = self._w_toku.get(klucz['skrot']) if klucz else None
+                if wiodace is not None:
+                    self._dolaczone.setdefault(wiodace, []).append(id_zadania)
+                else:
+                    self._uruchom(id_zadania, klucz['skrot'] if klucz else None)
+        except Exception as e:
+            db.session.rollback()
+            print(e)
+
+    def anuluj(self, zadanie):
+        # warunkowy UPDATE: zadanie zakończone w międzyczasie przez proces roboczy zostaje nietknięte
+        wynik = db.session.execute(
+            update(ZadanieOptymalizacji)
+            .where(ZadanieOptymalizacji.id == zadanie.id, ZadanieOptymalizacji.status.in_(STATUSY_AKTYWNE))
+            .values(status='anulowane', data_zakonczenia=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if wynik.rowcount == 0:
+            return False
+        # jeśli obliczenia już trwają, proces roboczy sprawdzi status przed zapisem tras
+        future = self._futures.get(zadanie.id)
+        if future is not None:
+            future.cancel()
+        return True
+
+
+def _wlasciciel():
+    # proces WWW, w którego pamięci są futures i kolejka dołączonych zadań
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _wlasciciel_zyje(wlasciciel):
+    """False tylko, gdy właściciel to proces z tego hosta, który już nie istnieje.
+
+    O procesach z innych hostów (i zadaniach bez właściciela) nie wiadomo nic;
+    te zwalnia dopiero limit czasu OPT_JOB_TIMEOUT.
+    """
+    host, _, pid = (wlasciciel or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_aplikacja_robocza = None
+
+
+def _aplikacja(konfiguracja):
+    global _aplikacja_robocza
+    if _aplikacja_robocza is None:
+        from matrix_cache import matrix_cache
+        from matrix_providers import matrix_providers
+        from kafelki import kafelki_mvt
+        import osrm
+
+        app = Flask(__name__)
+        app.config.update(konfiguracja)
+        db.init_app(app)
+        matrix_cache.init_app(app)
+        matrix_providers.init_app(app)
+        osrm.init_app(app)
+        kafelki_mvt.init_app(app)  # zapis tras unieważnia kafelki
+        _aplikacja_robocza = app
+    return _aplikacja_robocza
+
+
+def _zakoncz(zadanie, status, komunikat, statystyki=None):
+    zadanie.status = status
+    zadanie.komunikat = komunikat
+    zadanie.statystyki = statystyki
+    zadanie.data_zakonczenia = datetime.utcnow()
+    db.session.commit()
+
+
+def ustawienia_dekompozycji(config):
+    return {
+        'prog': config.get('SOLVER_DECOMP_THRESHOLD', 400),
+        'rozmiar_klastra': config.get('SOLVER_DECOMP_CLUSTER', 150),
+        'procesy': config.get('SOLVER_DECOMP_WORKERS'),
+        'poprawa': config.get('SOLVER_DECOMP_IMPROVE', True),
+    }
+
+
+def ustawienia_instancji(parametry, config):
+    """Ustawienia, od których zależy wynik optymalizacji (część skrótu instancji)."""
+    return {
+        'provider': parametry.get('provider') or config.get('MATRIX_PROVIDER', 'osrm'),
+        'profil': parametry.get('profil') or config.get('SOLVER_PROFILE', 'balanced'),
+        'plateau_s': config.get('SOLVER_PLATEAU_S'),
+        'dekompozycja': ustawienia_dekompozycji(config),
+    }
+
+
+def klucz_zlecenia(zlecenie, parametry, config, dane_punktow=None):
+    """Skrót instancji zlecenia (cache_rozwiazan.klucz_instancji) albo None, gdy brak HUBa lub pojazdów."""
+    if dane_punktow is None:
+        dane_punktow = wczytaj_dane_zlecenia(zlecenie.id)
+    pojazdy = zlecenie.dostepne_pojazdy
+    if dane_punktow is None or not pojazdy:
+        return None
+    return klucz_instancji(dane_punktow, pojazdy, ustawienia_instancji(parametry, config))
+
+
+def _zastosuj_rozwiazanie(zadanie, zlecenie, klucz, rozwiazanie):
+    """Zapisuje trasy z cache rozwiązań i kończy zadanie bez uruchamiania solvera."""
+    zapisz_trasy(zlecenie, odtworz_rozwiazanie(klucz, rozwiazanie, zlecenie.punkty, zlecenie.dostepne_pojazdy),
+                 zlecenie.punkty)
+    zadanie.data_rozpoczecia = datetime.utcnow()
+    _zakoncz(zadanie, 'zakonczone', 'OK (wynik z cache)', {'z_cache': True, 'hash_instancji': klucz['skrot']})
+
+
+def wykonaj_zadanie(konfiguracja, id_zadania):
+    """Uruchamiane w procesie roboczym.
+
+    Zwraca przyrost metryk procesu, który scala proces WWW, oraz kanoniczne
+    rozwiązanie ze skrótem instancji do cache rozwiązań (None, gdy nie ma czego zapamiętać).
+    """
+    skrot, rozwiazanie = _oblicz_zadanie(konfiguracja, id_zadania) or (None, None)
+    return {'metryki': metryki.rejestr.migawka(wyczysc=True), 'skrot': skrot, 'rozwiazanie': rozwiazanie}
+
+
+def _oblicz_zadanie(konfiguracja, id_zadania):
+    """Liczy trasy i zapisuje je jako obiekty Trasa; zwraca (skrót, rozwiązanie kanoniczne) albo None."""
+    from solver import przygotuj_punkty, solve_vrp_google, poprzednie_trasy_zlecenia
+
+    with _aplikacja(konfiguracja).app_context():
+        zadanie = db.session.get(ZadanieOptymalizacji, id_zadania)
+        if zadanie is None or zadanie.status != 'oczekuje':
+            return
+
+        zadanie.status = 'trwa'
+        zadanie.data_rozpoczecia = datetime.utcnow()
+        db.session.commit()
+
+        try:
+            zlecenie = db.session.get(Zlecenie, zadanie.id_zlecenia)
+            if zlecenie is None:
+                _zakoncz(zadanie, 'blad', 'Zlecenie zostało usunięte.')
+                return
+            if not zlecenie.dostepne_pojazdy:
+                _zakoncz(zadanie, 'blad', 'Przypisz pojazdy!')
+                return
+
+            punkty_sorted, blad = przygotuj_punkty(zlecenie)
+            if blad:
+                _zakoncz(zadanie, 'blad', blad)
+                return
+
+            parametry = zadanie.parametry or {}
+            poprzednie = poprzednie_trasy_zlecenia(zlecenie) if parametry.get('przyrostowo') else None
+
+            statystyki = {}
+            dane_punktow = wczytaj_dane_zlecenia(zlecenie.id)
+            wyniki_tras, komunikat = solve_vrp_google(
+                zlecenie, zlecenie.dostepne_pojazdy, punkty_sorted,
+                parametry.get('provider'), statystyki, poprzednie,
+                parametry.get('profil') or current_app.config.get('SOLVER_PROFILE', 'balanced'),
+                current_app.config.get('SOLVER_PLATEAU_S'), dane_punktow,
+                ustawienia_dekompozycji(current_app.config))
+
+            if not wyniki_tras:
+                _zakoncz(zadanie, 'blad', komunikat, statystyki)
+                return
+
+            # blokada wiersza, żeby równoległe anulowanie nie minęło się z zapisem
+            zadanie = db.session.get(ZadanieOptymalizacji, id_zadania, with_for_update=True, populate_existing=True)
+            if zadanie.status != 'trwa':  # anulowane albo odzyskane jako porzucone
+                db.session.rollback()
+                return
+
+            klucz = klucz_zlecenia(zlecenie, parametry, current_app.config, dane_punktow)
+            rozwiazanie = kanoniczne_rozwiazanie(klucz, wyniki_tras) if klucz else None
+
+            zapisz_trasy(zlecenie, wyniki_tras, punkty_sorted)
+            _zakoncz(zadanie, 'zakonczone', komunikat, statystyki)
+
+            # wynik z zapasowego źródła macierzy nie trafia do cache
+            if klucz and komunikat == 'OK':
+                return klucz['skrot'], rozwiazanie
+
+        except Exception as e:
+            db.session.rollback()
+            print(e)
+            zadanie = db.session.get(ZadanieOptymalizacji, id_zadania)
+            if zadanie is not None:
+                _zakoncz(zadanie, 'blad', f'Wyjątek: {str(e)}')
+
+
+kolejka_optymalizacji = KolejkaOptymalizacji()
@@ -0,0 +1,242 @@
+"""Kafelki wektorowe (Mapbox Vector Tiles) z PostGIS: pojazdy, punkty dostaw i trasy.
+
+Kafelek jest budowany jednym zapytaniem ST_AsMVT tylko z obiektów użytkownika,
+których geometria przecina kafelek (indeksy GIST na lokalizacjach i geometrii
+tras). Na małych przybliżeniach punkty są łączone w klastry po siatce
+ST_SnapToGrid (komórka = KAFELKI_KOMORKA_PX pikseli kafelka), a trasy używają
+uproszczonych geometrii (models.poziom_geometrii).
+
+Gotowe kafelki leżą na dysku w <katalog>/<warstwa>/<id_uzytkownika>/z/x/y.mvt,
+więc są wspólne dla wszystkich workerów. Po commicie zmieniającym pojazdy,
+zlecenia, punkty albo trasy usuwany jest katalog warstwy danego użytkownika;
+instrukcje masowe (insert/update/delete bez obiektów ORM) poza żądaniem HTTP
+czyszczą warstwę wszystkim użytkownikom.
+"""
+import os
+import shutil
+import time
+import uuid
+
+from flask import has_request_context
+from flask_login import current_user
+from sqlalchemy import event, select, text
+from sqlalchemy.orm import Session
+
+from models import db, Pojazd, Zlecenie, PunktDostawy, Trasa, poziom_geometrii
+
+ROZMIAR = 4096           # rozdzielczość współrzędnych kafelka MVT
+BUFOR = 64               # margines w jednostkach kafelka (linie i symbole na krawędzi)
+POLOWA_SWIATA_M = 20037508.342789244  # EPSG:3857
+MAX_ZOOM = 22
+
+# tabela -> warstwy, których kafelki się po niej zmieniają
+WARSTWY_TABEL = {
+    'pojazdy': ('pojazdy',),
+    'punkty_dostaw': ('punkty',),
+    'trasy': ('trasy',),
+    'zlecenia': ('punkty', 'trasy'),
+}
+WARSTWY = ('pojazdy', 'punkty', 'trasy')
+
+_KOPERTA = """
+WITH koperta AS (SELECT ST_TileEnvelope(:z, :x, :y) AS g),
+     zakres AS (SELECT g, ST_Transform(ST_Expand(g, :bufor_m), 4326) AS g4326 FROM koperta)
+"""
+
+ZAPYTANIA = {
+    'pojazdy': _KOPERTA + """
+, obiekty AS (
+    SELECT v.id_pojazdu, v.numer_rejestracyjny, v.pojemnosc, v.dostepnosc,
+           ST_Transform(v.lokalizacja, 3857) AS geom
+    FROM pojazdy v, zakres
+    WHERE v.id_uzytkownika = :uzytkownik AND v.lokalizacja && zakres.g4326
+)
+""",
+    'punkty': _KOPERTA + """
+, obiekty AS (
+    SELECT p.id, p.id_zlecenia, p.nazwa, p.typ, p.waga, p.okno_od, p.okno_do,
+           ST_Transform(p.lokalizacja, 3857) AS geom
+    FROM punkty_dostaw p
+    JOIN zlecenia z ON z.id = p.id_zlecenia, zakres
+    WHERE z.id_uzytkownika = :uzytkownik AND p.lokalizacja && zakres.g4326
+)
+""",
+}
+
+KLASTRY = {
+    'pojazdy': """
+SELECT count(*) AS liczba, count(*) FILTER (WHERE dostepnosc) AS dostepne,
+       ST_AsMVTGeom(ST_Centroid(ST_Collect(geom)), zakres.g, {rozmiar}, {bufor}, true) AS geom
+FROM obiekty, zakres
+GROUP BY ST_SnapToGrid(geom, :komorka_m), zakres.g
+""",
+    'punkty': """
+SELECT count(*) AS liczba, count(*) FILTER (WHERE typ = 'HUB') AS huby,
+       ST_AsMVTGeom(ST_Centroid(ST_Collect(geom)), zakres.g, {rozmiar}, {bufor}, true) AS geom
+FROM obiekty, zakres
+GROUP BY ST_SnapToGrid(geom, :komorka_m), zakres.g
+""",
+}
+
+POJEDYNCZE = {
+    'pojazdy': """
+SELECT id_pojazdu, numer_rejestracyjny, pojemnosc, dostepnosc,
+       ST_AsMVTGeom(geom, zakres.g, {rozmiar}, {bufor}, true) AS geom
+FROM obiekty, zakres
+""",
+    'punkty': """
+SELECT id, id_zlecenia, nazwa, typ, waga, okno_od, okno_do,
+       ST_AsMVTGeom(geom, zakres.g, {rozmiar}, {bufor}, true) AS geom
+FROM obiekty, zakres
+""",
+}
+
+TRASY = _KOPERTA + """
+SELECT t.id, t.id_zlecenia, t.id_pojazdu, v.numer_rejestracyjny, t.dlugosc, t.czas_przejazdu,
+       ST_AsMVTGeom(ST_Transform(coalesce({kolumna}, t.geometria_trasy), 3857), zakres.g, {rozmiar}, {bufor}, true) AS geom
+FROM trasy t
+JOIN zlecenia z ON z.id = t.id_zlecenia
+JOIN pojazdy v ON v.id_pojazdu = t.id_pojazdu, zakres
+WHERE z.id_uzytkownika = :uzytkownik AND t.geometria_trasy && zakres.g4326
+"""
+
+KOLUMNY_GEOMETRII = {'pelna': 't.geometria_trasy', 'srednia': 't.geometria_srednia', 'niska': 't.geometria_niska'}
+
+
+def poprawny_kafelek(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def zapytanie_kafelka(warstwa, z, max_zoom_klastrow):
+    """Treść SQL dla warstwy i przybliżenia (bez parametrów)."""
+    formaty = {'rozmiar': ROZMIAR, 'bufor': BUFOR}
+    if warstwa == 'trasy':
+        wiersze = TRASY.format(kolumna=KOLUMNY_GEOMETRII[poziom_geometrii(z)], **formaty)
+    else:
+        szablon = KLASTRY[warstwa] if z <= max_zoom_klastrow else POJEDYNCZE[warstwa]
+        wiersze = ZAPYTANIA[warstwa] + szablon.format(**formaty)
+    # wynik warstwy jako podzapytanie, bo CTE zakres jest potrzebne w środku
+    return f"SELECT coalesce(ST_AsMVT(w, '{warstwa}', {ROZMIAR}, 'geom'), ''::bytea) FROM ({wiersze}) AS w"
+
+
+class KafelkiMVT:
+    def __init__(self, app=None):
+        self.katalog = None
+        self.ttl = 3600
+        self.max_zoom_klastrow = 12
+        self.komorka_px = 64
+        self._zdarzenia = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.katalog = app.config.get('TILE_CACHE_DIR') or os.path.join(app.instance_path, 'kafelki')
+        self.ttl = app.config.get('TILE_CACHE_TTL', self.ttl)
+        self.max_zoom_klastrow = app.config.get('TILE_CLUSTER_MAX_ZOOM', self.max_zoom_klastrow)
+        self.komorka_px = app.config.get('TILE_CLUSTER_CELL_PX', self.komorka_px)
+        app.extensions['kafelki_mvt'] = self
+        if not self._zdarzenia:
+            event.listen(Session, 'after_flush', self._po_flush)
+            event.listen(Session, 'do_orm_execute', self._instrukcja)
+            event.listen(Session, 'after_commit', self._po_commit)
+            event.listen(Session, 'after_soft_rollback', self._po_rollback)
+            self._zdarzenia = True
+
+    # --- generowanie i cache ---
+
+    def _sciezka(self, warstwa, id_uzytkownika, z, x, y):
+        return os.path.join(self.katalog, warstwa, str(id_uzytkownika), str(z), str(x), f'{y}.mvt')
+
+    def kafelek(self, warstwa, z, x, y, id_uzytkownika):
+        """Bajty kafelka MVT (pusty kafelek to b'')."""
+        sciezka = self._sciezka(warstwa, id_uzytkownika, z, x, y)
+        if self.ttl > 0:
+            try:
+                if time.time() - os.path.getmtime(sciezka) <= self.ttl:
+                    with open(sciezka, 'rb') as plik:
+                        return plik.read()
+            except OSError:
+                pass
+
+        rozmiar_m = 2 * POLOWA_SWIATA_M / 2 ** z
+        dane = db.session.execute(text(zapytanie_kafelka(warstwa, z, self.max_zoom_klastrow)), {
+            'z': z, 'x': x, 'y': y,
+            'uzytkownik': id_uzytkownika,
+            'bufor_m': rozmiar_m * BUFOR / ROZMIAR,
+            'komorka_m': rozmiar_m * self.komorka_px / ROZMIAR,
+        }).scalar()
+        dane = bytes(dane or b'')
+
+        if self.ttl > 0:
+            try:
+                os.makedirs(os.path.dirname(sciezka), exist_ok=True)
+                tymczasowy = f'{sciezka}.{uuid.uuid4().hex}.tmp'
+                with open(tymczasowy, 'wb') as plik:
+                    plik.write(dane)
+                os.replace(tymczasowy, sciezka)
+            except OSError as e:
+                print(f"Nie udało się zapisać kafelka {sciezka}: {e}")
+        return dane
+
+    def uniewaznij(self, warstwa, id_uzytkownika=None):
+        """Usuwa kafelki warstwy użytkownika (None: wszystkich użytkowników)."""
+        katalog = os.path.join(self.katalog, warstwa)
+        if id_uzytkownika is not None:
+            katalog = os.path.join(katalog, str(id_uzytkownika))
+        if not os.path.isdir(katalog):
+            return
+        # najpierw zmiana nazwy (atomowa), żeby nikt nie czytał katalogu w trakcie kasowania
+        kosz = os.path.join(self.katalog, '.usuwane', uuid.uuid4().hex)
+        try:
+            os.makedirs(os.path.dirname(kosz), exist_ok=True)
+            os.rename(katalog, kosz)
+        except OSError:
+            return
+        shutil.rmtree(kosz, ignore_errors=True)
+
+    # --- unieważnianie po zmianach w sesji ---
+
+    def _oznacz(self, session, warstwy, id_uzytkownika):
+        zmiany = session.info.setdefault('kafelki_zmiany', set())
+        zmiany.update((warstwa, id_uzytkownika) for warstwa in warstwy)
+
+    def _po_flush(self, session, flush_context):
+        id_zlecen = set()
+        for obiekt in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obiekt, Pojazd):
+                self._oznacz(session, WARSTWY_TABEL['pojazdy'], obiekt.id_uzytkownika)
+            elif isinstance(obiekt, Zlecenie):
+                self._oznacz(session, WARSTWY_TABEL['zlecenia'], obiekt.id_uzytkownika)
+            elif isinstance(obiekt, (PunktDostawy, Trasa)):
+                id_zlecen.add(obiekt.id_zlecenia)
+        id_zlecen.discard(None)
+        if id_zlecen:
+            # punkty i trasy nie mają id użytkownika, więc jedno zapytanie o właścicieli zleceń
+            for id_uzytkownika in session.execute(
+                    select(Zlecenie.id_uzytkownika).where(Zlecenie.id.in_(id_zlecen)).distinct()).scalars():
+                self._oznacz(session, ('punkty', 'trasy'), id_uzytkownika)
+
+    def _instrukcja(self, orm_execute_state):
+        if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        tabela = getattr(orm_execute_state.statement, 'table', None)
+        warstwy = WARSTWY_TABEL.get(getattr(tabela, 'name', None))
+        if not warstwy:
+            return
+        zalogowany = has_request_context() and current_user.is_authenticated
+        self._oznacz(orm_execute_state.session, warstwy, current_user.id if zalogowany else None)
+
+    def _po_commit(self, session):
+        zmiany = session.info.pop('kafelki_zmiany', None)
+        if not zmiany or self.katalog is None:
+            return
+        for warstwa, id_uzytkownika in zmiany:
+            if id_uzytkownika is None or (warstwa, None) not in zmiany:
+                self.uniewaznij(warstwa, id_uzytkownika)
+
+    def _po_rollback(self, session, poprzednia_transakcja):
+        if poprzednia_transakcja.parent is None:
+            session.info.pop('kafelki_zmiany', None)
+
+
+kafelki_mvt = KafelkiMVT()
@@ -0,0 +1,228 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import has_app_context
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, OdcinekMacierzy
+
+PRECYZJA = 10 ** 5  # 5 miejsc po przecinku ~ 1 m
+PACZKA_ZAPISU = 5000
+
+
+def klucz_punktu(lon, lat):
+    return (int(round(lon * PRECYZJA)), int(round(lat * PRECYZJA)))
+
+
+def wspolrzedne_klucza(klucz):
+    return klucz[0] / PRECYZJA, klucz[1] / PRECYZJA
+
+
+def kody_kluczy(klucze):
+    """Klucze punktów jako jedna liczba int64 (|lat| < 2**30, więc kod jest jednoznaczny)."""
+    tablica = np.asarray(klucze, dtype=np.int64).reshape(-1, 2)
+    return tablica[:, 0] * (1 << 31) + tablica[:, 1]
+
+
+class WierszMacierzy:
+    """Pary z jednego punktu startowego: posortowane kody celów i wartości w tablicach NumPy.
+
+    Tablice są tylko podmieniane (nigdy zmieniane w miejscu), więc odczyt nie
+    wymaga blokady.
+    """
+    PUSTY = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0))
+
+    def __init__(self):
+        self.dane = self.PUSTY  # (cele, czasy, dystanse, czasy_zapisu)
+
+    def __len__(self):
+        return len(self.dane[0])
+
+    def znajdz(self, kody, granica):
+        """Zwraca (dane, pozycje, maska trafień) dla kodów celów; wpisy sprzed granicy to chybienia."""
+        dane = self.dane
+        cele, zapis = dane[0], dane[3]
+        if not len(cele):
+            return dane, None, np.zeros(len(kody), dtype=bool)
+        pozycje = np.minimum(np.searchsorted(cele, kody), len(cele) - 1)
+        return dane, pozycje, (cele[pozycje] == kody) & (zapis[pozycje] >= granica)
+
+    def dodaj(self, kody, czasy, dystanse, teraz, granica):
+        """Dopisuje pary (nowe nadpisują stare), przy okazji usuwa przeterminowane; zwraca zmianę rozmiaru."""
+        cele, stare_czasy, stare_dystanse, zapis = self.dane
+        kody, ostatnie = np.unique(kody[::-1], return_index=True)  # powtórzony cel: ostatnia wartość
+        ostatnie = len(czasy) - 1 - ostatnie
+        zostaw = (zapis >= granica) & ~np.isin(cele, kody)
+        cele = np.concatenate((cele[zostaw], kody))
+        kolejnosc = np.argsort(cele, kind='stable')
+        przed = len(self)
+        self.dane = (cele[kolejnosc],
+                     np.concatenate((stare_czasy[zostaw], czasy[ostatnie]))[kolejnosc],
+                     np.concatenate((stare_dystanse[zostaw], dystanse[ostatnie]))[kolejnosc],
+                     np.concatenate((zapis[zostaw], np.full(len(kody), teraz)))[kolejnosc])
+        return len(self) - przed
+
+
+class MacierzCache:
+    """Cache par punktów (czas, dystans): LRU w pamięci procesu + tabela w PostgreSQL.
+
+    Wpisy są rozdzielone według źródła (adresu serwera OSRM), bo różne serwery
+    mogą mieć różne dane i profile dróg. LRU trzyma całe wiersze (źródło, punkt
+    startowy), a pary w wierszu są wyszukiwane wektorowo, więc odczyt macierzy
+    n x n to n wyszukiwań NumPy, a nie n² operacji na słowniku pod blokadą.
+    """
+
+    def __init__(self, app=None):
+        self.max_rozmiar = 500_000
+        self.ttl = 7 * 24 * 3600
+        self._lru = OrderedDict()  # (źródło, klucz startu) -> WierszMacierzy
+        self._rozmiar = 0          # liczba par we wszystkich wierszach
+        self._lock = threading.Lock()
+        self.trafienia_pamiec = 0
+        self.trafienia_baza = 0
+        self.chybienia = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_rozmiar = app.config.get('MATRIX_CACHE_SIZE', self.max_rozmiar)
+        self.ttl = app.config.get('MATRIX_CACHE_TTL', self.ttl)
+        app.extensions['matrix_cache'] = self
+
+    def pobierz(self, zrodlo, klucze):
+        """Zwraca macierze czasów i dystansów źródła dla unikalnych kluczy; brakujące pary to NaN."""
+        n = len(klucze)
+        czasy = np.full((n, n), np.nan)
+        dystanse = np.full((n, n), np.nan)
+        np.fill_diagonal(czasy, 0.0)
+        np.fill_diagonal(dystanse, 0.0)
+
+        granica = time.time() - self.ttl
+        with self._lock:
+            wiersze = []
+            for a in klucze:
+                wiersz = self._lru.get((zrodlo, a))
+                if wiersz is not None:
+                    self._lru.move_to_end((zrodlo, a))
+                wiersze.append(wiersz)
+
+        trafienia = 0
+        kody = kody_kluczy(klucze)
+        for i, wiersz in enumerate(wiersze):
+            if wiersz is None:
+                continue
+            dane, pozycje, trafione = wiersz.znajdz(kody, granica)
+            trafione[i] = False
+            if not trafione.any():
+                continue
+            czasy[i, trafione] = dane[1][pozycje[trafione]]
+            dystanse[i, trafione] = dane[2][pozycje[trafione]]
+            trafienia += int(trafione.sum())
+        self.trafienia_pamiec += trafienia
+
+        brak = np.isnan(czasy)
+        if brak.any() and has_app_context():
+            trafienia_baza = self._pobierz_z_bazy(zrodlo, klucze, czasy, dystanse, brak)
+            self.trafienia_baza += trafienia_baza
+            trafienia += trafienia_baza
+
+        return czasy, dystanse, trafienia
+
+    def _pobierz_z_bazy(self, zrodlo, klucze, czasy, dystanse, brak):
+        wiersze, kolumny = np.nonzero(brak)
+        zrodla = {klucze[i] for i in set(wiersze.tolist())}
+        cele = {klucze[j] for j in set(kolumny.tolist())}
+        pozycje = {k: i for i, k in enumerate(klucze)}
+        granica = datetime.utcnow() - timedelta(seconds=self.ttl)
+
+        stmt = select(
+            OdcinekMacierzy.src_lon, OdcinekMacierzy.src_lat,
+            OdcinekMacierzy.dst_lon, OdcinekMacierzy.dst_lat,
+            OdcinekMacierzy.czas, OdcinekMacierzy.dystans
+        ).where(
+            OdcinekMacierzy.zrodlo == zrodlo,
+            tuple_(OdcinekMacierzy.src_lon, OdcinekMacierzy.src_lat).in_(list(zrodla)),
+            tuple_(OdcinekMacierzy.dst_lon, OdcinekMacierzy.dst_lat).in_(list(cele)),
+            OdcinekMacierzy.data_pobrania >= granica
+        )
+
+        pary = []
+        with db.engine.connect() as conn:
+            for src_lon, src_lat, dst_lon, dst_lat, czas, dystans in conn.execute(stmt):
+                i = pozycje[(src_lon, src_lat)]
+                j = pozycje[(dst_lon, dst_lat)]
+                if not brak[i, j]:
+                    continue
+                czasy[i, j], dystanse[i, j] = czas, dystans
+                pary.append(((klucze[i], klucze[j]), czas, dystans))
+        self._wstaw_lru(zrodlo, pary)
+        return len(pary)
+
+    def zapisz(self, zrodlo, pary):
+        """pary: lista ((klucz_src, klucz_dst), czas, dystans) pobranych ze źródła (URL OSRM)."""
+        if not pary:
+            return
+        self.chybienia += len(pary)
+        self._wstaw_lru(zrodlo, pary)
+
+        if not has_app_context():
+            return
+
+        data = datetime.utcnow()
+        rekordy = [{
+            'zrodlo': zrodlo, 'src_lon': a[0], 'src_lat': a[1], 'dst_lon': b[0], 'dst_lat': b[1],
+            'czas': czas, 'dystans': dystans, 'data_pobrania': data
+        } for (a, b), czas, dystans in pary]
+
+        try:
+            with db.engine.begin() as conn:
+                for start in range(0, len(rekordy), PACZKA_ZAPISU):
+                    stmt = insert(OdcinekMacierzy).values(rekordy[start:start + PACZKA_ZAPISU])
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=['zrodlo', 'src_lon', 'src_lat', 'dst_lon', 'dst_lat'],
+                        set_={'czas': stmt.excluded.czas,
+                              'dystans': stmt.excluded.dystans,
+                              'data_pobrania': stmt.excluded.data_pobrania})
+                    conn.execute(stmt)
+                conn.execute(delete(OdcinekMacierzy).where(
+                    OdcinekMacierzy.data_pobrania < data - timedelta(seconds=self.ttl)))
+        except Exception as e:
+            print(f"Błąd zapisu cache macierzy: {e}")
+
+    def _wstaw_lru(self, zrodlo, pary):
+        # grupowanie po punkcie startowym poza blokadą, pod blokadą tylko podmiana tablic wierszy
+        wg_startu = {}
+        for (a, b), czas, dystans in pary:
+            wg_startu.setdefault(a, []).append((b, czas, dystans))
+        teraz = time.time()
+        granica = teraz - self.ttl
+        nowe = []
+        for a, cele in wg_startu.items():
+            klucze_celow, czasy, dystanse = zip(*cele)
+            nowe.append((a, kody_kluczy(klucze_celow), np.array(czasy, dtype=float), np.array(dystanse, dtype=float)))
+
+        with self._lock:
+            for a, kody, czasy, dystanse in nowe:
+                wiersz = self._lru.get((zrodlo, a))
+                if wiersz is None:
+                    wiersz = self._lru[(zrodlo, a)] = WierszMacierzy()
+                self._lru.move_to_end((zrodlo, a))
+                self._rozmiar += wiersz.dodaj(kody, czasy, dystanse, teraz, granica)
+            while self._rozmiar > self.max_rozmiar and len(self._lru) > 1:
+                _, usuniety = self._lru.popitem(last=False)
+                self._rozmiar -= len(usuniety)
+
+    def statystyki(self):
+        return {
+            'rozmiar_lru': self._rozmiar,
+            'trafienia_pamiec': self.trafienia_pamiec,
+            'trafienia_baza': self.trafienia_baza,
+            'chybienia': self.chybienia,
+        }
+
+
+matrix_cache = MacierzCache()
@@ -0,0 +1,159 @@
+import os
+import time
+
+import numpy as np
+
+import metryki
+from osrm import OSRM_URL, get_osrm_matrix, pobierz_geometrie_tras
+
+PROMIEN_ZIEMI_M = 6_371_000
+WSPOLCZYNNIK_DROGOWY = 1.3   # droga jest średnio o 30% dłuższa niż linia prosta
+SREDNIA_PREDKOSC_KMH = 50
+
+
+def linia_prosta(punkty):
+    """Łamana przez kolejne punkty trasy (None dla tras krótszych niż 2 punkty)."""
+    if len(punkty) < 2:
+        return None
+    return {"type": "LineString", "coordinates": [[p['lon'], p['lat']] for p in punkty]}
+
+
+class MatrixProvider:
+    """Źródło macierzy czasów (sekundy) i dystansów (metry) między punktami."""
+    nazwa = None
+    opis = None
+
+    def macierz(self, points):
+        raise NotImplementedError
+
+    def geometrie(self, trasy):
+        """Geometrie GeoJSON tras (list punktów {'lat', 'lon'}); domyślnie odcinki proste, bez HTTP."""
+        return [linia_prosta(punkty) for punkty in trasy]
+
+
+class OsrmProvider(MatrixProvider):
+    def __init__(self, nazwa, opis, osrm_url):
+        self.nazwa = nazwa
+        self.opis = opis
+        self.osrm_url = osrm_url
+
+    def macierz(self, points):
+        return get_osrm_matrix(points, self.osrm_url)
+
+    def geometrie(self, trasy):
+        return pobierz_geometrie_tras(trasy, self.osrm_url)
+
+
+class HaversineProvider(MatrixProvider):
+    nazwa = 'haversine'
+    opis = 'Szacunek offline (haversine)'
+
+    def __init__(self, wspolczynnik=WSPOLCZYNNIK_DROGOWY, predkosc_kmh=SREDNIA_PREDKOSC_KMH):
+        self.wspolczynnik = wspolczynnik
+        self.predkosc_ms = predkosc_kmh / 3.6
+
+    def macierz(self, points):
+        n = len(points)
+        lat = np.radians(np.fromiter((p.lat for p in points), dtype=float, count=n))
+        lon = np.radians(np.fromiter((p.lon for p in points), dtype=float, count=n))
+
+        # haversine przez iloczyn skalarny wektorów jednostkowych (jedno mnożenie macierzy)
+        cos_lat = np.cos(lat)
+        wektory = np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+        a = wektory @ wektory.T
+        np.subtract(1.0, a, out=a)
+        a *= 0.5
+        np.clip(a, 0.0, 1.0, out=a)
+        np.sqrt(a, out=a)
+        np.arcsin(a, out=a)
+        np.fill_diagonal(a, 0.0)
+
+        dystanse = a
+        dystanse *= 2 * PROMIEN_ZIEMI_M * self.wspolczynnik
+        czasy = dystanse / self.predkosc_ms
+        return czasy, dystanse
+
+
+class GrafProvider(MatrixProvider):
+    """Macierz i geometrie z lokalnego grafu drogowego (graf_drogowy.py), bez zapytań HTTP."""
+    nazwa = 'graf'
+    opis = 'Lokalny graf drogowy (OSM)'
+
+    def __init__(self, katalog, predkosc_dojazdu_kmh=20, max_odleglosc_m=1000):
+        self.katalog = katalog
+        self.ustawienia = {'predkosc_dojazdu_kmh': predkosc_dojazdu_kmh, 'max_odleglosc_m': max_odleglosc_m}
+
+    def _graf(self):
+        # import i mapowanie plików dopiero przy pierwszym zapytaniu w danym procesie
+        from graf_drogowy import wczytaj_graf
+        return wczytaj_graf(self.katalog, **self.ustawienia)
+
+    def macierz(self, points):
+        start = time.perf_counter()
+        n = len(points)
+        czasy, dystanse = self._graf().macierz(np.fromiter((p.lat for p in points), dtype=float, count=n),
+                                               np.fromiter((p.lon for p in points), dtype=float, count=n))
+        metryki.czas_grafu.observe(time.perf_counter() - start, 'macierz')
+        if czasy is None:
+            print("Graf drogowy: punkt poza siecią dróg albo brak połączenia")
+        return czasy, dystanse
+
+    def geometrie(self, trasy):
+        start = time.perf_counter()
+        graf = self._graf()
+        wynik = [graf.geometria(punkty) if len(punkty) >= 2 else None for punkty in trasy]
+        metryki.czas_grafu.observe(time.perf_counter() - start, 'geometria')
+        return wynik
+
+
+class RejestrProviderow:
+    def __init__(self, app=None):
+        self.providery = {}
+        self.domyslny = 'osrm'
+        self.zapasowy = 'haversine'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.providery = {}
+        self.dodaj(OsrmProvider('osrm', 'OSRM (publiczny)', app.config.get('OSRM_URL', OSRM_URL)))
+        if app.config.get('OSRM_LOCAL_URL'):
+            self.dodaj(OsrmProvider('osrm_lokalny', 'OSRM (lokalny)', app.config['OSRM_LOCAL_URL']))
+        katalog_grafu = app.config.get('ROUTING_GRAPH_DIR')
+        if katalog_grafu:
+            if os.path.isdir(katalog_grafu):
+                self.dodaj(GrafProvider(katalog_grafu, app.config.get('ROUTING_ACCESS_SPEED_KMH', 20),
+                                        app.config.get('ROUTING_SNAP_MAX_M', 1000)))
+            else:
+                print(f"Brak katalogu grafu drogowego {katalog_grafu}, provider 'graf' wyłączony")
+        self.dodaj(HaversineProvider())
+        self.domyslny = app.config.get('MATRIX_PROVIDER', self.domyslny)
+        self.zapasowy = app.config.get('MATRIX_FALLBACK', self.zapasowy)
+        app.extensions['matrix_providers'] = self
+
+    def dodaj(self, provider):
+        self.providery[provider.nazwa] = provider
+
+    def dostepne(self):
+        return [(p.nazwa, p.opis) for p in self.providery.values()]
+
+    def pobierz_macierz(self, points, nazwa=None):
+        """Zwraca (czasy, dystanse, nazwa_użytego_providera); przy awarii próbuje providera zapasowego."""
+        nazwa = nazwa or self.domyslny
+        if nazwa not in self.providery:
+            raise ValueError(f"Nieznany dostawca macierzy: {nazwa}")
+
+        durations, distances = self.providery[nazwa].macierz(points)
+        if durations is None and self.zapasowy and self.zapasowy != nazwa:
+            print(f"Dostawca macierzy '{nazwa}' niedostępny, używam '{self.zapasowy}'")
+            nazwa = self.zapasowy
+            durations, distances = self.providery[nazwa].macierz(points)
+        return durations, distances, nazwa
+
+    def pobierz_geometrie(self, trasy, nazwa=None):
+        """Geometrie tras od tego samego dostawcy, który dał macierz (nieznany: odcinki proste)."""
+        provider = self.providery.get(nazwa or self.domyslny) or MatrixProvider()
+        return provider.geometrie(trasy)
+
+
+matrix_providers = RejestrProviderow()
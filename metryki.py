@@ -0,0 +1,183 @@
+"""Rejestr metryk procesu w formacie tekstowym Prometheusa (GET /metrics).
+
+Pomiar to wyszukanie kubełka (bisect) i kilka dodawań pod blokadą, więc hooki
+mogą być włączone na stałe w solverze i kliencie OSRM. Optymalizacje liczą się
+w procesach roboczych (jobs.py): każdy z nich zwraca migawkę swoich metryk po
+zadaniu, a proces WWW dolicza ją do własnego rejestru. Każdy worker serwera
+WSGI ma osobny rejestr; zbiorcze sumy robi Prometheus (etykieta instance).
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+
+KUBELKI_CZASU = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+KUBELKI_PUNKTOW = (10, 25, 50, 100, 250, 500, 1000, 2000, 5000)
+KUBELKI_KOSZTU = (60, 120, 300, 600, 1200, 3000, 6000, 12000, 30000, 60000)  # minuty
+KUBELKI_UDZIALU = (0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+
+def _escapuj(wartosc):
+    return str(wartosc).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etykiety(nazwy, wartosci):
+    if not nazwy:
+        return ''
+    return '{' + ','.join(f'{n}="{_escapuj(w)}"' for n, w in zip(nazwy, wartosci)) + '}'
+
+
+def _liczba(wartosc):
+    return f'{wartosc:.10g}' if isinstance(wartosc, float) else str(wartosc)
+
+
+class Licznik:
+    typ = 'counter'
+
+    def __init__(self, nazwa, opis, etykiety=()):
+        self.nazwa = nazwa
+        self.opis = opis
+        self.etykiety = tuple(etykiety)
+        self._wartosci = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *etykiety, wartosc=1):
+        with self._lock:
+            self._wartosci[etykiety] = self._wartosci.get(etykiety, 0) + wartosc
+
+    def migawka(self, wyczysc=False):
+        with self._lock:
+            dane = dict(self._wartosci)
+            if wyczysc:
+                self._wartosci.clear()
+        return dane
+
+    def scal(self, dane):
+        with self._lock:
+            for etykiety, wartosc in dane.items():
+                self._wartosci[etykiety] = self._wartosci.get(etykiety, 0) + wartosc
+
+    def linie(self):
+        for etykiety, wartosc in sorted(self.migawka().items()):
+            yield f'{self.nazwa}{_etykiety(self.etykiety, etykiety)} {_liczba(wartosc)}'
+
+
+class Histogram:
+    typ = 'histogram'
+
+    def __init__(self, nazwa, opis, kubelki=KUBELKI_CZASU, etykiety=()):
+        self.nazwa = nazwa
+        self.opis = opis
+        self.kubelki = tuple(kubelki)
+        self.etykiety = tuple(etykiety)
+        self._serie = {}  # etykiety -> [liczniki kubełków (+Inf na końcu), suma]
+        self._lock = threading.Lock()
+
+    def observe(self, wartosc, *etykiety):
+        nr = bisect_left(self.kubelki, wartosc)
+        with self._lock:
+            seria = self._serie.get(etykiety)
+            if seria is None:
+                seria = self._serie[etykiety] = [[0] * (len(self.kubelki) + 1), 0.0]
+            seria[0][nr] += 1
+            seria[1] += wartosc
+
+    def migawka(self, wyczysc=False):
+        with self._lock:
+            dane = {e: (list(s[0]), s[1]) for e, s in self._serie.items()}
+            if wyczysc:
+                self._serie.clear()
+        return dane
+
+    def scal(self, dane):
+        with self._lock:
+            for etykiety, (liczniki, suma) in dane.items():
+                seria = self._serie.setdefault(etykiety, [[0] * (len(self.kubelki) + 1), 0.0])
+                seria[0] = [a + b for a, b in zip(seria[0], liczniki)]
+                seria[1] += suma
+
+    def linie(self):
+        for etykiety, (liczniki, suma) in sorted(self.migawka().items()):
+            narastajaco = 0
+            for granica, liczba in zip(self.kubelki + ('+Inf',), liczniki):
+                narastajaco += liczba
+                yield (f'{self.nazwa}_bucket{_etykiety(self.etykiety + ("le",), etykiety + (granica,))} '
+                       f'{narastajaco}')
+            yield f'{self.nazwa}_sum{_etykiety(self.etykiety, etykiety)} {_liczba(suma)}'
+            yield f'{self.nazwa}_count{_etykiety(self.etykiety, etykiety)} {narastajaco}'
+
+
+class RejestrMetryk:
+    def __init__(self, app=None):
+        self.metryki = {}
+        self.pomiar_zadan = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.pomiar_zadan = app.config.get('METRICS_REQUESTS', self.pomiar_zadan)
+        app.extensions['metryki'] = self
+        if self.pomiar_zadan:
+            app.before_request(self._poczatek_zadania)
+            app.after_request(self._koniec_zadania)
+
+    def dodaj(self, metryka):
+        return self.metryki.setdefault(metryka.nazwa, metryka)
+
+    def _poczatek_zadania(self):
+        g.metryki_start = time.perf_counter()
+
+    def _koniec_zadania(self, response):
+        start = g.pop('metryki_start', None)
+        if start is not None:
+            czas_zadania_http.observe(time.perf_counter() - start, request.endpoint or 'brak',
+                                      request.method, str(response.status_code))
+        return response
+
+    def migawka(self, wyczysc=False):
+        """Stan wszystkich metryk do przekazania między procesami (picklowalny)."""
+        return {nazwa: m.migawka(wyczysc) for nazwa, m in self.metryki.items()}
+
+    def scal(self, migawka):
+        for nazwa, dane in (migawka or {}).items():
+            if nazwa in self.metryki:
+                self.metryki[nazwa].scal(dane)
+
+    def tekst(self):
+        linie = []
+        for m in self.metryki.values():
+            linie.append(f'# HELP {m.nazwa} {m.opis}')
+            linie.append(f'# TYPE {m.nazwa} {m.typ}')
+            linie.extend(m.linie())
+        return '\n'.join(linie) + '\n'
+
+
+rejestr = RejestrMetryk()
+
+czas_zadania_http = rejestr.dodaj(Histogram(
+    'vrp_http_request_seconds', 'Czas obsługi żądania HTTP', etykiety=('endpoint', 'metoda', 'status')))
+czas_osrm = rejestr.dodaj(Histogram(
+    'vrp_osrm_request_seconds', 'Czas pojedynczego zapytania do OSRM', etykiety=('usluga',)))
+bledy_osrm = rejestr.dodaj(Licznik(
+    'vrp_osrm_failures_total', 'Nieudane zapytania do OSRM', etykiety=('usluga',)))
+czas_grafu = rejestr.dodaj(Histogram(
+    'vrp_graph_query_seconds', 'Czas zapytania do lokalnego grafu drogowego', etykiety=('zapytanie',)))
+rozmiar_macierzy = rejestr.dodaj(Histogram(
+    'vrp_matrix_points', 'Liczba punktów w macierzy optymalizacji', KUBELKI_PUNKTOW))
+czas_macierzy = rejestr.dodaj(Histogram(
+    'vrp_matrix_seconds', 'Czas budowy macierzy czasów i odległości', etykiety=('provider',)))
+czas_solvera = rejestr.dodaj(Histogram(
+    'vrp_solver_seconds', 'Czas przeszukiwania OR-Tools', etykiety=('profil',)))
+koszt_rozwiazania = rejestr.dodaj(Histogram(
+    'vrp_solver_objective_minutes', 'Wartość funkcji celu (suma czasów tras, minuty)', KUBELKI_KOSZTU))
+pojazdy_przypisane = rejestr.dodaj(Licznik(
+    'vrp_vehicles_assigned_total', 'Pojazdy przypisane do optymalizowanych zleceń'))
+pojazdy_uzyte = rejestr.dodaj(Licznik(
+    'vrp_vehicles_used_total', 'Pojazdy z niepustą trasą w rozwiązaniach'))
+udzial_pojazdow = rejestr.dodaj(Histogram(
+    'vrp_vehicles_used_ratio', 'Udział użytych pojazdów w przypisanych (na optymalizację)', KUBELKI_UDZIALU))
+wyniki_optymalizacji = rejestr.dodaj(Licznik(
+    'vrp_optimizations_total', 'Optymalizacje według wyniku', etykiety=('wynik',)))
+cache_rozwiazan = rejestr.dodaj(Licznik(
+    'vrp_solve_cache_total', 'Zgłoszenia optymalizacji według wyniku cache rozwiązań', etykiety=('wynik',)))
@@ -0,0 +1,10 @@
+-- Cache macierzy rozdzielony według źródła (adresu serwera OSRM).
+-- Dotychczasowe wpisy nie mają źródła, więc są usuwane; cache wypełni się przy kolejnych zapytaniach.
+BEGIN;
+
+TRUNCATE macierz_cache;
+ALTER TABLE macierz_cache ADD COLUMN IF NOT EXISTS zrodlo varchar(255) NOT NULL;
+ALTER TABLE macierz_cache DROP CONSTRAINT IF EXISTS macierz_cache_pkey;
+ALTER TABLE macierz_cache ADD PRIMARY KEY (zrodlo, src_lon, src_lat, dst_lon, dst_lat);
+
+COMMIT;
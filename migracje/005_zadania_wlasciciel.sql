@@ -0,0 +1,3 @@
+-- Proces WWW (host:pid) trzymający zadanie optymalizacji, do odzyskiwania zadań po restarcie.
+-- Istniejące aktywne zadania zostają bez właściciela; zwalnia je limit czasu OPT_JOB_TIMEOUT.
+ALTER TABLE zadania_optymalizacji ADD COLUMN IF NOT EXISTS wlasciciel varchar(255);
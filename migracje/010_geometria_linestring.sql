@@ -0,0 +1,24 @@
+-- Geometria tras jako PostGIS LINESTRING zamiast tekstu GeoJSON, z uproszczonymi wariantami.
+BEGIN;
+
+ALTER TABLE trasy
+    ALTER COLUMN geometria_trasy TYPE geometry(LINESTRING, 4326)
+    USING CASE WHEN geometria_trasy IS NULL OR geometria_trasy = '' THEN NULL
+               ELSE ST_SetSRID(ST_GeomFromGeoJSON(geometria_trasy), 4326) END;
+
+ALTER TABLE trasy ADD COLUMN IF NOT EXISTS geometria_srednia geometry(LINESTRING, 4326);
+ALTER TABLE trasy ADD COLUMN IF NOT EXISTS geometria_niska geometry(LINESTRING, 4326);
+
+-- tolerancje jak w models.TOLERANCJE_GEOMETRII; zwinięta linia (zerowa długość) zostaje NULL,
+-- jak w models._uproszczona
+UPDATE trasy SET
+    geometria_srednia = ST_Simplify(geometria_trasy, 0.0001),
+    geometria_niska = ST_Simplify(geometria_trasy, 0.001)
+WHERE geometria_trasy IS NOT NULL;
+
+UPDATE trasy SET geometria_srednia = NULL WHERE ST_Length(geometria_srednia) = 0;
+UPDATE trasy SET geometria_niska = NULL WHERE ST_Length(geometria_niska) = 0;
+
+CREATE INDEX IF NOT EXISTS idx_trasy_geometria_trasy ON trasy USING GIST (geometria_trasy);
+
+COMMIT;
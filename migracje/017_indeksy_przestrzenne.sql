@@ -0,0 +1,7 @@
+-- Jawne indeksy GIST na lokalizacjach pojazdów i punktów oraz częściowy indeks pod KNN wolnych pojazdów.
+CREATE INDEX IF NOT EXISTS idx_pojazdy_lokalizacja ON pojazdy USING GIST (lokalizacja);
+CREATE INDEX IF NOT EXISTS idx_pojazdy_dostepne_lokalizacja ON pojazdy USING GIST (lokalizacja) WHERE dostepnosc;
+CREATE INDEX IF NOT EXISTS idx_punkty_dostaw_lokalizacja ON punkty_dostaw USING GIST (lokalizacja);
+
+ANALYZE pojazdy;
+ANALYZE punkty_dostaw;
@@ -0,0 +1,93 @@
+-- Dzienne podsumowanie tras per pojazd dla analityki floty, utrzymywane wyzwalaczami na trasy.
+BEGIN;
+
+-- pojemność pojazdu zapamiętana na trasie (pojazd może później zmienić pojemność);
+-- istniejące trasy dostają obecną pojemność pojazdu
+ALTER TABLE trasy ADD COLUMN IF NOT EXISTS pojemnosc double precision;
+UPDATE trasy t SET pojemnosc = v.pojemnosc
+FROM pojazdy v
+WHERE v.id_pojazdu = t.id_pojazdu AND t.pojemnosc IS NULL;
+
+CREATE TABLE IF NOT EXISTS podsumowanie_tras (
+    id_pojazdu integer NOT NULL REFERENCES pojazdy (id_pojazdu) ON DELETE CASCADE,
+    dzien date NOT NULL,
+    id_uzytkownika integer NOT NULL REFERENCES uzytkownicy (id) ON DELETE CASCADE,
+    liczba_tras integer NOT NULL DEFAULT 0,
+    liczba_przystankow integer NOT NULL DEFAULT 0,
+    dystans_km double precision NOT NULL DEFAULT 0,
+    czas_min double precision NOT NULL DEFAULT 0,
+    ladunek double precision NOT NULL DEFAULT 0,
+    pojemnosc double precision NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_pojazdu, dzien)
+);
+CREATE INDEX IF NOT EXISTS idx_podsumowanie_tras_uzytkownik_dzien ON podsumowanie_tras (id_uzytkownika, dzien);
+
+-- treść jak models.WYZWALACZE_PODSUMOWANIA
+CREATE OR REPLACE FUNCTION podsumowanie_tras_zmiana() RETURNS trigger AS $$
+DECLARE
+    znak integer := CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END;
+BEGIN
+    INSERT INTO podsumowanie_tras AS p
+        (id_pojazdu, dzien, id_uzytkownika, liczba_tras, liczba_przystankow, dystans_km, czas_min, ladunek, pojemnosc)
+    SELECT t.id_pojazdu, t.data_generacji::date, v.id_uzytkownika,
+           znak * count(*),
+           znak * sum(greatest(json_array_length(t.szczegoly_punktow) - 2, 0)),
+           znak * sum(coalesce(t.dlugosc, 0)),
+           znak * sum(coalesce(t.czas_przejazdu, 0)),
+           -- ładunek trasy zapisany przy powrocie (END); starsze trasy: największy ładunek po drodze
+           znak * sum(coalesce((t.szczegoly_punktow -> -1 ->> 'ladunek')::float,
+                               (SELECT max((e ->> 'ladunek')::float) FROM json_array_elements(t.szczegoly_punktow) e),
+                               0)),
+           -- pojemność zapisana na trasie, więc DELETE odejmuje dokładnie to, co dodał INSERT
+           znak * sum(coalesce(t.pojemnosc, 0))
+    FROM zmienione t
+    JOIN pojazdy v ON v.id_pojazdu = t.id_pojazdu
+    GROUP BY t.id_pojazdu, t.data_generacji::date, v.id_uzytkownika
+    ON CONFLICT (id_pojazdu, dzien) DO UPDATE SET
+        liczba_tras = p.liczba_tras + EXCLUDED.liczba_tras,
+        liczba_przystankow = p.liczba_przystankow + EXCLUDED.liczba_przystankow,
+        dystans_km = p.dystans_km + EXCLUDED.dystans_km,
+        czas_min = p.czas_min + EXCLUDED.czas_min,
+        ladunek = p.ladunek + EXCLUDED.ladunek,
+        pojemnosc = p.pojemnosc + EXCLUDED.pojemnosc;
+
+    IF znak < 0 THEN
+        DELETE FROM podsumowanie_tras p
+        USING (SELECT DISTINCT id_pojazdu, data_generacji::date AS dzien FROM zmienione) t
+        WHERE p.id_pojazdu = t.id_pojazdu AND p.dzien = t.dzien AND p.liczba_tras <= 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trasy_podsumowanie_insert ON trasy;
+CREATE TRIGGER trasy_podsumowanie_insert AFTER INSERT ON trasy
+    REFERENCING NEW TABLE AS zmienione
+    FOR EACH STATEMENT EXECUTE FUNCTION podsumowanie_tras_zmiana();
+
+DROP TRIGGER IF EXISTS trasy_podsumowanie_delete ON trasy;
+CREATE TRIGGER trasy_podsumowanie_delete AFTER DELETE ON trasy
+    REFERENCING OLD TABLE AS zmienione
+    FOR EACH STATEMENT EXECUTE FUNCTION podsumowanie_tras_zmiana();
+
+-- wypełnienie z istniejących tras; wyzwalacze obsługują już tylko kolejne zmiany
+LOCK TABLE trasy IN SHARE MODE;
+TRUNCATE podsumowanie_tras;
+INSERT INTO podsumowanie_tras
+    (id_pojazdu, dzien, id_uzytkownika, liczba_tras, liczba_przystankow, dystans_km, czas_min, ladunek, pojemnosc)
+SELECT t.id_pojazdu, t.data_generacji::date, v.id_uzytkownika,
+       count(*),
+       sum(greatest(json_array_length(t.szczegoly_punktow) - 2, 0)),
+       sum(coalesce(t.dlugosc, 0)),
+       sum(coalesce(t.czas_przejazdu, 0)),
+       sum(coalesce((t.szczegoly_punktow -> -1 ->> 'ladunek')::float,
+                    (SELECT max((e ->> 'ladunek')::float) FROM json_array_elements(t.szczegoly_punktow) e),
+                    0)),
+       sum(coalesce(t.pojemnosc, 0))
+FROM trasy t
+JOIN pojazdy v ON v.id_pojazdu = t.id_pojazdu
+GROUP BY t.id_pojazdu, t.data_generacji::date, v.id_uzytkownika;
+
+COMMIT;
+
+ANALYZE podsumowanie_tras;
@@ -0,0 +1,32 @@
+-- Przystanki tras jako osobne wiersze z indeksami (punkt, pojazd + przyjazd, zlecenie + przyjazd).
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS przystanki_tras (
+    id_trasy integer NOT NULL REFERENCES trasy (id) ON DELETE CASCADE,
+    kolejnosc integer NOT NULL,
+    id_punktu integer NOT NULL REFERENCES punkty_dostaw (id) ON DELETE CASCADE,
+    id_zlecenia integer NOT NULL REFERENCES zlecenia (id) ON DELETE CASCADE,
+    id_pojazdu integer NOT NULL REFERENCES pojazdy (id_pojazdu) ON DELETE CASCADE,
+    przyjazd_min integer NOT NULL,
+    ladunek double precision,
+    PRIMARY KEY (id_trasy, kolejnosc)
+);
+
+-- wypełnienie z szczegoly_punktow istniejących tras (pozycja liczona od 0 jak w models.zapisz_trasy)
+INSERT INTO przystanki_tras (id_trasy, kolejnosc, id_punktu, id_zlecenia, id_pojazdu, przyjazd_min, ladunek)
+SELECT t.id, p.nr - 1, (p.e ->> 'id_punktu')::integer, t.id_zlecenia, t.id_pojazdu,
+       (p.e ->> 'przyjazd_min')::integer, (p.e ->> 'ladunek')::float
+FROM trasy t
+CROSS JOIN LATERAL json_array_elements(t.szczegoly_punktow) WITH ORDINALITY AS p(e, nr)
+WHERE p.e ->> 'typ' = 'DELIVERY'
+  AND EXISTS (SELECT 1 FROM punkty_dostaw d WHERE d.id = (p.e ->> 'id_punktu')::integer)
+ON CONFLICT DO NOTHING;
+
+-- indeksy po wypełnieniu, jednorazowe sortowanie zamiast aktualizacji przy każdym wierszu
+CREATE INDEX IF NOT EXISTS idx_przystanki_tras_punkt ON przystanki_tras (id_punktu);
+CREATE INDEX IF NOT EXISTS idx_przystanki_tras_pojazd_przyjazd ON przystanki_tras (id_pojazdu, przyjazd_min);
+CREATE INDEX IF NOT EXISTS idx_przystanki_tras_zlecenie_przyjazd ON przystanki_tras (id_zlecenia, przyjazd_min);
+
+COMMIT;
+
+ANALYZE przystanki_tras;
@@ -2,11 +2,61 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from geoalchemy2 import Geometry
-from geoalchemy2.shape import to_shape
 from datetime import datetime
+from sqlalchemy import func, select, insert, case, Integer, DDL, event
+from sqlalchemy.orm import column_property
 from sqlalchemy.dialects.postgresql import JSON
+import numpy as np
 db = SQLAlchemy()
 
+WZOR_TABLICY = r"^[A-Z]{2,3}\s?[0-9A-Z]{4,5}$"
+
+# shapely (geoalchemy2.shape) jest importowane w metodach, przy pierwszym dekodowaniu geometrii
+# tolerancje Douglasa-Peuckera w stopniach (~10 m i ~100 m) dla uproszczonych geometrii tras
+TOLERANCJE_GEOMETRII = {'srednia': 0.0001, 'niska': 0.001}
+
+class WspolrzedneMixin:
+    """lat/lon bez dekodowania WKB przy każdym odczycie.
+
+    Po załadowaniu z bazy współrzędne przychodzą gotowe jako ST_X/ST_Y (_lon, _lat).
+    Nowo ustawiona lokalizacja to tekst 'POINT(lon lat)', więc wystarczy go sparsować;
+    WKB jest dekodowane najwyżej raz na obiekt i tylko wtedy, gdy nie ma innej drogi.
+    """
+
+    def _wspolrzedne(self):
+        lokalizacja = self.lokalizacja
+        if isinstance(lokalizacja, str):
+            try:
+                coords = lokalizacja.replace('POINT(', '').replace(')', '').split()
+                return float(coords[0]), float(coords[1])
+            except:
+                return 0.0, 0.0
+        lon, lat = self.__dict__.get('_lon'), self.__dict__.get('_lat')
+        if lon is not None and lat is not None:
+            return lon, lat
+        if lokalizacja is None:
+            return 0.0, 0.0
+        zdekodowane = self.__dict__.get('_wsp_wkb')
+        if zdekodowane is None or zdekodowane[0] is not lokalizacja:
+            from geoalchemy2.shape import to_shape
+            point = to_shape(lokalizacja)
+            zdekodowane = (lokalizacja, (point.x, point.y))
+            self.__dict__['_wsp_wkb'] = zdekodowane
+        return zdekodowane[1]
+
+    @property
+    def lat(self):
+        return self._wspolrzedne()[1]
+
+    @property
+    def lon(self):
+        return self._wspolrzedne()[0]
+
+def poziom_geometrii(zoom):
+    if zoom is None or zoom >= 14:
+        return 'pelna'
+    return 'srednia' if zoom >= 10 else 'niska'
+
 class Uzytkownik(UserMixin, db.Model):
     __tablename__ = 'uzytkownicy'
     id = db.Column(db.Integer, primary_key=True) 
@@ -20,7 +70,7 @@ class Uzytkownik(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
-class Pojazd(db.Model):
+class Pojazd(WspolrzedneMixin, db.Model):
     __tablename__ = 'pojazdy'
 
     id_pojazdu = db.Column(db.Integer, primary_key=True)
@@ -28,37 +78,25 @@ class Pojazd(db.Model):
     pojemnosc = db.Column(db.Float, nullable=False)
     dostepnosc = db.Column(db.Boolean, default=True, nullable=False)
     
-    lokalizacja = db.Column(Geometry(geometry_type='POINT', srid=4326), nullable=False)
+    lokalizacja = db.Column(Geometry(geometry_type='POINT', srid=4326, spatial_index=False), nullable=False)
     id_uzytkownika = db.Column(db.Integer, db.ForeignKey('uzytkownicy.id'), nullable=False)
 
+    __table_args__ = (
+        db.Index('idx_pojazdy_lokalizacja', 'lokalizacja', postgresql_using='gist'),
+        # częściowy indeks pod wyszukiwanie najbliższych wolnych pojazdów (KNN <->)
+        db.Index('idx_pojazdy_dostepne_lokalizacja', 'lokalizacja', postgresql_using='gist',
+                 postgresql_where=db.text('dostepnosc')),
+    )
+
+    _lon = column_property(func.ST_X(lokalizacja))
+    _lat = column_property(func.ST_Y(lokalizacja))
+
     def __init__(self, numer_rejestracyjny, pojemnosc, lat, lon, id_uzytkownika, dostepnosc=True):
         self.numer_rejestracyjny = numer_rejestracyjny
         self.pojemnosc = pojemnosc
         self.lokalizacja = f'POINT({lon} {lat})'
         self.id_uzytkownika = id_uzytkownika
         self.dostepnosc = dostepnosc
-
-    @property
-    def lat(self):
-        if isinstance(self.lokalizacja, str):
-            try:
-                coords = self.lokalizacja.replace('POINT(', '').replace(')', '').split()
-                return float(coords[1])
-            except:
-                return 0.0
-        point = to_shape(self.lokalizacja)
-        return point.y
-
-    @property
-    def lon(self):
-        if isinstance(self.lokalizacja, str):
-            try:
-                coords = self.lokalizacja.replace('POINT(', '').replace(')', '').split()
-                return float(coords[0])
-            except:
-                return 0.0
-        point = to_shape(self.lokalizacja)
-        return point.x
     
 zlecenie_pojazdy = db.Table('zlecenie_pojazdy',
     db.Column('zlecenie_id', db.Integer, db.ForeignKey('zlecenia.id'), primary_key=True),
@@ -76,11 +114,12 @@ class Zlecenie(db.Model):
     
     id_uzytkownika = db.Column(db.Integer, db.ForeignKey('uzytkownicy.id'), nullable=False)
     
-    punkty = db.relationship('PunktDostawy', backref='zlecenie', lazy=True, cascade='all, delete-orphan')
-    dostepne_pojazdy = db.relationship('Pojazd', secondary=zlecenie_pojazdy, lazy='subquery',
+    punkty = db.relationship('PunktDostawy', backref='zlecenie', lazy=True, cascade='all, delete-orphan',
+        order_by='PunktDostawy.id')
+    dostepne_pojazdy = db.relationship('Pojazd', secondary=zlecenie_pojazdy, lazy='select',
         backref=db.backref('przypisane_zlecenia', lazy=True))
     
-class PunktDostawy(db.Model):
+class PunktDostawy(WspolrzedneMixin, db.Model):
     __tablename__ = 'punkty_dostaw'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -93,7 +132,13 @@ class PunktDostawy(db.Model):
     okno_od = db.Column(db.String(5), default="08:00") 
     okno_do = db.Column(db.String(5), default="16:00")
 
-    lokalizacja = db.Column(Geometry(geometry_type='POINT', srid=4326), nullable=False)
+    lokalizacja = db.Column(Geometry(geometry_type='POINT', srid=4326, spatial_index=False), nullable=False)
+    _lon = column_property(func.ST_X(lokalizacja))
+    _lat = column_property(func.ST_Y(lokalizacja))
+
+    __table_args__ = (
+        db.Index('idx_punkty_dostaw_lokalizacja', 'lokalizacja', postgresql_using='gist'),
+    )
 
     def __init__(self, id_zlecenia, nazwa, typ, lat, lon, waga, okno_od, okno_do):
         self.id_zlecenia = id_zlecenia
@@ -104,16 +149,6 @@ class PunktDostawy(db.Model):
         self.okno_od = okno_od
         self.okno_do = okno_do
 
-    @property
-    def lat(self):
-        point = to_shape(self.lokalizacja)
-        return point.y
-
-    @property
-    def lon(self):
-        point = to_shape(self.lokalizacja)
-        return point.x
-
     def to_dict(self):
         return {
             'id': self.id,
@@ -126,6 +161,46 @@ class PunktDostawy(db.Model):
             'okno_do': self.okno_do
         }
     
+def _minuty(kolumna):
+    godzina = func.coalesce(func.nullif(kolumna, ''), '00:00')
+    return func.split_part(godzina, ':', 1).cast(Integer) * 60 + func.split_part(godzina, ':', 2).cast(Integer)
+
+def wczytaj_dane_zlecenia(id_zlecenia):
+    """Dane punktów zlecenia jako tablice NumPy, jednym zapytaniem i bez obiektów ORM.
+
+    Kolejność jak w solver.przygotuj_punkty: pierwszy HUB, potem punkty DELIVERY według id.
+    Okna czasowe są w minutach od północy. Zwraca None, gdy zlecenie nie ma HUBa.
+    """
+    wiersze = db.session.execute(
+        select(PunktDostawy.id, PunktDostawy.typ,
+               func.ST_X(PunktDostawy.lokalizacja), func.ST_Y(PunktDostawy.lokalizacja),
+               func.coalesce(PunktDostawy.waga, 0.0),
+               _minuty(PunktDostawy.okno_od), _minuty(PunktDostawy.okno_do))
+        .where(PunktDostawy.id_zlecenia == id_zlecenia, PunktDostawy.typ.in_(('HUB', 'DELIVERY')))
+        .order_by(case((PunktDostawy.typ == 'HUB', 0), else_=1), PunktDostawy.id)
+    ).all()
+    if not wiersze or wiersze[0][1] != 'HUB':
+        return None
+    wiersze = [wiersze[0]] + [w for w in wiersze[1:] if w[1] == 'DELIVERY']
+
+    ids, _, lon, lat, waga, okno_od, okno_do = zip(*wiersze)
+    return {
+        'id': np.array(ids, dtype=np.int64),
+        'lon': np.array(lon, dtype=float),
+        'lat': np.array(lat, dtype=float),
+        'waga': np.array(waga, dtype=float),
+        'okna': np.column_stack((okno_od, okno_do)).astype(np.int64)
+    }
+
+def _uproszczona(linia, tolerancja):
+    """Uproszczona linia albo None, gdy uproszczenie ją zwinęło (krótka pętla tam i z powrotem);
+    geojson() i kafelki używają wtedy pełnej geometrii."""
+    from geoalchemy2.shape import from_shape
+    uproszczona = linia.simplify(tolerancja, preserve_topology=False)
+    if uproszczona.is_empty or uproszczona.length == 0:
+        return None
+    return from_shape(uproszczona, srid=4326)
+
 class Trasa(db.Model):
     __tablename__ = 'trasy'
     
@@ -135,11 +210,217 @@ class Trasa(db.Model):
     
     dlugosc = db.Column(db.Float)
     czas_przejazdu = db.Column(db.Float)
+    pojemnosc = db.Column(db.Float)  # pojemność pojazdu w chwili planowania (podsumowanie_tras)
     data_generacji = db.Column(db.DateTime, default=datetime.utcnow)
     
-    geometria_trasy = db.Column(db.Text)
+    geometria_trasy = db.Column(Geometry(geometry_type='LINESTRING', srid=4326))
+    geometria_srednia = db.Column(Geometry(geometry_type='LINESTRING', srid=4326, spatial_index=False))
+    geometria_niska = db.Column(Geometry(geometry_type='LINESTRING', srid=4326, spatial_index=False))
     szczegoly_punktow = db.Column(JSON)
     
     pojazd = db.relationship('Pojazd', backref='realizowane_trasy')
     
-    zlecenie = db.relationship('Zlecenie', backref=db.backref('wygenerowane_trasy', cascade='all, delete-orphan'))
\ No newline at end of file
+    zlecenie = db.relationship('Zlecenie', backref=db.backref('wygenerowane_trasy', cascade='all, delete-orphan'))
+
+    def ustaw_geometrie(self, geojson):
+        """Zapisuje geometrię z OSRM jako LINESTRING wraz z uproszczonymi wariantami."""
+        if not geojson or len(geojson.get('coordinates', [])) < 2:
+            self.geometria_trasy = self.geometria_srednia = self.geometria_niska = None
+            return
+        from geoalchemy2.shape import from_shape
+        from shapely.geometry import shape
+        linia = shape(geojson)
+        self.geometria_trasy = from_shape(linia, srid=4326)
+        self.geometria_srednia = _uproszczona(linia, TOLERANCJE_GEOMETRII['srednia'])
+        self.geometria_niska = _uproszczona(linia, TOLERANCJE_GEOMETRII['niska'])
+
+    def geojson(self, poziom='pelna'):
+        kolumna = {
+            'pelna': self.geometria_trasy,
+            'srednia': self.geometria_srednia,
+            'niska': self.geometria_niska
+        }[poziom]
+        if kolumna is None:
+            kolumna = self.geometria_trasy
+        if kolumna is None:
+            return None
+        from geoalchemy2.shape import to_shape
+        from shapely.geometry import mapping
+        return mapping(to_shape(kolumna))
+
+class PrzystanekTrasy(db.Model):
+    """Punkt dostawy na trasie z planowanym przyjazdem, kopia szczegoly_punktow do wyszukiwania po indeksach."""
+    __tablename__ = 'przystanki_tras'
+
+    id_trasy = db.Column(db.Integer, db.ForeignKey('trasy.id', ondelete='CASCADE'), primary_key=True)
+    kolejnosc = db.Column(db.Integer, primary_key=True)  # pozycja w szczegoly_punktow (0 to wyjazd z HUBa)
+
+    id_punktu = db.Column(db.Integer, db.ForeignKey('punkty_dostaw.id', ondelete='CASCADE'), nullable=False)
+    id_zlecenia = db.Column(db.Integer, db.ForeignKey('zlecenia.id', ondelete='CASCADE'), nullable=False)
+    id_pojazdu = db.Column(db.Integer, db.ForeignKey('pojazdy.id_pojazdu', ondelete='CASCADE'), nullable=False)
+    przyjazd_min = db.Column(db.Integer, nullable=False)  # minuty od północy, jak okna czasowe
+    ladunek = db.Column(db.Float)
+
+    __table_args__ = (
+        db.Index('idx_przystanki_tras_punkt', 'id_punktu'),
+        db.Index('idx_przystanki_tras_pojazd_przyjazd', 'id_pojazdu', 'przyjazd_min'),
+        db.Index('idx_przystanki_tras_zlecenie_przyjazd', 'id_zlecenia', 'przyjazd_min'),
+    )
+
+def zapisz_trasy(zlecenie, wyniki_tras, punkty_sorted):
+    """Zastępuje trasy zlecenia wynikami optymalizacji (bez commita).
+
+    Przystanki dostaw trafiają też do przystanki_tras, jednym wielowierszowym INSERT-em;
+    stare usuwa kaskada po kluczu obcym razem z trasami.
+    """
+    Trasa.query.filter_by(id_zlecenia=zlecenie.id).delete()
+
+    nowe_trasy = []
+    for wynik in wyniki_tras:
+        nowa_trasa = Trasa(
+            id_zlecenia=zlecenie.id,
+            id_pojazdu=wynik['pojazd_db'].id_pojazdu,
+            dlugosc=wynik['dystans_km'],
+            czas_przejazdu=wynik['czas_calkowity'],
+            pojemnosc=wynik['pojazd_db'].pojemnosc,
+            szczegoly_punktow=wynik['punkty_json']
+        )
+        nowa_trasa.ustaw_geometrie(wynik['geometria'])
+        db.session.add(nowa_trasa)
+        nowe_trasy.append((nowa_trasa, wynik['punkty_json']))
+        ostatni_punkt_id = wynik['punkty_json'][-1]['id_punktu']
+        ostatni_punkt_obj = next((p for p in punkty_sorted if p.id == ostatni_punkt_id), None)
+
+        if ostatni_punkt_obj:
+            wynik['pojazd_db'].lokalizacja = f'POINT({ostatni_punkt_obj.lon} {ostatni_punkt_obj.lat})'
+
+    db.session.flush()  # id nowych tras
+    przystanki = [{
+        'id_trasy': trasa.id,
+        'kolejnosc': nr,
+        'id_punktu': punkt['id_punktu'],
+        'id_zlecenia': zlecenie.id,
+        'id_pojazdu': trasa.id_pojazdu,
+        'przyjazd_min': punkt['przyjazd_min'],
+        'ladunek': punkt['ladunek'],
+    } for trasa, punkty_json in nowe_trasy for nr, punkt in enumerate(punkty_json) if punkt['typ'] == 'DELIVERY']
+    if przystanki:
+        db.session.execute(insert(PrzystanekTrasy), przystanki)
+    zlecenie.status = 'zakonczone'
+
+class PodsumowanieTras(db.Model):
+    """Dzienne sumy tras per pojazd, utrzymywane wyzwalaczami na tabeli trasy (odczyt: analityka.py)."""
+    __tablename__ = 'podsumowanie_tras'
+
+    id_pojazdu = db.Column(db.Integer, db.ForeignKey('pojazdy.id_pojazdu', ondelete='CASCADE'), primary_key=True)
+    dzien = db.Column(db.Date, primary_key=True)  # dzień wygenerowania trasy
+    id_uzytkownika = db.Column(db.Integer, db.ForeignKey('uzytkownicy.id', ondelete='CASCADE'), nullable=False)
+
+    liczba_tras = db.Column(db.Integer, nullable=False, default=0)
+    liczba_przystankow = db.Column(db.Integer, nullable=False, default=0)
+    dystans_km = db.Column(db.Float, nullable=False, default=0.0)
+    czas_min = db.Column(db.Float, nullable=False, default=0.0)
+    ladunek = db.Column(db.Float, nullable=False, default=0.0)
+    pojemnosc = db.Column(db.Float, nullable=False, default=0.0)  # suma trasy.pojemnosc
+
+    __table_args__ = (
+        # zakres dat dla całej floty użytkownika (pulpit) bez skanowania po pojazdach
+        db.Index('idx_podsumowanie_tras_uzytkownik_dzien', 'id_uzytkownika', 'dzien'),
+    )
+
+# ta sama funkcja dla obu wyzwalaczy: tablica przejściowa nazywa się „zmienione” w obu,
+# a znak rozstrzyga, czy wiersze dochodzą (INSERT), czy są odejmowane (DELETE)
+WYZWALACZE_PODSUMOWANIA = """
+CREATE OR REPLACE FUNCTION podsumowanie_tras_zmiana() RETURNS trigger AS $$
+DECLARE
+    znak integer := CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END;
+BEGIN
+    INSERT INTO podsumowanie_tras AS p
+        (id_pojazdu, dzien, id_uzytkownika, liczba_tras, liczba_przystankow, dystans_km, czas_min, ladunek, pojemnosc)
+    SELECT t.id_pojazdu, t.data_generacji::date, v.id_uzytkownika,
+           znak * count(*),
+           znak * sum(greatest(json_array_length(t.szczegoly_punktow) - 2, 0)),
+           znak * sum(coalesce(t.dlugosc, 0)),
+           znak * sum(coalesce(t.czas_przejazdu, 0)),
+           -- ładunek trasy zapisany przy powrocie (END); starsze trasy: największy ładunek po drodze
+           znak * sum(coalesce((t.szczegoly_punktow -> -1 ->> 'ladunek')::float,
+                               (SELECT max((e ->> 'ladunek')::float) FROM json_array_elements(t.szczegoly_punktow) e),
+                               0)),
+           -- pojemność zapisana na trasie, więc DELETE odejmuje dokładnie to, co dodał INSERT
+           znak * sum(coalesce(t.pojemnosc, 0))
+    FROM zmienione t
+    JOIN pojazdy v ON v.id_pojazdu = t.id_pojazdu
+    GROUP BY t.id_pojazdu, t.data_generacji::date, v.id_uzytkownika
+    ON CONFLICT (id_pojazdu, dzien) DO UPDATE SET
+        liczba_tras = p.liczba_tras + EXCLUDED.liczba_tras,
+        liczba_przystankow = p.liczba_przystankow + EXCLUDED.liczba_przystankow,
+        dystans_km = p.dystans_km + EXCLUDED.dystans_km,
+        czas_min = p.czas_min + EXCLUDED.czas_min,
+        ladunek = p.ladunek + EXCLUDED.ladunek,
+        pojemnosc = p.pojemnosc + EXCLUDED.pojemnosc;
+
+    IF znak < 0 THEN
+        DELETE FROM podsumowanie_tras p
+        USING (SELECT DISTINCT id_pojazdu, data_generacji::date AS dzien FROM zmienione) t
+        WHERE p.id_pojazdu = t.id_pojazdu AND p.dzien = t.dzien AND p.liczba_tras <= 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trasy_podsumowanie_insert ON trasy;
+CREATE TRIGGER trasy_podsumowanie_insert AFTER INSERT ON trasy
+    REFERENCING NEW TABLE AS zmienione
+    FOR EACH STATEMENT EXECUTE FUNCTION podsumowanie_tras_zmiana();
+
+DROP TRIGGER IF EXISTS trasy_podsumowanie_delete ON trasy;
+CREATE TRIGGER trasy_podsumowanie_delete AFTER DELETE ON trasy
+    REFERENCING OLD TABLE AS zmienione
+    FOR EACH STATEMENT EXECUTE FUNCTION podsumowanie_tras_zmiana();
+"""
+
+# po utworzeniu wszystkich tabel, bo wyzwalacze dotyczą trasy, a piszą do podsumowanie_tras
+event.listen(db.metadata, 'after_create', DDL(WYZWALACZE_PODSUMOWANIA).execute_if(dialect='postgresql'))
+
+class OdcinekMacierzy(db.Model):
+    __tablename__ = 'macierz_cache'
+
+    zrodlo = db.Column(db.String(255), primary_key=True)  # adres serwera OSRM, z którego pochodzi para
+    # współrzędne zaokrąglone do 5 miejsc po przecinku i zapisane jako liczby całkowite
+    src_lon = db.Column(db.Integer, primary_key=True)
+    src_lat = db.Column(db.Integer, primary_key=True)
+    dst_lon = db.Column(db.Integer, primary_key=True)
+    dst_lat = db.Column(db.Integer, primary_key=True)
+
+    czas = db.Column(db.Float, nullable=False)     # sekundy
+    dystans = db.Column(db.Float, nullable=False)  # metry
+    data_pobrania = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class ZadanieOptymalizacji(db.Model):
+    __tablename__ = 'zadania_optymalizacji'
+
+    id = db.Column(db.String(36), primary_key=True)
+    id_zlecenia = db.Column(db.Integer, db.ForeignKey('zlecenia.id', ondelete='CASCADE'), nullable=False, index=True)
+    id_uzytkownika = db.Column(db.Integer, db.ForeignKey('uzytkownicy.id'), nullable=False)
+
+    status = db.Column(db.String(20), default='oczekuje', nullable=False)  # oczekuje / trwa / zakonczone / blad / anulowane
+    parametry = db.Column(JSON)
+    komunikat = db.Column(db.Text)
+    statystyki = db.Column(JSON)
+    wlasciciel = db.Column(db.String(255))  # host:pid procesu WWW, który trzyma future zadania
+
+    data_utworzenia = db.Column(db.DateTime, default=datetime.utcnow)
+    data_rozpoczecia = db.Column(db.DateTime)
+    data_zakonczenia = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'id_zlecenia': self.id_zlecenia,
+            'status': self.status,
+            'komunikat': self.komunikat,
+            'statystyki': self.statystyki,
+            'data_utworzenia': self.data_utworzenia.isoformat() if self.data_utworzenia else None,
+            'data_rozpoczecia': self.data_rozpoczecia.isoformat() if self.data_rozpoczecia else None,
+            'data_zakonczenia': self.data_zakonczenia.isoformat() if self.data_zakonczenia else None
+        }
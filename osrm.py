@@ -0,0 +1,247 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metryki
+from matrix_cache import matrix_cache, klucz_punktu, wspolrzedne_klucza
+
+OSRM_URL = "http://router.project-osrm.org"
+
+USTAWIENIA = {
+    'rozmiar_kafelka': 50,  # publiczny OSRM przyjmuje max. 100 współrzędnych w /table
+    'watki': 8,
+    'timeout': 30,
+    'segment_trasy': 50,    # punkty w jednym zapytaniu /route
+}
+
+_sesja = None
+_executor = None
+_lock = threading.Lock()
+
+
+def init_app(app):
+    USTAWIENIA['rozmiar_kafelka'] = app.config.get('OSRM_TILE_SIZE', USTAWIENIA['rozmiar_kafelka'])
+    USTAWIENIA['watki'] = app.config.get('OSRM_MAX_WORKERS', USTAWIENIA['watki'])
+    USTAWIENIA['timeout'] = app.config.get('OSRM_TIMEOUT', USTAWIENIA['timeout'])
+    USTAWIENIA['segment_trasy'] = app.config.get('OSRM_ROUTE_SEGMENT', USTAWIENIA['segment_trasy'])
+
+
+def sesja():
+    """Wspólna sesja HTTP z pulą połączeń keep-alive."""
+    global _sesja
+    with _lock:
+        if _sesja is None:
+            # requests jest ładowane dopiero przy pierwszym zapytaniu do OSRM, nie przy starcie workera WWW
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            s = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=USTAWIENIA['watki'],
+                max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504]))
+            s.mount('http://', adapter)
+            s.mount('https://', adapter)
+            _sesja = s
+        return _sesja
+
+
+def _po_fork():
+    # wątki puli i gniazda sesji nie przechodzą do procesu potomnego po fork
+    global _sesja, _executor, _lock
+    _sesja = None
+    _executor = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_po_fork)
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=USTAWIENIA['watki'], thread_name_prefix='osrm')
+        return _executor
+
+
+def _zapytanie(usluga, url):
+    """GET do OSRM z pomiarem czasu i liczeniem błędów (metryki vrp_osrm_*)."""
+    start = time.perf_counter()
+    try:
+        data = sesja().get(url, timeout=USTAWIENIA['timeout']).json()
+    except Exception:
+        metryki.bledy_osrm.inc(usluga)
+        raise
+    finally:
+        metryki.czas_osrm.observe(time.perf_counter() - start, usluga)
+    if data['code'] != 'Ok':
+        metryki.bledy_osrm.inc(usluga)
+        raise ValueError(data.get('message', data['code']))
+    return data
+
+
+def _pobierz_tabele(coords, sources, destinations, osrm_url=OSRM_URL):
+    coords_str = ";".join([f"{lon},{lat}" for lon, lat in coords])
+    url = (f"{osrm_url}/table/v1/driving/{coords_str}?annotations=duration,distance"
+           f"&sources={';'.join(map(str, sources))}"
+           f"&destinations={';'.join(map(str, destinations))}")
+
+    data = _zapytanie('table', url)
+    czasy = np.array(data['durations'], dtype=float)
+    dystanse = np.array(data['distances'], dtype=float)
+    return czasy, dystanse
+
+
+def _bloki_do_pobrania(brak):
+    """Dzieli brakujące pary na prostokąty sources x destinations.
+
+    Punkty nieznane w cache (cały wiersz i kolumna puste) pobieramy jako
+    nowe x wszystkie oraz pozostałe x nowe, a pojedyncze braki (np. po
+    wygaśnięciu TTL) jednym dodatkowym blokiem.
+    """
+    n = brak.shape[0]
+    if n < 2 or not brak.any():
+        return []
+    brak_lub_przekatna = brak | np.eye(n, dtype=bool)
+    nowe = np.nonzero(brak_lub_przekatna.all(axis=1) & brak_lub_przekatna.all(axis=0))[0]
+    bloki = []
+    if len(nowe):
+        stare = np.setdiff1d(np.arange(n), nowe)
+        bloki.append((nowe, np.arange(n)))
+        if len(stare):
+            bloki.append((stare, nowe))
+        reszta = brak.copy()
+        reszta[nowe, :] = False
+        reszta[:, nowe] = False
+    else:
+        reszta = brak
+    if reszta.any():
+        wiersze = np.nonzero(reszta.any(axis=1))[0]
+        kolumny = np.nonzero(reszta[wiersze].any(axis=0))[0]
+        bloki.append((wiersze, kolumny))
+    return bloki
+
+
+def _kafelki(bloki):
+    bok = USTAWIENIA['rozmiar_kafelka']
+    for wiersze, kolumny in bloki:
+        for r in range(0, len(wiersze), bok):
+            for c in range(0, len(kolumny), bok):
+                yield wiersze[r:r + bok], kolumny[c:c + bok]
+
+
+def _pobierz_kafelek(wspolrzedne, wiersze, kolumny, osrm_url):
+    # w zapytaniu tylko współrzędne kafelka, OSRM sources/destinations wskazują wiersze i kolumny
+    podzbior = sorted(set(wiersze.tolist()) | set(kolumny.tolist()))
+    pozycja_w_podzbiorze = {idx: k for k, idx in enumerate(podzbior)}
+    sub_czasy, sub_dystanse = _pobierz_tabele(
+        [wspolrzedne[idx] for idx in podzbior],
+        [pozycja_w_podzbiorze[i] for i in wiersze],
+        [pozycja_w_podzbiorze[j] for j in kolumny],
+        osrm_url)
+    return wiersze, kolumny, sub_czasy, sub_dystanse
+
+
+def get_osrm_matrix(points, osrm_url=OSRM_URL):
+    klucze = [klucz_punktu(p.lon, p.lat) for p in points]
+    unikalne = list(dict.fromkeys(klucze))
+    pozycje = {k: i for i, k in enumerate(unikalne)}
+
+    czasy, dystanse, trafienia = matrix_cache.pobierz(osrm_url, unikalne)
+    brak = np.isnan(czasy)
+
+    wspolrzedne = [wspolrzedne_klucza(k) for k in unikalne]
+    kafelki = list(_kafelki(_bloki_do_pobrania(brak)))
+    futures = [executor().submit(_pobierz_kafelek, wspolrzedne, w, k, osrm_url) for w, k in kafelki]
+
+    pary = []
+    blad = None
+    for future in futures:
+        try:
+            wiersze, kolumny, sub_czasy, sub_dystanse = future.result()
+        except Exception as e:
+            blad = e
+            continue
+
+        blok = np.ix_(wiersze, kolumny)
+        nowe = brak[blok] & ~np.isnan(sub_czasy) & ~np.isnan(sub_dystanse)
+        czasy[blok] = np.where(nowe, sub_czasy, czasy[blok])
+        dystanse[blok] = np.where(nowe, sub_dystanse, dystanse[blok])
+        brak[blok] &= ~nowe
+        for a, b in zip(*np.nonzero(nowe)):
+            i, j = wiersze[a], kolumny[b]
+            pary.append(((unikalne[i], unikalne[j]), czasy[i, j], dystanse[i, j]))
+
+    # pobrane kafelki zapisujemy nawet przy błędzie części z nich
+    matrix_cache.zapisz(osrm_url, pary)
+
+    print(f"Macierz OSRM {len(points)}x{len(points)}: z cache {trafienia} par, "
+          f"pobrano {len(pary)} par w {len(kafelki)} kafelkach")
+
+    if blad is not None:
+        print(f"Błąd OSRM Matrix: {blad}")
+        return None, None
+
+    if brak.any():
+        print("Błąd OSRM Matrix: brak trasy między częścią punktów")
+        return None, None
+
+    idx = [pozycje[k] for k in klucze]
+    return czasy[np.ix_(idx, idx)], dystanse[np.ix_(idx, idx)]
+
+
+def _pobierz_geometrie(punkty, osrm_url):
+    coords = ";".join([f"{p['lon']},{p['lat']}" for p in punkty])
+    url = f"{osrm_url}/route/v1/driving/{coords}?overview=full&geometries=geojson"
+
+    data = _zapytanie('route', url)
+    return data['routes'][0]['geometry']['coordinates']
+
+
+def _segmenty(punkty):
+    # kolejne segmenty zachodzą na siebie o jeden punkt, żeby dało się je skleić
+    dlugosc = max(USTAWIENIA['segment_trasy'], 2)
+    return [punkty[i:i + dlugosc] for i in range(0, max(len(punkty) - 1, 1), dlugosc - 1)]
+
+
+def pobierz_geometrie_tras(trasy, osrm_url=OSRM_URL):
+    """Pobiera równolegle geometrie wielu tras (listy punktów {'lat', 'lon'}).
+
+    Zwraca listę geometrii GeoJSON w tej samej kolejności; None dla tras,
+    których nie udało się pobrać.
+    """
+    zadania = []
+    for nr, punkty in enumerate(trasy):
+        if len(punkty) < 2:
+            continue
+        for segment in _segmenty(punkty):
+            zadania.append((nr, executor().submit(_pobierz_geometrie, segment, osrm_url)))
+
+    wspolrzedne = [[] for _ in trasy]
+    bledne = set()
+    for nr, future in zadania:
+        try:
+            fragment = future.result()
+        except Exception as e:
+            print(f"Błąd OSRM Geometry: {e}")
+            bledne.add(nr)
+            continue
+        if wspolrzedne[nr] and fragment and wspolrzedne[nr][-1] == fragment[0]:
+            fragment = fragment[1:]
+        wspolrzedne[nr].extend(fragment)
+
+    return [
+        {"type": "LineString", "coordinates": coords} if coords and nr not in bledne else None
+        for nr, coords in enumerate(wspolrzedne)
+    ]
+
+
+def get_full_route_geometry(ordered_points):
+    if len(ordered_points) < 2:
+        return None
+    return pobierz_geometrie_tras([ordered_points])[0]
@@ -0,0 +1,174 @@
+"""Profilowanie zapytań SQL w obrębie żądań HTTP (włączane przez SQL_PROFILER).
+
+Zdarzenia silnika SQLAlchemy mierzą każde zapytanie, a hooki Flaska zbierają
+je per żądanie: liczba zapytań, łączny czas bazy, najwolniejsze instrukcje
+i powtarzające się zapytania (wzorzec N+1). Wynik trafia do nagłówków
+X-SQL-Queries / X-SQL-Time-Ms oraz do zbiorczego raportu per endpoint.
+"""
+import re
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+NAJWOLNIEJSZE = 5  # instrukcji zapamiętywanych na endpoint
+
+_LISTA_PARAMETROW = re.compile(r'\((?:\s*%\(\w+\)s\s*,?)+\)')
+_PARAMETR = re.compile(r'%\(\w+\)s|\?|\$\d+')
+_LICZBA = re.compile(r'\b\d+(?:\.\d+)?\b')
+_TEKST = re.compile(r"'(?:[^']|'')*'")
+_BIALE_ZNAKI = re.compile(r'\s+')
+
+
+def normalizuj(instrukcja):
+    """Sprowadza instrukcję do wzorca: parametry, liczby, teksty i listy IN jako '?'."""
+    wzorzec = _TEKST.sub('?', instrukcja)
+    wzorzec = _LISTA_PARAMETROW.sub('(?)', wzorzec)
+    wzorzec = _PARAMETR.sub('?', wzorzec)
+    wzorzec = _LICZBA.sub('?', wzorzec)
+    return _BIALE_ZNAKI.sub(' ', wzorzec).strip()
+
+
+class StatystykiEndpointu:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.zadania = 0
+        self.zapytania = 0
+        self.czas_bazy = 0.0
+        self.czas_calkowity = 0.0
+        self.max_zapytan = 0
+        self.najwolniejsze = {}  # wzorzec -> najdłuższy czas
+        self.n_plus_1 = {}       # wzorzec -> największa liczba powtórzeń w jednym żądaniu
+
+    def dodaj(self, zapytania, czas_calkowity, progi_n_plus_1):
+        self.zadania += 1
+        self.zapytania += len(zapytania)
+        self.czas_bazy += sum(czas for _, czas in zapytania)
+        self.czas_calkowity += czas_calkowity
+        self.max_zapytan = max(self.max_zapytan, len(zapytania))
+
+        for wzorzec, czas in zapytania:
+            if czas > self.najwolniejsze.get(wzorzec, -1.0):
+                self.najwolniejsze[wzorzec] = czas
+        if len(self.najwolniejsze) > 4 * NAJWOLNIEJSZE:
+            self.najwolniejsze = dict(sorted(self.najwolniejsze.items(), key=lambda w: -w[1])[:NAJWOLNIEJSZE])
+
+        for wzorzec, liczba in progi_n_plus_1.items():
+            self.n_plus_1[wzorzec] = max(self.n_plus_1.get(wzorzec, 0), liczba)
+
+    def to_dict(self):
+        return {
+            'endpoint': self.endpoint,
+            'zadania': self.zadania,
+            'zapytania_srednio': round(self.zapytania / self.zadania, 1) if self.zadania else 0,
+            'max_zapytan': self.max_zapytan,
+            'czas_bazy_ms_srednio': round(1000 * self.czas_bazy / self.zadania, 1) if self.zadania else 0,
+            'czas_ms_srednio': round(1000 * self.czas_calkowity / self.zadania, 1) if self.zadania else 0,
+            'najwolniejsze': [{'czas_ms': round(1000 * czas, 2), 'sql': sql} for sql, czas in
+                              sorted(self.najwolniejsze.items(), key=lambda w: -w[1])[:NAJWOLNIEJSZE]],
+            'n_plus_1': [{'sql': sql, 'powtorzenia': liczba}
+                         for sql, liczba in sorted(self.n_plus_1.items(), key=lambda w: -w[1])]
+        }
+
+
+class ProfilerSQL:
+    def __init__(self, app=None):
+        self.wlaczony = False
+        self.prog_wolnego_ms = 500
+        self.prog_n_plus_1 = 5
+        self.endpointy = {}
+        self.wolne_zadania = deque(maxlen=50)
+        self._lock = threading.Lock()
+        self._nasluch = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.wlaczony = app.config.get('SQL_PROFILER', False)
+        self.prog_wolnego_ms = app.config.get('SQL_SLOW_REQUEST_MS', self.prog_wolnego_ms)
+        self.prog_n_plus_1 = app.config.get('SQL_N_PLUS_ONE', self.prog_n_plus_1)
+        app.extensions['profiler_sql'] = self
+        if not self.wlaczony:
+            return
+
+        if not self._nasluch:
+            event.listen(Engine, 'before_cursor_execute', self._przed_zapytaniem)
+            event.listen(Engine, 'after_cursor_execute', self._po_zapytaniu)
+            self._nasluch = True
+        app.before_request(self._poczatek_zadania)
+        app.after_request(self._koniec_zadania)
+
+    def _przed_zapytaniem(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'sql_zapytania' in g:
+            conn.info.setdefault('sql_start', []).append(time.perf_counter())
+
+    def _po_zapytaniu(self, conn, cursor, statement, parameters, context, executemany):
+        if not (has_request_context() and 'sql_zapytania' in g):
+            return
+        starty = conn.info.get('sql_start')
+        if not starty:
+            return
+        g.sql_zapytania.append((statement, time.perf_counter() - starty.pop()))
+
+    def _poczatek_zadania(self):
+        g.sql_zapytania = []
+        g.sql_start = time.perf_counter()
+
+    def _koniec_zadania(self, response):
+        zapytania = g.pop('sql_zapytania', None)
+        if zapytania is None:
+            return response
+        czas_calkowity = time.perf_counter() - g.pop('sql_start')
+        czas_bazy = sum(czas for _, czas in zapytania)
+
+        response.headers['X-SQL-Queries'] = str(len(zapytania))
+        response.headers['X-SQL-Time-Ms'] = f'{1000 * czas_bazy:.1f}'
+
+        znormalizowane = [(normalizuj(instrukcja), czas) for instrukcja, czas in zapytania]
+        wzorce = {}
+        for wzorzec, _ in znormalizowane:
+            wzorce[wzorzec] = wzorce.get(wzorzec, 0) + 1
+        n_plus_1 = {w: n for w, n in wzorce.items() if n >= self.prog_n_plus_1}
+
+        endpoint = request.endpoint or request.path
+        with self._lock:
+            if endpoint not in self.endpointy:
+                self.endpointy[endpoint] = StatystykiEndpointu(endpoint)
+            self.endpointy[endpoint].dodaj(znormalizowane, czas_calkowity, n_plus_1)
+
+        if n_plus_1:
+            response.headers['X-SQL-N-Plus-One'] = str(len(n_plus_1))
+
+        if 1000 * czas_calkowity >= self.prog_wolnego_ms:
+            wpis = {
+                'endpoint': endpoint,
+                'sciezka': request.full_path,
+                'metoda': request.method,
+                'czas_ms': round(1000 * czas_calkowity, 1),
+                'czas_bazy_ms': round(1000 * czas_bazy, 1),
+                'zapytania': [{'czas_ms': round(1000 * c, 2), 'sql': s} for s, c in zapytania]
+            }
+            with self._lock:
+                self.wolne_zadania.appendleft(wpis)
+            print(f"Wolne żądanie {request.method} {request.full_path}: {wpis['czas_ms']} ms, "
+                  f"{len(zapytania)} zapytań SQL ({wpis['czas_bazy_ms']} ms)")
+            for z in wpis['zapytania']:
+                print(f"  {z['czas_ms']:>8} ms  {_BIALE_ZNAKI.sub(' ', z['sql'])}")
+        return response
+
+    def raport(self):
+        with self._lock:
+            endpointy = sorted((s.to_dict() for s in self.endpointy.values()),
+                               key=lambda e: e['czas_bazy_ms_srednio'] * e['zadania'], reverse=True)
+            return {'wlaczony': self.wlaczony, 'endpointy': endpointy, 'wolne_zadania': list(self.wolne_zadania)}
+
+    def wyczysc(self):
+        with self._lock:
+            self.endpointy.clear()
+            self.wolne_zadania.clear()
+
+
+profiler_sql = ProfilerSQL()
@@ -0,0 +1,464 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from ortools.constraint_solver import routing_enums_pb2
+from ortools.constraint_solver import pywrapcp
+
+from models import db, Trasa
+from matrix_providers import matrix_providers
+from solver_profiles import PROFILE_WYSZUKIWANIA, DOMYSLNY_PROFIL
+import dekompozycja
+import metryki
+
+CZAS_OBSLUGI_MIN = 15
+
+
+def parametry_wyszukiwania(profil, liczba_punktow):
+    """Zwraca (parametry OR-Tools, plateau w sekundach) dla profilu i rozmiaru instancji."""
+    ustawienia = PROFILE_WYSZUKIWANIA[profil]
+    limit_s = min(ustawienia['limit_bazowy_s'] + ustawienia['limit_na_punkt_s'] * liczba_punktow,
+                  ustawienia['limit_max_s'])
+
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = getattr(
+        routing_enums_pb2.FirstSolutionStrategy, ustawienia['pierwsze_rozwiazanie'])
+    search_parameters.local_search_metaheuristic = getattr(
+        routing_enums_pb2.LocalSearchMetaheuristic, ustawienia['metaheurystyka'])
+    search_parameters.time_limit.FromMilliseconds(int(limit_s * 1000))
+    return search_parameters, ustawienia['plateau_s']
+
+
+class StopNaPlateau:
+    """Kończy wyszukiwanie, gdy koszt najlepszego rozwiązania nie spadł przez zadany czas.
+
+    Poprawy rejestruje callback AtSolution, a zegar sprawdza limit solvera (CustomLimit),
+    który OR-Tools odpytuje przez cały czas wyszukiwania, także gdy nowe rozwiązania
+    przestają się pojawiać albo metaheurystyka zgłasza tylko rozwiązania lepsze.
+    """
+
+    def __init__(self, routing, plateau_s):
+        self.routing = routing
+        self.plateau_s = plateau_s
+        self.najlepszy = None
+        self.ostatnia_poprawa = time.perf_counter()
+        self.rozwiazania = 0
+        routing.AddAtSolutionCallback(self.rozwiazanie)
+        routing.AddSearchMonitor(routing.solver().CustomLimit(self.przekroczony))
+
+    def rozwiazanie(self):
+        self.rozwiazania += 1
+        koszt = self.routing.CostVar().Value()
+        if self.najlepszy is None or koszt < self.najlepszy:
+            self.najlepszy = koszt
+            self.ostatnia_poprawa = time.perf_counter()
+
+    def przekroczony(self):
+        # przed pierwszym rozwiązaniem nie przerywamy, bo zostalibyśmy bez planu
+        return self.najlepszy is not None and time.perf_counter() - self.ostatnia_poprawa > self.plateau_s
+
+
+def time_to_minutes(time_str):
+    if not time_str: return 0
+    h, m = map(int, time_str.split(':'))
+    return h * 60 + m
+
+
+def poprzednie_trasy_zlecenia(zlecenie):
+    """Kolejność punktów z zapisanych tras: {id_pojazdu: [id_punktu, ...]} bez HUBa i powrotu."""
+    # tylko potrzebne kolumny, bez ładowania geometrii tras
+    trasy = db.session.query(Trasa.id_pojazdu, Trasa.szczegoly_punktow).filter_by(id_zlecenia=zlecenie.id).all()
+    return {
+        id_pojazdu: [p['id_punktu'] for p in (szczegoly or []) if p.get('typ') not in ('HUB', 'END')]
+        for id_pojazdu, szczegoly in trasy
+    }
+
+
+def plan_startowy(poprzednie_trasy, punkty_sorted, pojazdy, time_matrix, demands, vehicle_capacities):
+    """Naprawia zapisany plan: usuwa nieistniejące punkty, a nowe wstawia metodą najtańszego wstawienia.
+
+    Zwraca listę tras (indeksy węzłów bez magazynu) dla każdego pojazdu.
+    """
+    wezel = {p.id: i for i, p in enumerate(punkty_sorted) if i != 0}
+    czasy = np.asarray(time_matrix)
+
+    trasy = []
+    przypisane = set()
+    for v in pojazdy:
+        trasa = []
+        for id_punktu in poprzednie_trasy.get(v.id_pojazdu, []):
+            n = wezel.get(id_punktu)
+            if n is not None and n not in przypisane:
+                trasa.append(n)
+                przypisane.add(n)
+        trasy.append(trasa)
+
+    ladunek = [sum(demands[n] for n in trasa) for trasa in trasy]
+    for n in range(1, len(punkty_sorted)):
+        if n in przypisane:
+            continue
+        najlepszy = None
+        for v, trasa in enumerate(trasy):
+            if ladunek[v] + demands[n] > vehicle_capacities[v]:
+                continue
+            sciezka = np.array([0] + trasa + [0])
+            koszt = czasy[sciezka[:-1], n] + czasy[n, sciezka[1:]] - czasy[sciezka[:-1], sciezka[1:]]
+            pozycja = int(np.argmin(koszt))
+            if najlepszy is None or koszt[pozycja] < najlepszy[0]:
+                najlepszy = (koszt[pozycja], v, pozycja)
+        if najlepszy is None:
+            return None
+        _, v, pozycja = najlepszy
+        trasy[v].insert(pozycja, n)
+        ladunek[v] += demands[n]
+    return trasy
+
+
+def macierz_czasow(durations):
+    """Czasy w minutach z doliczonym czasem obsługi punktu."""
+    time_matrix = (np.asarray(durations, dtype=float) // 60).astype(np.int64)  # sekundy -> minuty
+    time_matrix[1:, :] += CZAS_OBSLUGI_MIN  # obsługa punktu doliczana do wyjazdu z niego (poza magazynem)
+    return time_matrix
+
+
+def dane_punktow_i_pojazdow(punkty_sorted, pojazdy, dane_punktow=None):
+    """Popyt, okna czasowe (minuty) i pojemności jako tablice NumPy.
+
+    dane_punktow to opcjonalny wynik models.wczytaj_dane_zlecenia w tej samej kolejności
+    co punkty_sorted; wtedy popyt i okna nie są liczone punkt po punkcie.
+    """
+    if dane_punktow is not None and len(dane_punktow['id']) == len(punkty_sorted):
+        demands = dane_punktow['waga'].astype(np.int64)
+        time_windows = dane_punktow['okna'].copy()
+    else:
+        demands = np.fromiter((int(p.waga) for p in punkty_sorted), dtype=np.int64, count=len(punkty_sorted))
+        time_windows = np.array([(time_to_minutes(p.okno_od), time_to_minutes(p.okno_do)) for p in punkty_sorted],
+                                dtype=np.int64).reshape(-1, 2)
+    demands[0] = 0
+    vehicle_capacities = np.fromiter((int(v.pojemnosc) for v in pojazdy), dtype=np.int64, count=len(pojazdy))
+    return demands, time_windows, vehicle_capacities
+
+
+def dane_modelu(punkty_sorted, pojazdy, durations, dane_punktow=None):
+    """Macierze NumPy dla modelu: czasy w minutach z doliczonym czasem obsługi, popyt, okna, pojemności."""
+    demands, time_windows, vehicle_capacities = dane_punktow_i_pojazdow(punkty_sorted, pojazdy, dane_punktow)
+    return macierz_czasow(durations), demands, time_windows, vehicle_capacities
+
+
+def rozwiaz_model(time_matrix, demands, time_windows, vehicle_capacities, profil=DOMYSLNY_PROFIL,
+                  plateau_s=None, trasy_startowe=None):
+    """Buduje i rozwiązuje model OR-Tools na gotowych macierzach.
+
+    Macierz czasów i wektor popytu są rejestrowane natywnie (RegisterTransitMatrix,
+    RegisterUnaryTransitVector), więc w trakcie wyszukiwania OR-Tools nie wywołuje Pythona.
+    Zwraca słownik z trasami pojazdów ('wezly', 'przyjazdy', 'ladunki' od wyjazdu
+    z magazynu do powrotu); 'trasy' to None, gdy nie znaleziono rozwiązania.
+    """
+    num_vehicles = len(vehicle_capacities)
+    depot_index = 0
+
+    manager = pywrapcp.RoutingIndexManager(len(time_matrix), num_vehicles, depot_index)
+    routing = pywrapcp.RoutingModel(manager)
+
+    transit_callback_index = routing.RegisterTransitMatrix(np.asarray(time_matrix, dtype=np.int64).tolist())
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+    time_dimension_name = 'Time'
+    routing.AddDimension(
+        transit_callback_index,
+        30,      # allow_waiting_time
+        24 * 60, # max_time_per_vehicle
+        False,   # Don't force start cumul to zero
+        time_dimension_name)
+    time_dimension = routing.GetDimensionOrDie(time_dimension_name)
+
+    for location_idx, (start, end) in enumerate(np.asarray(time_windows).tolist()):
+        if location_idx == 0: continue
+        index = manager.NodeToIndex(location_idx)
+        time_dimension.CumulVar(index).SetRange(start, end)
+
+    demand_callback_index = routing.RegisterUnaryTransitVector(np.asarray(demands, dtype=np.int64).tolist())
+    routing.AddDimensionWithVehicleCapacity(
+        demand_callback_index,
+        0,
+        np.asarray(vehicle_capacities, dtype=np.int64).tolist(),
+        True,
+        'Capacity')
+    capacity_dimension = routing.GetDimensionOrDie('Capacity')
+
+    search_parameters, plateau_profilu = parametry_wyszukiwania(profil, len(time_matrix))
+    stop = StopNaPlateau(routing, plateau_s if plateau_s is not None else plateau_profilu)
+
+    start = time.perf_counter()
+    plan = None
+    if trasy_startowe is not None:
+        routing.CloseModelWithParameters(search_parameters)
+        plan = routing.ReadAssignmentFromRoutes(trasy_startowe, True)
+        if plan is None:
+            print("Poprzedni plan nie daje się naprawić, optymalizacja od zera")
+
+    if plan is not None:
+        solution = routing.SolveFromAssignmentWithParameters(plan, search_parameters)
+    else:
+        solution = routing.SolveWithParameters(search_parameters)
+
+    wynik = {
+        'trasy': None,
+        'koszt': None,
+        'czas_solvera': time.perf_counter() - start,
+        'start': 'z poprzedniego planu' if plan is not None else 'od zera',
+        'profil': profil,
+        'rozwiazania': stop.rozwiazania,
+    }
+    if not solution:
+        return wynik
+
+    trasy = []
+    for vehicle_id in range(num_vehicles):
+        index = routing.Start(vehicle_id)
+        wezly, przyjazdy, ladunki = [], [], []
+        while True:
+            wezly.append(manager.IndexToNode(index))
+            przyjazdy.append(solution.Min(time_dimension.CumulVar(index)))
+            ladunki.append(solution.Value(capacity_dimension.CumulVar(index)))
+            if routing.IsEnd(index):
+                break
+            index = solution.Value(routing.NextVar(index))
+        trasy.append({'wezly': wezly, 'przyjazdy': przyjazdy, 'ladunki': ladunki})
+
+    wynik['trasy'] = trasy
+    wynik['koszt'] = solution.ObjectiveValue()
+    return wynik
+
+
+def _koszt_trasy(time_matrix, wezly):
+    wezly = np.asarray(wezly)
+    return int(time_matrix[wezly[:-1], wezly[1:]].sum())
+
+
+def _pusta_trasa():
+    return {'wezly': [0, 0], 'przyjazdy': [0, 0], 'ladunki': [0, 0], 'dystans_m': 0.0, 'koszt': 0}
+
+
+def _popraw_pary(punkty_sorted, klastry, przydzial, trasy, demands, time_windows, vehicle_capacities,
+                 provider, plateau_s, pula):
+    """Przegląd par sąsiednich klastrów: wspólne rozwiązanie od bieżących tras, przyjmowane przy niższym koszcie."""
+    m = len(klastry)
+    rundy = [[(i, i + 1) for i in range(0, m - 1, 2)], [(i, i + 1) for i in range(1, m - 1, 2)]]
+    if m > 2:
+        rundy.append([(m - 1, 0)])
+
+    poprawione = 0
+    for runda in rundy:
+        zadania = []
+        for a, b in runda:
+            pojazdy_pary = przydzial[a] + przydzial[b]
+            wezly = np.concatenate(([0], klastry[a], klastry[b]))
+            lokalny = {int(w): i for i, w in enumerate(wezly)}
+            durations, distances, _ = matrix_providers.pobierz_macierz([punkty_sorted[w] for w in wezly], provider)
+            if durations is None:
+                continue
+            time_matrix = macierz_czasow(durations)
+            startowe = [[lokalny[w] for w in trasy[v]['wezly'][1:-1]] for v in pojazdy_pary]
+            przed = sum(trasy[v]['koszt'] for v in pojazdy_pary)
+            future = pula.submit(rozwiaz_model, time_matrix, demands[wezly], time_windows[wezly],
+                                 vehicle_capacities[pojazdy_pary], 'fast', plateau_s, startowe)
+            zadania.append((a, b, wezly, pojazdy_pary, time_matrix, np.asarray(distances), przed, future))
+
+        for a, b, wezly, pojazdy_pary, time_matrix, dystanse, przed, future in zadania:
+            wynik = future.result()
+            if wynik['trasy'] is None or wynik['koszt'] >= przed:
+                continue
+            poprawione += 1
+            dekompozycja.mapuj_wynik(wynik, wezly, pojazdy_pary, trasy, dystanse)
+            for v, trasa in zip(pojazdy_pary, wynik['trasy']):
+                trasy[v]['koszt'] = _koszt_trasy(time_matrix, trasa['wezly'])
+            # punkty mogły przejść między pojazdami sąsiednich klastrów
+            for c in (a, b):
+                klastry[c] = np.array([w for v in przydzial[c] for w in trasy[v]['wezly'][1:-1]], dtype=np.int64)
+    return poprawione
+
+
+def rozwiaz_dekompozycja(punkty_sorted, pojazdy, provider, profil, plateau_s, dane_punktow, ustawienia, statystyki):
+    """Tryb dla dużych zleceń: klastry metodą sweep, osobne modele w procesach roboczych, scalenie tras.
+
+    Macierze liczone są tylko wewnątrz klastrów (i par sąsiednich klastrów przy poprawie),
+    więc ich rozmiar spada z n^2 do około n^2 / liczba_klastrów. Zwraca (wynik jak z
+    rozwiaz_model z 'dystans_m' w każdej trasie, nazwa użytego providera).
+    """
+    demands, time_windows, vehicle_capacities = dane_punktow_i_pojazdow(punkty_sorted, pojazdy, dane_punktow)
+    if dane_punktow is not None and len(dane_punktow['id']) == len(punkty_sorted):
+        lat, lon = dane_punktow['lat'], dane_punktow['lon']
+    else:
+        lat = np.fromiter((p.lat for p in punkty_sorted), dtype=float, count=len(punkty_sorted))
+        lon = np.fromiter((p.lon for p in punkty_sorted), dtype=float, count=len(punkty_sorted))
+
+    m = dekompozycja.liczba_klastrow(len(punkty_sorted) - 1, len(pojazdy), ustawienia['rozmiar_klastra'])
+    klastry = dekompozycja.podziel_sweep(lat, lon, demands, m)
+    przydzial = dekompozycja.przydziel_pojazdy(klastry, demands, vehicle_capacities)
+
+    start = time.perf_counter()
+    modele = []
+    uzyty_provider = None
+    for klaster, pojazdy_klastra in zip(klastry, przydzial):
+        wezly = np.concatenate(([0], klaster))
+        durations, distances, uzyty_provider = matrix_providers.pobierz_macierz(
+            [punkty_sorted[w] for w in wezly], provider)
+        if durations is None:
+            return None, None
+        modele.append((wezly, pojazdy_klastra, macierz_czasow(durations), np.asarray(distances)))
+    statystyki['czas_macierzy'] = time.perf_counter() - start
+    metryki.czas_macierzy.observe(statystyki['czas_macierzy'], uzyty_provider)
+
+    start = time.perf_counter()
+    procesy = min(ustawienia['procesy'] or os.cpu_count() or 1, len(modele))
+    with ProcessPoolExecutor(max_workers=procesy, mp_context=multiprocessing.get_context('spawn')) as pula:
+        futures = [
+            pula.submit(rozwiaz_model, time_matrix, demands[wezly], time_windows[wezly],
+                        vehicle_capacities[pojazdy_klastra], profil, plateau_s)
+            for wezly, pojazdy_klastra, time_matrix, _ in modele
+        ]
+        wyniki = [f.result() for f in futures]
+
+        wynik = {
+            'trasy': None,
+            'koszt': None,
+            'czas_solvera': time.perf_counter() - start,
+            'start': f'dekompozycja ({len(modele)} klastrów)',
+            'profil': profil,
+            'rozwiazania': sum(w['rozwiazania'] for w in wyniki),
+        }
+        statystyki['klastry'] = len(modele)
+        if any(w['trasy'] is None for w in wyniki):
+            print(f"Dekompozycja: brak rozwiązania w {sum(w['trasy'] is None for w in wyniki)} z {len(modele)} klastrów")
+            return wynik, uzyty_provider
+
+        trasy = [_pusta_trasa() for _ in pojazdy]
+        for (wezly, pojazdy_klastra, time_matrix, dystanse), w in zip(modele, wyniki):
+            dekompozycja.mapuj_wynik(w, wezly, pojazdy_klastra, trasy, dystanse)
+            for v, trasa in zip(pojazdy_klastra, w['trasy']):
+                trasy[v]['koszt'] = _koszt_trasy(time_matrix, trasa['wezly'])
+
+        if ustawienia['poprawa'] and len(modele) > 1:
+            start_poprawy = time.perf_counter()
+            statystyki['poprawione_pary'] = _popraw_pary(
+                punkty_sorted, klastry, przydzial, trasy, demands, time_windows, vehicle_capacities,
+                provider, plateau_s, pula)
+            statystyki['czas_poprawy'] = time.perf_counter() - start_poprawy
+
+    wynik['czas_solvera'] = time.perf_counter() - start
+    wynik['trasy'] = trasy
+    wynik['koszt'] = sum(t['koszt'] for t in trasy)
+    return wynik, uzyty_provider
+
+
+def solve_vrp_google(zlecenie, pojazdy, punkty_sorted, provider=None, statystyki=None, poprzednie_trasy=None,
+                     profil=DOMYSLNY_PROFIL, plateau_s=None, dane_punktow=None, ustawienia_dekompozycji=None):
+    if statystyki is None:
+        statystyki = {}
+
+    dist_matrix = None
+    if ustawienia_dekompozycji and len(punkty_sorted) - 1 > ustawienia_dekompozycji['prog']:
+        if poprzednie_trasy:
+            print("Tryb dekompozycji: poprzedni plan nie jest używany jako start")
+        wynik, uzyty_provider = rozwiaz_dekompozycja(punkty_sorted, pojazdy, provider, profil, plateau_s,
+                                                     dane_punktow, ustawienia_dekompozycji, statystyki)
+        if wynik is None:
+            metryki.wyniki_optymalizacji.inc('blad_osrm')
+            return None, "Błąd OSRM"
+    else:
+        start = time.perf_counter()
+        durations, distances, uzyty_provider = matrix_providers.pobierz_macierz(punkty_sorted, provider)
+        statystyki['czas_macierzy'] = time.perf_counter() - start
+        if durations is None:
+            metryki.wyniki_optymalizacji.inc('blad_osrm')
+            return None, "Błąd OSRM"
+        metryki.czas_macierzy.observe(statystyki['czas_macierzy'], uzyty_provider)
+
+        time_matrix, demands, time_windows, vehicle_capacities = dane_modelu(punkty_sorted, pojazdy, durations, dane_punktow)
+        dist_matrix = np.asarray(distances) # metry
+
+        trasy_startowe = None
+        if poprzednie_trasy:
+            trasy_startowe = plan_startowy(poprzednie_trasy, punkty_sorted, pojazdy, time_matrix, demands, vehicle_capacities)
+            if trasy_startowe is None:
+                print("Poprzedni plan nie daje się naprawić, optymalizacja od zera")
+
+        wynik = rozwiaz_model(time_matrix, demands, time_windows, vehicle_capacities, profil, plateau_s, trasy_startowe)
+    for klucz in ('czas_solvera', 'start', 'profil', 'rozwiazania', 'koszt'):
+        statystyki[klucz] = wynik[klucz]
+    metryki.rozmiar_macierzy.observe(len(punkty_sorted))
+    metryki.czas_solvera.observe(wynik['czas_solvera'], profil)
+
+    if wynik['trasy'] is None:
+        metryki.wyniki_optymalizacji.inc('brak_rozwiazania')
+        return None, "Brak rozwiązania."
+
+    routes_result = []
+    for vehicle_id, trasa in enumerate(wynik['trasy']):
+        wezly = trasa['wezly']
+        if len(wezly) <= 2:
+            continue
+
+        route_details_json = []
+        for node_index, przyjazd, ladunek in zip(wezly[:-1], trasa['przyjazdy'], trasa['ladunki']):
+            p_obj = punkty_sorted[node_index]
+            route_details_json.append({
+                "id_punktu": p_obj.id,
+                "nazwa": p_obj.nazwa,
+                "typ": p_obj.typ,
+                "przyjazd_min": przyjazd,
+                "ladunek": ladunek
+            })
+
+        p_obj = punkty_sorted[wezly[-1]]
+        route_details_json.append({
+            "id_punktu": p_obj.id,
+            "nazwa": "Powrót: " + p_obj.nazwa,
+            "typ": "END",
+            "ladunek": trasa['ladunki'][-1]  # ładunek całej trasy (analityka.py)
+        })
+
+        if 'dystans_m' in trasa:
+            route_dist_meters = trasa['dystans_m']
+        else:
+            route_dist_meters = dist_matrix[wezly[:-1], wezly[1:]].sum()
+        routes_result.append({
+            "pojazd_db": pojazdy[vehicle_id],
+            "punkty_json": route_details_json,
+            "czas_calkowity": trasa['przyjazdy'][-1],
+            "dystans_km": round(float(route_dist_meters) / 1000, 2),
+            "punkty_trasy": [{'lat': punkty_sorted[n].lat, 'lon': punkty_sorted[n].lon} for n in wezly]
+        })
+
+    # geometrie wszystkich tras pobieramy równolegle dopiero po rozwiązaniu
+    start = time.perf_counter()
+    geometrie = matrix_providers.pobierz_geometrie([r.pop("punkty_trasy") for r in routes_result], uzyty_provider)
+    for wynik_trasy, geometria in zip(routes_result, geometrie):
+        wynik_trasy["geometria"] = geometria
+    statystyki['czas_geometrii'] = time.perf_counter() - start
+
+    metryki.koszt_rozwiazania.observe(wynik['koszt'])
+    metryki.pojazdy_przypisane.inc(wartosc=len(pojazdy))
+    metryki.pojazdy_uzyte.inc(wartosc=len(routes_result))
+    metryki.udzial_pojazdow.observe(len(routes_result) / len(pojazdy))
+    metryki.wyniki_optymalizacji.inc('ok')
+
+    print(f"Czasy optymalizacji: macierz {statystyki['czas_macierzy']:.2f}s, "
+          f"solver {statystyki['czas_solvera']:.2f}s, geometria {statystyki['czas_geometrii']:.2f}s")
+
+    if uzyty_provider != (provider or matrix_providers.domyslny):
+        return routes_result, f"Użyto zapasowego źródła macierzy: {uzyty_provider}"
+    return routes_result, "OK"
+
+
+def przygotuj_punkty(zlecenie):
+    """Zwraca (punkty z HUBem na początku, komunikat błędu)."""
+    hubs = [p for p in zlecenie.punkty if p.typ == 'HUB']
+    deliveries = [p for p in zlecenie.punkty if p.typ == 'DELIVERY']
+
+    if not hubs:
+        return None, 'Brak HUBa.'
+    return [hubs[0]] + deliveries, None
@@ -0,0 +1,26 @@
+# Profile wyszukiwania OR-Tools. Nazwy strategii jako tekst, żeby warstwa WWW nie musiała importować OR-Tools.
+# limit czasu = bazowy + na_punkt * liczba punktów (ograniczony z góry), plateau = sekundy bez poprawy
+PROFILE_WYSZUKIWANIA = {
+    'fast': {
+        'opis': 'Szybki',
+        'pierwsze_rozwiazanie': 'PATH_CHEAPEST_ARC',
+        'metaheurystyka': 'GREEDY_DESCENT',
+        'limit_bazowy_s': 1, 'limit_na_punkt_s': 0.02, 'limit_max_s': 10,
+        'plateau_s': 0.5,
+    },
+    'balanced': {
+        'opis': 'Zrównoważony',
+        'pierwsze_rozwiazanie': 'PATH_CHEAPEST_ARC',
+        'metaheurystyka': 'GUIDED_LOCAL_SEARCH',
+        'limit_bazowy_s': 2, 'limit_na_punkt_s': 0.05, 'limit_max_s': 60,
+        'plateau_s': 2,
+    },
+    'quality': {
+        'opis': 'Jakościowy',
+        'pierwsze_rozwiazanie': 'PARALLEL_CHEAPEST_INSERTION',
+        'metaheurystyka': 'GUIDED_LOCAL_SEARCH',
+        'limit_bazowy_s': 5, 'limit_na_punkt_s': 0.2, 'limit_max_s': 300,
+        'plateau_s': 10,
+    },
+}
+DOMYSLNY_PROFIL = 'balanced'
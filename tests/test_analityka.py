@@ -0,0 +1,87 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from analityka import wskazniki_floty, zakres_dat
+
+KOLUMNY = ['okres', 'id_pojazdu', 'dni_aktywne', 'trasy', 'przystanki', 'dystans_km', 'czas_min', 'ladunek', 'pojemnosc']
+
+
+def flota(n=2):
+    return pd.DataFrame([(i, f'KR{i:05d}', 1000.0) for i in range(1, n + 1)],
+                        columns=['id_pojazdu', 'numer_rejestracyjny', 'pojemnosc_pojazdu'])
+
+
+def dane(*wiersze):
+    # jak wynik zapytania: okres jako date (date_trunc(...)::date), sumy jako Decimal/int/float
+    return pd.DataFrame(list(wiersze), columns=KOLUMNY)
+
+
+def okres(wynik, poczatek):
+    return next(o for o in wynik['okresy'] if o['okres'] == poczatek)
+
+
+def test_dni():
+    wynik = wskazniki_floty(dane(
+        (date(2026, 3, 2), 1, 1, 2, 10, 50.0, 120.0, 800.0, 2000.0),
+        (date(2026, 3, 3), 1, 1, 1, 4, 20.0, 60.0, 500.0, 1000.0),
+        (date(2026, 3, 3), 2, 1, 1, 6, 30.0, 90.0, 1000.0, 1000.0),
+    ), flota(), 'dzien', date(2026, 3, 2), date(2026, 3, 4))
+
+    assert [o['okres'] for o in wynik['okresy']] == ['2026-03-02', '2026-03-03']
+    pierwszy, drugi = wynik['okresy']
+    assert pierwszy['wykorzystanie_floty'] == 0.5
+    assert pierwszy['wsp_zaladunku'] == 0.4
+    assert pierwszy['przystanki_na_trase'] == 5
+    assert drugi['wykorzystanie_floty'] == 1.0
+    assert drugi['km_na_pojazd'] == 25
+
+    pojazd = next(p for p in wynik['pojazdy'] if p['id_pojazdu'] == 1)
+    assert pojazd['wykorzystanie'] == pytest.approx(2 / 3, abs=1e-3)
+    assert pojazd['km_na_trase'] == pytest.approx(70 / 3, abs=1e-3)
+
+
+def test_tygodnie_przyciete_do_zakresu():
+    # od w środę: pierwszy tydzień (od poniedziałku 2 marca) liczy się od 4 do 8 marca
+    wynik = wskazniki_floty(dane(
+        (date(2026, 3, 2), 1, 5, 5, 10, 100.0, 300.0, 500.0, 5000.0),
+        (date(2026, 3, 9), 1, 7, 7, 14, 140.0, 420.0, 700.0, 7000.0),
+    ), flota(1), 'tydzien', date(2026, 3, 4), date(2026, 3, 15))
+
+    assert okres(wynik, '2026-03-02')['wykorzystanie_floty'] == 1.0
+    assert okres(wynik, '2026-03-09')['wykorzystanie_floty'] == 1.0
+
+
+def test_miesiace_przyciete_do_zakresu():
+    # luty od 15 (14 dni), marzec do 10 (10 dni), flota 2 pojazdów
+    wynik = wskazniki_floty(dane(
+        (date(2026, 2, 1), 1, 7, 7, 7, 70.0, 100.0, 100.0, 1000.0),
+        (date(2026, 3, 1), 1, 5, 5, 5, 50.0, 100.0, 100.0, 1000.0),
+    ), flota(), 'miesiac', date(2026, 2, 15), date(2026, 3, 10))
+
+    assert okres(wynik, '2026-02-01')['wykorzystanie_floty'] == 0.25
+    assert okres(wynik, '2026-03-01')['wykorzystanie_floty'] == 0.25
+
+
+def test_okres_ze_strefa_czasowa():
+    # date_trunc bez rzutowania zwraca timestamptz
+    wynik = wskazniki_floty(dane(
+        (pd.Timestamp('2026-03-02', tz='Europe/Warsaw'), 1, 1, 1, 3, 10.0, 30.0, 100.0, 1000.0),
+    ), flota(1), 'tydzien', date(2026, 3, 2), date(2026, 3, 8))
+
+    assert wynik['okresy'][0]['okres'] == '2026-03-02'
+    assert wynik['okresy'][0]['wykorzystanie_floty'] == pytest.approx(1 / 7, abs=1e-3)
+
+
+def test_bez_tras():
+    wynik = wskazniki_floty(dane(), flota(), 'tydzien', date(2026, 3, 2), date(2026, 3, 8))
+
+    assert wynik['okresy'] == []
+    assert [p['trasy'] for p in wynik['pojazdy']] == [0, 0]
+
+
+def test_zakres_dat():
+    assert zakres_dat('2026-03-01', '2026-03-31') == (date(2026, 3, 1), date(2026, 3, 31))
+    with pytest.raises(ValueError):
+        zakres_dat('2026-04-01', '2026-03-01')
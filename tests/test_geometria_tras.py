@@ -0,0 +1,33 @@
+from models import Trasa
+
+
+def linia(*wspolrzedne):
+    return {'type': 'LineString', 'coordinates': [list(w) for w in wspolrzedne]}
+
+
+def test_zwinieta_petla_zostawia_pelna_geometrie():
+    trasa = Trasa()
+    trasa.ustaw_geometrie(linia((19, 50), (19.0005, 50.0003), (19, 50)))
+    assert len(trasa.geojson('srednia')['coordinates']) == 3  # przy 0.0001 pętla zostaje
+    assert trasa.geometria_niska is None
+    assert len(trasa.geojson('niska')['coordinates']) == 3
+
+
+def test_uproszczenie_zachowuje_ksztalt_trasy():
+    trasa = Trasa()
+    trasa.ustaw_geometrie(linia((19, 50), (19.00001, 50.00001), (19.01, 50.02), (19.03, 50.0), (19.05, 50.04)))
+    assert trasa.geometria_niska is not None
+    assert len(trasa.geojson('niska')['coordinates']) == 4
+
+
+def test_brak_geometrii():
+    trasa = Trasa()
+    trasa.ustaw_geometrie({'type': 'LineString', 'coordinates': [[19, 50]]})
+    assert trasa.geojson() is None
+
+
+def test_prosta_trasa_uproszczona_do_dwoch_punktow():
+    trasa = Trasa()
+    trasa.ustaw_geometrie(linia((19, 50), (19.01, 50.00001), (19.02, 50), (19.03, 50.00001), (19.04, 50)))
+    assert trasa.geometria_niska is not None
+    assert trasa.geojson('niska')['coordinates'] == ((19.0, 50.0), (19.04, 50.0))
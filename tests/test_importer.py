@@ -0,0 +1,58 @@
+import io
+import json
+
+import pytest
+
+from importer import BladImportu, KOLUMNY_PUNKTOW, _kawalki
+
+
+def kawalki(tresc, nazwa):
+    dane = tresc.encode('utf-8') if isinstance(tresc, str) else tresc
+    return list(_kawalki(io.BytesIO(dane), nazwa, KOLUMNY_PUNKTOW))
+
+
+def test_pusty_csv_to_blad_importu():
+    with pytest.raises(BladImportu):
+        kawalki('', 'punkty.csv')
+
+
+def test_csv_z_samych_bialych_znakow_to_blad_importu():
+    with pytest.raises(BladImportu):
+        kawalki('\n\n', 'punkty.csv')
+
+
+def test_csv_numery_wierszy_od_naglowka():
+    wynik = kawalki('nazwa;typ;waga;lat;lon\nA;HUB;0;50.0;19.9\nB;DELIVERY;5;50.1;19.8\n', 'punkty.csv')
+    assert len(wynik) == 1
+    assert list(wynik[0].index) == [2, 3]
+    assert list(wynik[0]['nazwa']) == ['A', 'B']
+
+
+@pytest.mark.parametrize('dane', [[1, 2], 'tekst', 5, None])
+def test_geojson_bez_obiektu_na_gorze_to_blad_importu(dane):
+    with pytest.raises(BladImportu):
+        kawalki(json.dumps(dane), 'punkty.geojson')
+
+
+def test_geojson_cecha_nie_obiekt_to_blad_importu():
+    dane = {'type': 'FeatureCollection', 'features': [1]}
+    with pytest.raises(BladImportu):
+        kawalki(json.dumps(dane), 'punkty.geojson')
+
+
+def test_geojson_features_nie_lista_to_blad_importu():
+    dane = {'type': 'FeatureCollection', 'features': {'a': 1}}
+    with pytest.raises(BladImportu):
+        kawalki(json.dumps(dane), 'punkty.geojson')
+
+
+def test_geojson_niepoprawna_geometria_daje_puste_wspolrzedne():
+    dane = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'nazwa': 'A'}, 'geometry': {'type': 'Point', 'coordinates': 5}},
+        {'type': 'Feature', 'properties': 'x', 'geometry': [1, 2]},
+        {'type': 'Feature', 'properties': {'nazwa': 'C'}, 'geometry': {'type': 'Point', 'coordinates': [19.9, 50.0]}},
+    ]}
+    wynik = kawalki(json.dumps(dane), 'punkty.geojson')[0]
+    assert list(wynik.index) == [1, 2, 3]
+    assert wynik.loc[1, 'lat'] is None or wynik.loc[1, 'lat'] != wynik.loc[1, 'lat']
+    assert (wynik.loc[3, 'lon'], wynik.loc[3, 'lat']) == (19.9, 50.0)
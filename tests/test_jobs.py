@@ -0,0 +1,62 @@
+import os
+import socket
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from jobs import KolejkaOptymalizacji
+from models import db, ZadanieOptymalizacji
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://')
+    db.init_app(app)
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[ZadanieOptymalizacji.__table__])
+        yield app
+
+
+def martwy_pid():
+    proces = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proces.wait()
+    return proces.pid
+
+
+def zadanie(id, wlasciciel, status='trwa', wiek_s=0):
+    db.session.add(ZadanieOptymalizacji(
+        id=id, id_zlecenia=1, id_uzytkownika=1, status=status, wlasciciel=wlasciciel,
+        data_utworzenia=datetime.utcnow() - timedelta(seconds=wiek_s)))
+
+
+def test_odzyskuje_zadania_martwych_procesow_i_przeterminowane(app):
+    host = socket.gethostname()
+    zadanie('zywe', f'{host}:{os.getpid()}')
+    zadanie('martwe', f'{host}:{martwy_pid()}', status='oczekuje')
+    zadanie('inny_host', 'inny-host:1')
+    zadanie('stare', 'inny-host:1', wiek_s=7200)
+    zadanie('bez_wlasciciela', None)
+    zadanie('zakonczone', f'{host}:{martwy_pid()}', status='zakonczone')
+    db.session.commit()
+
+    kolejka = KolejkaOptymalizacji()
+    assert kolejka.odzyskaj_porzucone() == 2
+    db.session.commit()
+
+    statusy = dict(db.session.query(ZadanieOptymalizacji.id, ZadanieOptymalizacji.status))
+    assert statusy == {'zywe': 'trwa', 'martwe': 'blad', 'inny_host': 'trwa', 'stare': 'blad',
+                       'bez_wlasciciela': 'trwa', 'zakonczone': 'zakonczone'}
+    assert kolejka.aktywne_zadanie(1).id in ('zywe', 'inny_host', 'bez_wlasciciela')
+
+
+def test_odzyskuje_tylko_wskazane_zlecenie(app):
+    zadanie('stare', None, wiek_s=7200)
+    db.session.commit()
+
+    kolejka = KolejkaOptymalizacji()
+    assert kolejka.odzyskaj_porzucone(id_zlecenia=2) == 0
+    assert kolejka.odzyskaj_porzucone(id_zlecenia=1) == 1
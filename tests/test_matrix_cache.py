@@ -0,0 +1,78 @@
+import numpy as np
+
+import matrix_cache
+from matrix_cache import MacierzCache, klucz_punktu, kody_kluczy
+
+
+def klucze(n, ziarno=0):
+    rng = np.random.default_rng(ziarno)
+    return list(dict.fromkeys(klucz_punktu(lon, lat) for lon, lat in
+                              zip(rng.uniform(14, 24, n), rng.uniform(49, 55, n))))
+
+
+def test_kody_kluczy_jednoznaczne_dla_ujemnych_wspolrzednych():
+    punkty = [(-18_000_000, -9_000_000), (-18_000_000, 9_000_000), (18_000_000, -9_000_000), (0, 0), (0, -1)]
+    assert len(set(kody_kluczy(punkty).tolist())) == len(punkty)
+
+
+def test_odczyt_zgodny_z_zapisanymi_parami():
+    cache = MacierzCache()
+    punkty = klucze(60)
+    rng = np.random.default_rng(1)
+    zapisane = {}
+    pary = []
+    for a in punkty:
+        for b in punkty:
+            if a != b and rng.random() < 0.5:
+                czas, dystans = rng.random() * 100, rng.random() * 1000
+                zapisane[(a, b)] = (czas, dystans)
+                pary.append(((a, b), czas, dystans))
+    cache.zapisz('osrm', pary)
+
+    czasy, dystanse, trafienia = cache.pobierz('osrm', punkty)
+    assert trafienia == len(zapisane)
+    for i, a in enumerate(punkty):
+        for j, b in enumerate(punkty):
+            if i == j:
+                assert czasy[i, j] == 0
+            elif (a, b) in zapisane:
+                assert (czasy[i, j], dystanse[i, j]) == zapisane[(a, b)]
+            else:
+                assert np.isnan(czasy[i, j]) and np.isnan(dystanse[i, j])
+
+
+def test_zrodla_sa_rozdzielone_a_nowy_wpis_nadpisuje_stary():
+    cache = MacierzCache()
+    a, b = klucz_punktu(19.9, 50.0), klucz_punktu(19.95, 50.05)
+    cache.zapisz('osrm', [((a, b), 10.0, 100.0)])
+    cache.zapisz('osrm', [((a, b), 12.0, 120.0)])
+
+    assert cache.pobierz('osrm_lokalny', [a, b])[2] == 0
+    czasy, dystanse, trafienia = cache.pobierz('osrm', [a, b])
+    assert (trafienia, czasy[0, 1], dystanse[0, 1]) == (1, 12.0, 120.0)
+    assert cache.statystyki()['rozmiar_lru'] == 1
+
+
+def test_przeterminowane_pary_to_chybienia(monkeypatch):
+    cache = MacierzCache()
+    cache.ttl = 60
+    a, b = klucz_punktu(19.9, 50.0), klucz_punktu(19.95, 50.05)
+    cache.zapisz('osrm', [((a, b), 10.0, 100.0)])
+
+    teraz = matrix_cache.time.time()
+    monkeypatch.setattr(matrix_cache.time, 'time', lambda: teraz + 61)
+    assert cache.pobierz('osrm', [a, b])[2] == 0
+
+
+def test_lru_usuwa_najdawniej_uzywane_wiersze():
+    cache = MacierzCache()
+    cache.max_rozmiar = 6
+    punkty = klucze(5)
+    for a in punkty[:3]:
+        cache.zapisz('osrm', [((a, b), 1.0, 1.0) for b in punkty[3:]])
+    cache.pobierz('osrm', [punkty[0], punkty[3]])  # wiersz punktu 0 staje się najświeższy
+    cache.zapisz('osrm', [((punkty[3], punkty[4]), 1.0, 1.0)])
+
+    assert cache.statystyki()['rozmiar_lru'] == 5
+    assert cache.pobierz('osrm', [punkty[0], punkty[3]])[2] == 1
+    assert cache.pobierz('osrm', [punkty[1], punkty[3]])[2] == 0
@@ -0,0 +1,27 @@
+import time
+
+import numpy as np
+
+from solver import parametry_wyszukiwania, rozwiaz_model
+
+
+def instancja(n=150, pojazdy=8):
+    rng = np.random.default_rng(1)
+    xy = rng.random((n, 2)) * 60
+    czasy = np.rint(np.hypot(*(xy[:, None] - xy[None]).transpose(2, 0, 1))).astype(np.int64)
+    okna = np.array([[0, 24 * 60]] * n)
+    popyt = np.ones(n, dtype=np.int64)
+    popyt[0] = 0
+    return czasy, popyt, okna, np.full(pojazdy, 40)
+
+
+def test_plateau_konczy_wyszukiwanie_przed_limitem_czasu():
+    czasy, popyt, okna, pojemnosci = instancja()
+    parametry, _ = parametry_wyszukiwania('balanced', len(czasy))
+    limit_s = parametry.time_limit.seconds + parametry.time_limit.nanos / 1e9
+
+    start = time.perf_counter()
+    wynik = rozwiaz_model(czasy, popyt, okna, pojemnosci, 'balanced', plateau_s=0.2)
+
+    assert wynik['trasy'] is not None
+    assert time.perf_counter() - start < limit_s / 2